@@ -0,0 +1,315 @@
+import asyncio
+import ssl
+from parser import Parser
+from typing import Awaitable, Callable, Dict, Iterable, List
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from compact_records import CompactRecords
+from logs.set_logger import logger
+from metrics import registry
+from parser_config import AJAX_URL, ENTRYPOINT_URL, MAX_IN_FLIGHT, MAX_REQUESTS_PER_HOST
+from parser_session import ParserSession
+from protocol_constants import set_ticket_payload
+
+
+def get_ssl_context() -> ssl.SSLContext:
+    """
+    Creates an SSL context with the cipher list used by the requests engine.
+
+    Returns:
+        ssl.SSLContext: The SSL context for the portal connections.
+    """
+    context = ssl.create_default_context()
+    context.set_ciphers("DEFAULT:HIGH:!DH:!aNULL")
+    return context
+
+
+async def gather_bounded(
+    func: Callable[[object], Awaitable], items: Iterable, limit: int
+) -> list:
+    """
+    Awaits func for every item, with at most limit calls running at once.
+
+    Unlike asyncio.gather over all items, only limit coroutines exist at any
+    time, however many items there are.
+
+    Args:
+        func (Callable[[object], Awaitable]): The coroutine function.
+        items (Iterable): The arguments of func.
+        limit (int): The maximum number of concurrent calls.
+
+    Returns:
+        list: The results, in the order of items.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    indices = iter(range(len(items)))
+
+    async def work() -> None:
+        # the iterator is shared, each index is taken by exactly one worker
+        for index in indices:
+            results[index] = await func(items[index])
+
+    await asyncio.gather(*(work() for _ in range(min(max(1, limit), len(items)))))
+    return results
+
+
+class AsyncParserSession:
+    def __init__(self, max_connections: int = MAX_IN_FLIGHT) -> None:
+        """
+        Initializes an asyncio counterpart of ParserSession.
+
+        The underlying aiohttp session is created when the object is entered
+        as an async context manager, so that it is bound to the running loop.
+
+        Args:
+            max_connections (int): The size of the keep-alive connection pool.
+        """
+        self._max_connections = max_connections
+        self._session = None
+        self._cookies = ""
+
+    async def __aenter__(self) -> "AsyncParserSession":
+        connector = aiohttp.TCPConnector(
+            limit=self._max_connections,
+            limit_per_host=self._max_connections,
+            keepalive_timeout=30,
+            ssl=get_ssl_context(),
+        )
+        self._session = aiohttp.ClientSession(connector=connector)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._session.close()
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        return self._session
+
+    @property
+    def cookies(self) -> str:
+        return self._cookies
+
+    async def get_payload(self) -> dict:
+        """
+        Gets the payload parameters.
+
+        Returns:
+            dict: A dictionary that contains the payload parameters.
+        """
+        with registry.stage("bootstrap"):
+            async with self.session.get(ENTRYPOINT_URL) as r:
+                response_text = await r.text()
+                self._cookies = ParserSession.format_cookies(
+                    r.cookies["ORA_WWV_APP_10901"].value
+                )
+            logger.debug("Cookies were initialized")
+
+            url_map = ParserSession.retrieve_url_map(response_text)
+            async with self.session.get(url_map) as r:
+                payload_params = ParserSession.extract_payload_params(await r.text())
+        logger.debug("AsyncParserSession payload params were received")
+        return payload_params
+
+
+class AsyncParser(Parser):
+    def __init__(
+        self,
+        session,
+        cookies,
+        p_instance,
+        p_request,
+        protected,
+        salt,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        max_requests_per_host: int = MAX_REQUESTS_PER_HOST,
+        extractor=None,
+    ) -> None:
+        """
+        Initializes an asyncio counterpart of Parser.
+
+        HTML and listing parsing are inherited from Parser; the network
+        methods are coroutines with an _async suffix, so that the inherited
+        synchronous methods keep their meaning. A semaphore caps the number
+        of requests in flight across all periods and subjects, and a
+        per-host one the requests to a single host, as in Parser.
+
+        Args:
+            session (aiohttp.ClientSession): An open aiohttp session.
+            cookies (str): The Cookie header value.
+            p_instance (str): The p_instance parameter used in the POST request payload.
+            p_request (str): The p_request parameter used in the POST request payload.
+            protected (str): The protected parameter used in the POST request payload.
+            salt (str): The salt parameter used in the POST request payload.
+            max_in_flight (int): The maximum number of concurrent requests.
+            max_requests_per_host (int): The maximum number of in-flight
+                requests to a single host.
+            extractor: The ticket page extractor (see ticket_extractors.py).
+        """
+        super().__init__(
+            session,
+            cookies,
+            p_instance,
+            p_request,
+            protected,
+            salt,
+            max_requests_per_host=max_requests_per_host,
+            extractor=extractor,
+        )
+        self.max_in_flight = max(1, max_in_flight)
+        self.semaphore = asyncio.Semaphore(self.max_in_flight)
+        self._async_host_limits: Dict[str, asyncio.Semaphore] = {}
+
+    def _async_host_limit(self, url: str) -> asyncio.Semaphore:
+        """
+        Returns the asyncio semaphore that caps in-flight requests to the host
+        of a URL.
+
+        Args:
+            url (str): The URL that is about to be requested.
+
+        Returns:
+            asyncio.Semaphore: The semaphore shared by all requests to the
+            same host.
+        """
+        host = urlsplit(url).netloc
+        if host not in self._async_host_limits:
+            self._async_host_limits[host] = asyncio.Semaphore(
+                self.max_requests_per_host
+            )
+        return self._async_host_limits[host]
+
+    async def fetch_ticket_info_async(self, ticket: dict) -> dict:
+        """
+        Fetches the HTML of a ticket page and extracts relevant data.
+
+        Args:
+            ticket (dict): A dictionary containing the link to a ticket page.
+
+        Returns:
+            dict: A dictionary containing the extracted data
+        """
+        url = ticket["request_link"]
+        async with self.semaphore, self._async_host_limit(url):
+            with registry.stage("detail"):
+                async with self.session.get(url, headers=self.apls_headers) as r:
+                    body = await r.read()
+                    html_doc = await r.text()
+        registry.add_bytes("detail", len(body))
+        # the extraction is CPU-bound and would stall every request in flight
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.parse_ticket_html, html_doc)
+
+    async def get_amended_tickets_async(
+        self, tickets: List[dict], category: dict
+    ) -> CompactRecords:
+        """
+        Amend tickets with ticket data and category.
+
+        Args:
+            tickets (List[dict]): A list of tickets to be amended with APL ticket.
+            category (dict): A dictionary containing the category of each ticket.
+
+        Returns:
+            CompactRecords: The amended tickets.
+
+        """
+        apls = await gather_bounded(
+            self.fetch_ticket_info_async, tickets, self.max_in_flight
+        )
+
+        return CompactRecords(
+            self.amend_ticket(ticket, apl, category)
+            for ticket, apl in zip(tickets, apls)
+        )
+
+    async def fetch_ticket_data_async(self, payload: dict) -> dict:
+        """
+        Fetch ticket data using the given payload.
+
+        Args:
+            payload (dict): A dictionary containing request data.
+
+        Returns:
+            dict: The decoded AJAX response.
+
+        Raises:
+            SessionExpiredError: If the session has expired.
+
+        """
+        async with self.semaphore, self._async_host_limit(AJAX_URL):
+            with registry.stage("listing"):
+                async with self.session.post(
+                    AJAX_URL, data=payload, headers=self.ticket_headers
+                ) as r:
+                    body = await r.read()
+                    ticket_data = await r.json(content_type=None)
+        registry.add_bytes("listing", len(body))
+        return self.check_ticket_data(ticket_data)
+
+    async def fetch_subject_tickets_async(
+        self, period: str, subject: str
+    ) -> List[dict]:
+        """
+        Fetch and parse the ticket listing of one subject.
+
+        Args:
+            period (str): A string representing the period for which to fetch tickets.
+            subject (str): The subject for which to fetch tickets.
+
+        Returns:
+            List[dict]: A list of ticket dictionaries, not yet amended.
+
+        """
+        payload = set_ticket_payload(
+            protected=self.protected,
+            salt=self.salt,
+            p_instance=self.p_instance,
+            p_request=self.p_request,
+            period=period,
+            subject=subject,
+        )
+        ticket_data = await self.fetch_ticket_data_async(payload)
+        return self.parse_tickets(ticket_data)
+
+    async def fetch_period_tickets_async(
+        self, period: str, subjects: dict
+    ) -> List[CompactRecords]:
+        """
+        Fetch tickets for the given period and subjects concurrently.
+
+        Args:
+            period (str): A string representing the period for which to fetch tickets.
+            subjects (dict): dict containing the subjects for which to fetch tickets.
+
+        Returns:
+            List[dict]: A list of ticket dictionaries, in the order of subjects.
+
+        """
+
+        async def fetch_subject(subject: str) -> CompactRecords:
+            ticket_content = await self.fetch_subject_tickets_async(period, subject)
+            category = {"category": subjects[subject]}
+            return await self.get_amended_tickets_async(ticket_content, category)
+
+        return list(
+            await asyncio.gather(*(fetch_subject(subject) for subject in subjects))
+        )
+
+    async def parse_async(
+        self, periods: list, subjects: dict, output_format: str = "json"
+    ) -> None:
+        """
+        Parse ticket data for the given periods and subjects.
+
+        Args:
+            periods (list): representing the periods for which to parse data.
+            subjects (dict): dict containing the subjects for which to parse data.
+            output_format (str): "json" or a streaming format, as in Parser.parse.
+
+        """
+        for period in periods:
+            data = await self.fetch_period_tickets_async(period, subjects)
+            self.dump_to_file(data=data, period=period, output_format=output_format)
@@ -0,0 +1,149 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime
+from itertools import chain
+from parser import Parser
+from typing import Dict, List, Tuple
+
+from tqdm import tqdm
+
+from compact_records import CompactRecords
+from logs.set_logger import logger
+from parser_config import (
+    BACKFILL_CHUNK_SIZE,
+    BACKFILL_MONTHS_IN_FLIGHT,
+    BACKFILL_RETRIES,
+    MAX_WORKERS,
+)
+from parser_session import ParserSession
+
+
+def parse_month(value: str) -> datetime:
+    """
+    Parses a "YYYY-MM" command line argument.
+    """
+    return datetime.strptime(value, "%Y-%m")
+
+
+def amend_chunk(parser: Parser, tickets: List[dict], category: dict) -> CompactRecords:
+    # amend_ticket drops the link of its ticket, which a retry still needs
+    return CompactRecords(
+        parser.amend_ticket(dict(ticket), parser.fetch_ticket_info(ticket), category)
+        for ticket in tickets
+    )
+
+
+def run_backfill(
+    parser: Parser,
+    periods: List[str],
+    subjects: dict,
+    workers: int = MAX_WORKERS,
+    chunk_size: int = BACKFILL_CHUNK_SIZE,
+    output_format: str = "json",
+    months_in_flight: int = BACKFILL_MONTHS_IN_FLIGHT,
+    retries: int = BACKFILL_RETRIES,
+) -> None:
+    """
+    Scrape many periods at once on a shared budget of workers.
+
+    At most months_in_flight periods are scraped at a time, in order. The
+    listings of a period are queued first and every listing is cut into
+    chunks of tickets as soon as it arrives, so the workers stay busy while
+    the next period is listed. A month file is written as soon as the last
+    chunk of its period is done, and its records are released.
+
+    A failed listing or chunk is queued again up to retries times; after
+    that its period is given up, without a month file, and the other periods
+    go on.
+
+    Args:
+        parser (Parser): The parser used for the network requests.
+        periods (List[str]): The periods to scrape.
+        subjects (dict): dict containing the subjects to scrape.
+        workers (int): Number of threads shared by all periods.
+        chunk_size (int): Number of tickets fetched by one task.
+        output_format (str): "json" or a streaming format, as in Parser.parse.
+        months_in_flight (int): Number of periods scraped at once.
+        retries (int): Retries of a failed listing or chunk.
+
+    Raises:
+        RuntimeError: If periods were given up.
+    """
+    queued = deque(periods)
+    # the chunks of every period in flight, by subject, and its tasks left
+    results: Dict[str, Dict[str, List[Tuple[int, CompactRecords]]]] = {}
+    remaining: Dict[str, int] = {}
+    failed = []
+    # a task is (period, subject, start, tickets); a listing has no tickets
+    futures: Dict[Future, Tuple[tuple, int]] = {}
+    progress = tqdm(total=0)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+
+        def submit(task: tuple, attempt: int = 0) -> None:
+            period, subject, start, tickets = task
+            if tickets is None:
+                future = executor.submit(parser.fetch_subject_tickets, period, subject)
+            else:
+                category = {"category": subjects[subject]}
+                future = executor.submit(amend_chunk, parser, tickets, category)
+            futures[future] = (task, attempt)
+
+        def write_period(period: str) -> None:
+            remaining.pop(period)
+            data = [
+                chain.from_iterable(chunk for _, chunk in sorted(chunks))
+                for chunks in results.pop(period).values()
+            ]
+            parser.dump_to_file(data=data, period=period, output_format=output_format)
+            filename = ParserSession.generate_filename(period=period)
+            logger.info(f"Finished {filename}")
+
+        def start_period(period: str) -> None:
+            results[period] = {subject: [] for subject in subjects}
+            remaining[period] = len(subjects)
+            for subject in subjects:
+                submit((period, subject, 0, None))
+            if not subjects:
+                write_period(period)
+
+        while queued or futures:
+            while queued and len(results) < max(1, months_in_flight):
+                start_period(queued.popleft())
+            if not futures:
+                continue
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                task, attempt = futures.pop(future)
+                period, subject, start, tickets = task
+                if period not in results:
+                    # the period was given up
+                    continue
+                try:
+                    result = future.result()
+                except Exception as exc:
+                    if attempt < retries:
+                        logger.warning(f"{period}, subject {subject}: {exc!r}, retry")
+                        submit(task, attempt + 1)
+                        continue
+                    logger.error(f"{period}, subject {subject}: giving up: {exc!r}")
+                    results.pop(period)
+                    remaining.pop(period)
+                    failed.append(period)
+                    continue
+                remaining[period] -= 1
+                if tickets is None:
+                    for chunk_start in range(0, len(result), chunk_size):
+                        chunk = result[chunk_start : chunk_start + chunk_size]
+                        submit((period, subject, chunk_start, chunk))
+                        remaining[period] += 1
+                        progress.total += 1
+                    progress.refresh()
+                else:
+                    results[period][subject].append((start, result))
+                    progress.update()
+                if remaining[period] == 0:
+                    write_period(period)
+    progress.close()
+    if failed:
+        raise RuntimeError(f"{len(failed)} periods were not written: {failed}")
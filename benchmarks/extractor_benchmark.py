@@ -0,0 +1,87 @@
+"""
+Compares the ticket page extractors on a corpus of saved ticket pages.
+
+Every backend must produce the same dicts as the reference SoupExtractor;
+the pages per second of each backend, and its speedup over the reference,
+are reported afterwards. lxml is the fast backend, html.parser the one
+that needs no compiled dependency.
+
+    python -m benchmarks.extractor_benchmark path/to/pages --repeat 5
+
+Without a directory, the fixture pages of the tests are used.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from ticket_extractors import LxmlExtractor, SoupExtractor, get_extractors
+
+FIXTURE_PAGES = (
+    Path(__file__).resolve().parent.parent.joinpath("tests", "fixtures", "ticket_pages")
+)
+
+
+def load_corpus(corpus_dir: Path) -> List[str]:
+    return [
+        # read as bytes so that \r\n line breaks are not translated
+        path.read_bytes().decode("utf8")
+        for path in sorted(corpus_dir.glob("*.html"))
+    ]
+
+
+def check_parity(pages: List[str], extractors: Dict[str, object]) -> List[str]:
+    """
+    Returns the names of the extractors that disagree with the reference.
+    """
+    reference = [SoupExtractor().extract(page) for page in pages]
+    mismatches = []
+    for name, extractor in extractors.items():
+        if [extractor.extract(page) for page in pages] != reference:
+            mismatches.append(name)
+    return mismatches
+
+
+def pages_per_second(extractor, pages: List[str], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for page in pages:
+            extractor.extract(page)
+    return len(pages) * repeat / (time.perf_counter() - start)
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument(
+        "corpus",
+        type=Path,
+        nargs="?",
+        default=FIXTURE_PAGES,
+        help="directory of *.html pages",
+    )
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    pages = load_corpus(args.corpus)
+    if not pages:
+        sys.exit(f"No *.html pages found in {args.corpus}")
+    extractors = {name: cls() for name, cls in get_extractors().items()}
+
+    mismatches = check_parity(pages, extractors)
+    if mismatches:
+        sys.exit(f"Extractors differ from the reference: {', '.join(mismatches)}")
+
+    rates = {
+        name: pages_per_second(extractor, pages, args.repeat)
+        for name, extractor in extractors.items()
+    }
+    for name, rate in rates.items():
+        speedup = rate / rates[SoupExtractor.name]
+        print(f"{name:>10}: {rate:10.1f} pages/s {speedup:6.1f}x the reference")
+    if LxmlExtractor.name not in rates:
+        print("lxml, the fast backend, is not installed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Compares listing parsers on a recorded FOIDATA response.
+
+The reference is the original implementation: five separate re.search calls
+on string patterns and one dict per row. Both the dict-per-row and the
+columnar parse_tickets must produce the same tickets.
+
+    python -m benchmarks.listing_benchmark path/to/foidata.json --repeat 5
+    python -m benchmarks.listing_benchmark --synthetic 50000
+"""
+import argparse
+import json
+import re
+import sys
+import time
+from parser import TICKET_COLUMNS, Parser
+from typing import Callable, List
+
+from parser_config import (
+    DISTRICT_PATTERN,
+    HOST_URL,
+    LINK_PATTERN,
+    MALFUNCTION_TYPE_PATTERN,
+    PERFORMER_PATTERN,
+    TICKET_NUMBER_PATTERN,
+)
+
+
+def reference_parse_tickets(raw_tickets: dict) -> List[dict]:
+    tickets = []
+    for raw_ticket in raw_tickets["row"]:
+        infotext = raw_ticket["INFOTEXT"]
+        number = re.search(TICKET_NUMBER_PATTERN, infotext)
+        district = re.search(DISTRICT_PATTERN, infotext)
+        malfunction_type = re.search(MALFUNCTION_TYPE_PATTERN, infotext)
+        performer = re.search(PERFORMER_PATTERN, infotext)
+        link = re.search(LINK_PATTERN, infotext)
+        ticket = {
+            "number": number.group(1) if number else None,
+            "district": district.group(1) if district else None,
+            "malfunction_type": malfunction_type.group(1) if malfunction_type else None,
+            "performer": performer.group(1) if performer else "",
+            "request_link": HOST_URL + link.group(1) if link else None,
+        }
+        ticket.update(raw_ticket["GEOMETRY"]["sdo_point"])
+        tickets.append(ticket)
+    return tickets
+
+
+def synthetic_response(rows: int) -> dict:
+    return {
+        "row": [
+            {
+                "INFOTEXT": (
+                    f"<b>Заявка № {i}.10.061022<br><b>Адрес: </b>Минск, улица "
+                    f"Кедышко, {i % 200}<br><b>Вид неисправности: </b>Не вывезен "
+                    f"мусор<br><b> Исполнитель: </b>ЖЭС №{i % 40}<br>"
+                    f'<a href="f?p=10901:35::::35:P35_ID:{i}">Подробнее</a>'
+                ),
+                # spread over the listing extent of the portal map
+                "GEOMETRY": {
+                    "sdo_point": {
+                        "x": f"{3103500 + i * 7919 % 46750}.33",
+                        "y": f"{7141400 + i * 104729 % 68750}.94",
+                        "z": "null",
+                    }
+                },
+            }
+            for i in range(rows)
+        ]
+    }
+
+
+def rows_per_second(parse: Callable, raw_tickets: dict, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parse(raw_tickets)
+    return len(raw_tickets["row"]) * repeat / (time.perf_counter() - start)
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("response", nargs="?", help="recorded FOIDATA JSON")
+    arg_parser.add_argument("--synthetic", type=int, default=50000)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    if args.response:
+        with open(args.response, encoding="utf8") as f:
+            raw_tickets = json.load(f)
+    else:
+        raw_tickets = synthetic_response(args.synthetic)
+    parser = Parser(None, "", "", "", "", "")
+
+    reference = reference_parse_tickets(raw_tickets)
+    columns = parser.parse_tickets_columnar(raw_tickets)
+    if parser.parse_tickets(raw_tickets) != reference or columns != {
+        field: [ticket.get(field) for ticket in reference] for field in TICKET_COLUMNS
+    }:
+        sys.exit("parse_tickets differs from the reference implementation")
+
+    parsers = {
+        "reference": reference_parse_tickets,
+        "dict rows": parser.parse_tickets,
+        "columnar": parser.parse_tickets_columnar,
+    }
+    baseline = None
+    for name, parse in parsers.items():
+        rate = rows_per_second(parse, raw_tickets, args.repeat)
+        baseline = baseline or rate
+        print(f"{name:>10}: {rate:12.0f} rows/s  x{rate / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Peak RSS of a month held as dicts and as CompactRecords.
+
+A synthetic month of amended tickets is built the way Parser does it: the
+listing tickets come from parse_tickets on a synthetic FOIDATA response and
+the ticket page fields are freshly decoded strings, so that nothing is
+shared by accident. Each representation is measured in a fresh Python
+process, which then writes the month file with the "json" output; both
+files must be identical.
+
+    python -m benchmarks.memory_benchmark --tickets 100000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SUBJECTS = {"1": "Водоснабжение", "2": "Санитарное состояние", "3": "Освещение"}
+STATUSES = ["Заявка закрыта", "Заявка в работе", "Заявка принята"]
+STATUS_DATES = ["Выполнено {}.10.2022", "Просрочено {}.10.2022", "до {}.10.2022"]
+LISTING_BATCH = 1000
+PERIOD = "Суббота, 01 Октябрь, 2022"
+
+
+def ticket_page(i: int) -> str:
+    """
+    Returns the fields of a ticket page as the JSON text they are decoded
+    from, so that every record gets its own string objects.
+    """
+    return json.dumps(
+        {
+            "status": STATUSES[i % len(STATUSES)],
+            "status_date": STATUS_DATES[i % len(STATUS_DATES)].format(10 + i % 20),
+            "user_comment": f"Не вывезен мусор во дворе дома {i}, просьба принять меры",
+            "organization_comment": f"Мусор вывезен {i % 28 + 1}.10.2022",
+            "request_regdate": f"06.10.2022 {i % 24:02}:{i % 60:02}",
+            "request_moddate": f"07.10.2022 {i % 24:02}:{i % 60:02}",
+            "rating": str(i % 6) if i % 3 else None,
+            "address": f"Минск, улица Кедышко, {i % 200}",
+        },
+        ensure_ascii=False,
+    )
+
+
+def build_month(args: argparse.Namespace) -> None:
+    """
+    Builds the month in this process and prints its measurements.
+    """
+    import hashlib
+    import resource
+    import time
+    from parser import Parser, ParserSession
+
+    from benchmarks.listing_benchmark import synthetic_response
+    from compact_records import CompactRecords
+
+    parser = Parser(None, "", "", "", "", "")
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    data = []
+    for index, name in enumerate(SUBJECTS.values()):
+        per_subject = args.tickets // len(SUBJECTS)
+        per_subject += index < args.tickets % len(SUBJECTS)
+        records = CompactRecords() if args.representation == "compact" else []
+        category = {"category": name}
+        for offset in range(0, per_subject, LISTING_BATCH):
+            size = min(LISTING_BATCH, per_subject - offset)
+            tickets = parser.parse_tickets(synthetic_response(size))
+            for i, ticket in enumerate(tickets, offset):
+                apl = json.loads(ticket_page(i))
+                records.append(parser.amend_ticket(ticket, apl, category))
+        data.append(records)
+    build_seconds = time.perf_counter() - start
+    held = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    path = Path("data", ParserSession.generate_filename(period=PERIOD))
+    if args.representation == "compact":
+        parser.dump_to_file(data=data, period=PERIOD)
+    else:
+        # the month file as it was written before CompactRecords
+        with open(path, "w+", encoding="utf8") as f:
+            json.dump(data, f, ensure_ascii=False)
+    write_seconds = time.perf_counter() - start
+    print(
+        json.dumps(
+            {
+                "records": sum(map(len, data)),
+                # kilobytes on Linux
+                "held_mb": (held - baseline) / 1024,
+                "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                / 1024,
+                "build_seconds": build_seconds,
+                "write_seconds": write_seconds,
+                "sha256": hashlib.sha256(path.read_bytes()).hexdigest(),
+            }
+        )
+    )
+
+
+def measure(args: argparse.Namespace, representation: str) -> dict:
+    """
+    Builds the month in a child process.
+
+    Returns:
+        dict: The results printed by build_month.
+    """
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(
+            filter(None, [str(REPO_ROOT), os.getenv("PYTHONPATH")])
+        ),
+    )
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.memory_benchmark",
+        "--build",
+        f"--tickets={args.tickets}",
+        f"--representation={representation}",
+    ]
+    # the parser writes ./data relative to its working directory
+    with tempfile.TemporaryDirectory() as workdir:
+        Path(workdir, "data").mkdir()
+        result = subprocess.run(
+            command,
+            cwd=workdir,
+            env=env,
+            stdout=subprocess.PIPE,
+            text=True,
+            check=True,
+        )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--tickets", type=int, default=100000)
+    arg_parser.add_argument(
+        "--representation", choices=["dicts", "compact"], default="compact"
+    )
+    arg_parser.add_argument("--build", action="store_true", help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.build:
+        build_month(args)
+        return
+
+    results = {name: measure(args, name) for name in ("dicts", "compact")}
+    if len({result["sha256"] for result in results.values()}) != 1:
+        sys.exit("the month files differ")
+
+    print(f"{results['dicts']['records']} records, identical month files")
+    print(f"{'':>8} {'held MB':>8} {'peak MB':>8} {'build s':>8} {'write s':>8}")
+    for name, result in results.items():
+        print(
+            f"{name:>8} {result['held_mb']:>8.1f} {result['peak_rss_mb']:>8.1f} "
+            f"{result['build_seconds']:>8.2f} {result['write_seconds']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
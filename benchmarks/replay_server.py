@@ -0,0 +1,266 @@
+"""
+Local stand-in for the 115.бел portal, for benchmarks that must not hit it.
+
+Serves the four kinds of pages the scraper requests: the entrypoint (which
+sets the session cookie), the map page read by retrieve_payload_params, the
+wwv_flow.ajax FOIDATA listing and the ticket pages. Listings and pages come
+from recorded fixtures when given, and are synthesized otherwise. Like the
+portal, a listing only returns the tickets inside the requested map extent.
+Every response can be delayed, and a share of them replaced by 503 errors
+or, for listings, by the expired session response.
+
+    python -m benchmarks.replay_server --port 8115 --tickets 1000 --latency 0.05
+    PORTAL_URL=http://127.0.0.1:8115/ python main.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import List, Optional
+from urllib.parse import parse_qs
+
+from benchmarks.listing_benchmark import synthetic_response
+from parser_config import LISTING_EXTENT
+from protocol_constants import get_payload_extent
+
+APP_COOKIE = "replay-session"
+MAP_PAGE_ID = "f?p=10901:2:replay"
+TICKET_PAGE_ID = "f?p=10901:35::::35:P35_ID:"
+
+ENTRYPOINT_HTML = f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"></head><body>
+<div class="t-NavigationBar-menu"><ul>
+<li><a href="{MAP_PAGE_ID}">Карта</a></li>
+</ul></div>
+</body></html>"""
+
+MAP_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8">
+<script type="text/javascript">var a;</script>
+<script type="text/javascript">var b;</script>
+<script type="text/javascript">var c;</script>
+<script type="text/javascript">{createPluginMap("map","replay-plugin","");}</script>
+</head><body>
+<input type="hidden" id="pPageItemsProtected" value="replay-protected">
+<input type="hidden" id="pInstance" value="1">
+<input type="hidden" id="pSalt" value="replay-salt">
+</body></html>"""
+
+TICKET_HTML = """<!DOCTYPE html>
+<html lang="ru"><head><meta charset="utf-8"><title>Заявка</title></head>
+<body class="t-PageBody">
+<div class="t-Region"><div class="t-Region-header">Заявка № {id}.10.061022</div>
+<div class="t-Region-body">
+  <div class="current_problem_status"><span>Заявка закрыта</span></div>
+  <div class="user_comment"><b>Комментарий:</b> Не вывезен мусор {id}</div>
+  <div class="org_comment"><b>Ответ:</b> Выполнена уборка.</div>
+  <div class="current_problem_status_date">Выполнено 07.10.2022</div>
+  <div class="current_problem_regdate"><b>Дата регистрации:</b> 06.10.2022 07:07</div>
+  <div class="current_problem_moddate"><b>Дата изменения:</b> 07.10.2022 13:25</div>
+  <span class="current_problem_address">Минск, улица Кедышко, {id}</span>
+  <input type="hidden" id="P35_RATING" value="5">
+</div></div>
+</body></html>"""
+
+EXPIRED_RESPONSE = {"error": "Your session has expired"}
+
+
+class ReplayServer:
+    def __init__(
+        self,
+        tickets: int = 100,
+        listing: Optional[Path] = None,
+        pages: Optional[Path] = None,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        expire_rate: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        """
+        Initializes the server; start() runs it in a background thread.
+
+        Args:
+            tickets (int): Rows of each synthesized listing.
+            listing (Optional[Path]): A recorded FOIDATA response returned
+                for every period and subject instead of a synthesized one.
+            pages (Optional[Path]): A directory of recorded ticket pages
+                (*.html), served in turn instead of synthesized ones.
+            latency (float): Delay of every response, in seconds.
+            jitter (float): Upper bound of a uniform random delay added to
+                latency, in seconds.
+            error_rate (float): Share of responses replaced by a 503 error.
+            expire_rate (float): Share of listings replaced by the expired
+                session response.
+            host (str): The interface to listen on.
+            port (int): The port to listen on, 0 for any free port.
+        """
+        if listing is not None:
+            self.listing = Path(listing).read_bytes()
+        else:
+            self.listing = json.dumps(synthetic_response(tickets)).encode("utf8")
+        self.rows = json.loads(self.listing)["row"]
+        self.pages: List[bytes] = (
+            [path.read_bytes() for path in sorted(Path(pages).glob("*.html"))]
+            if pages is not None
+            else []
+        )
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.expire_rate = expire_rate
+        self.httpd = ThreadingHTTPServer((host, port), self.make_handler())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def listing_in(self, form: dict) -> bytes:
+        """
+        Returns the listing restricted to the extent of a FOIDATA request.
+        """
+        payload = {key: values[0] for key, values in form.items()}
+        extent = get_payload_extent(payload) if "x02" in payload else LISTING_EXTENT
+        if extent == LISTING_EXTENT:
+            return self.listing
+        min_x, min_y, max_x, max_y = extent
+        rows = []
+        for row in self.rows:
+            point = row["GEOMETRY"]["sdo_point"]
+            try:
+                x, y = float(point["x"]), float(point["y"])
+            except (TypeError, ValueError):
+                continue
+            if min_x <= x <= max_x and min_y <= y <= max_y:
+                rows.append(row)
+        return json.dumps({"row": rows}).encode("utf8")
+
+    def ticket_page(self, ticket_id: str) -> bytes:
+        if self.pages:
+            index = int(ticket_id) if ticket_id.isdigit() else hash(ticket_id)
+            return self.pages[index % len(self.pages)]
+        return TICKET_HTML.format(id=ticket_id).encode("utf8")
+
+    def make_handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+            def reply(
+                self,
+                body: bytes,
+                content_type: str,
+                status: int = 200,
+                cookie: Optional[str] = None,
+            ) -> None:
+                delay = server.latency + random.uniform(0, server.jitter)
+                if delay:
+                    time.sleep(delay)
+                if random.random() < server.error_rate:
+                    status, body = 503, b"Service Unavailable"
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                if cookie is not None:
+                    self.send_header("Set-Cookie", cookie)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self) -> None:
+                page = self.path.lstrip("/")
+                if page == "f?p=10901:":
+                    self.reply(
+                        ENTRYPOINT_HTML.encode("utf8"),
+                        "text/html",
+                        cookie=f"ORA_WWV_APP_10901={APP_COOKIE}; Path=/",
+                    )
+                elif page == MAP_PAGE_ID:
+                    self.reply(MAP_HTML.encode("utf8"), "text/html")
+                elif page.startswith(TICKET_PAGE_ID):
+                    ticket_id = page[len(TICKET_PAGE_ID) :]
+                    self.reply(server.ticket_page(ticket_id), "text/html")
+                else:
+                    self.reply(b"Not Found", "text/plain", status=404)
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length", 0))
+                form = parse_qs(self.rfile.read(length).decode("utf8"))
+                if self.path.lstrip("/") != "wwv_flow.ajax" or "p_json" not in form:
+                    self.reply(b"Not Found", "text/plain", status=404)
+                elif random.random() < server.expire_rate:
+                    body = json.dumps(EXPIRED_RESPONSE).encode("utf8")
+                    self.reply(body, "application/json")
+                else:
+                    self.reply(server.listing_in(form), "application/json")
+
+        return Handler
+
+    def start(self) -> str:
+        """
+        Starts serving in a daemon thread.
+
+        Returns:
+            str: The base URL, to be used as PORTAL_URL.
+        """
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "ReplayServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8115)
+    arg_parser.add_argument("--tickets", type=int, default=100)
+    arg_parser.add_argument("--listing", type=Path, help="recorded FOIDATA JSON")
+    arg_parser.add_argument("--pages", type=Path, help="directory of ticket pages")
+    arg_parser.add_argument("--latency", type=float, default=0.0)
+    arg_parser.add_argument("--jitter", type=float, default=0.0)
+    arg_parser.add_argument("--error-rate", type=float, default=0.0)
+    arg_parser.add_argument("--expire-rate", type=float, default=0.0)
+    args = arg_parser.parse_args()
+
+    server = ReplayServer(
+        tickets=args.tickets,
+        listing=args.listing,
+        pages=args.pages,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        expire_rate=args.expire_rate,
+        host=args.host,
+        port=args.port,
+    )
+    print(f"Serving on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+End-to-end throughput of Parser.parse against the local replay server.
+
+For every dataset size a replay server listing that many tickets is started
+and a month is scraped from it by a fresh Python process, so that the peak
+RSS of each run is measured on its own. Tickets per second, the p50/p99
+request latency and the peak RSS are reported. With --error-rate the server
+answers that share of requests with 503, and the scraper retries them
+through a RateController whose limit starts at, and never exceeds,
+--workers.
+
+    python -m benchmarks.throughput_benchmark --sizes 100 1000 10000 --latency 0.02
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import List
+
+from benchmarks.replay_server import ReplayServer
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SUBJECTS = {"1": "Водоснабжение"}
+
+
+def run_scrape(args: argparse.Namespace) -> None:
+    """
+    Scrapes one month from the server at PORTAL_URL and prints the results.
+    """
+    import resource
+    import time
+    from datetime import date
+    from parser import Parser, ParserSession
+
+    from rate_control import AdaptiveLimiter, RateController
+
+    config = ParserSession()
+    payload_params = config.get_payload()
+    latencies: List[float] = []
+    config.session.hooks["response"].append(
+        lambda r, *_, **__: latencies.append(r.elapsed.total_seconds())
+    )
+    controller = None
+    if args.error_rate > 0:
+        controller = RateController(
+            AdaptiveLimiter(initial=args.workers, maximum=args.workers)
+        )
+    parser = Parser(
+        session=config.session,
+        cookies=config.cookies,
+        max_workers=args.workers,
+        max_requests_per_host=args.workers,
+        controller=controller,
+        **payload_params,
+    )
+    period = ParserSession.generate_template_date(date.today())
+
+    start = time.perf_counter()
+    parser.parse(periods=[period], subjects=SUBJECTS, output_format=args.output)
+    elapsed = time.perf_counter() - start
+
+    percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else []
+    print(
+        json.dumps(
+            {
+                "tickets_per_second": args.size / elapsed,
+                "p50": percentiles[49] if percentiles else latencies[0],
+                "p99": percentiles[98] if percentiles else latencies[0],
+                # kilobytes on Linux
+                "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                / 1024,
+            }
+        )
+    )
+
+
+def measure(args: argparse.Namespace, size: int) -> dict:
+    """
+    Runs one scrape of size tickets in a child process.
+
+    Returns:
+        dict: The results printed by run_scrape.
+    """
+    server = ReplayServer(
+        tickets=size,
+        pages=args.pages,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+    )
+    env = dict(
+        os.environ,
+        PORTAL_URL=server.start(),
+        PYTHONPATH=os.pathsep.join(
+            filter(None, [str(REPO_ROOT), os.getenv("PYTHONPATH")])
+        ),
+    )
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.throughput_benchmark",
+        "--scrape",
+        f"--sizes={size}",
+        f"--workers={args.workers}",
+        f"--output={args.output}",
+        f"--error-rate={args.error_rate}",
+    ]
+    try:
+        # the scraper writes ./data relative to its working directory
+        with tempfile.TemporaryDirectory() as workdir:
+            Path(workdir, "data").mkdir()
+            result = subprocess.run(
+                command,
+                cwd=workdir,
+                env=env,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+    finally:
+        server.stop()
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        sys.exit(f"The scrape of {size} tickets exited with {result.returncode}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000])
+    arg_parser.add_argument("--workers", type=int, default=8)
+    arg_parser.add_argument("--output", choices=["json", "ndjson"], default="json")
+    arg_parser.add_argument("--pages", type=Path, help="directory of ticket pages")
+    arg_parser.add_argument("--latency", type=float, default=0.0)
+    arg_parser.add_argument("--jitter", type=float, default=0.0)
+    arg_parser.add_argument("--error-rate", type=float, default=0.0)
+    arg_parser.add_argument("--scrape", action="store_true", help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.scrape:
+        args.size = args.sizes[0]
+        run_scrape(args)
+        return
+
+    print(f"{'tickets':>8} {'tickets/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'RSS MB':>8}")
+    for size in args.sizes:
+        result = measure(args, size)
+        print(
+            f"{size:>8} {result['tickets_per_second']:>10.0f} "
+            f"{result['p50'] * 1000:>8.1f} {result['p99'] * 1000:>8.1f} "
+            f"{result['peak_rss_mb']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
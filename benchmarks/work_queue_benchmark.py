@@ -0,0 +1,138 @@
+"""
+Throughput of the distributed scrape for a growing number of workers.
+
+For every worker count a month of one subject is queued in a fresh work
+queue served over HTTP, as by `python main.py --coordinator --queue-port`,
+and that many worker processes scrape it from the replay server, each with
+its own session and its own small thread pool. Tickets per second should
+grow almost linearly with the workers as long as the server is not the
+bottleneck; every ticket must be in the results exactly once.
+
+    python -m benchmarks.work_queue_benchmark --workers 1 2 4 --latency 0.2
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.replay_server import ReplayServer
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+PERIOD = "Суббота, 01 Октябрь, 2022"
+SUBJECTS = {"1": "Водоснабжение"}
+
+
+def run_work(args: argparse.Namespace) -> None:
+    """
+    Processes the queue at args.queue with the portal at PORTAL_URL.
+    """
+    from parser import Parser, ParserSession
+
+    from ticket_extractors import get_extractors
+    from work_queue import HttpWorkQueue, run_worker
+
+    config = ParserSession()
+    parser = Parser(
+        session=config.session,
+        cookies=config.cookies,
+        max_workers=args.threads,
+        max_requests_per_host=args.threads,
+        extractor=get_extractors()[args.extractor](),
+        **config.get_payload(),
+    )
+    run_worker(HttpWorkQueue(args.queue), parser, poll_interval=0.2)
+
+
+def measure(args: argparse.Namespace, workers: int) -> float:
+    """
+    Scrapes the month with a number of worker processes.
+
+    Returns:
+        float: Tickets per second.
+    """
+    from work_queue import SqliteWorkQueue, listing_items, serve_queue
+
+    server = ReplayServer(tickets=args.tickets, latency=args.latency)
+    env = dict(
+        os.environ,
+        PORTAL_URL=server.start(),
+        PYTHONPATH=os.pathsep.join(
+            filter(None, [str(REPO_ROOT), os.getenv("PYTHONPATH")])
+        ),
+    )
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            queue = SqliteWorkQueue(str(Path(workdir, "work_queue.sqlite3")))
+            http = serve_queue(queue, 0, host="127.0.0.1")
+            queue.put(listing_items(PERIOD, SUBJECTS))
+            queue.seal()
+            command = [
+                sys.executable,
+                "-m",
+                "benchmarks.work_queue_benchmark",
+                "--work",
+                f"--queue=http://127.0.0.1:{http.server_port}/",
+                f"--threads={args.threads}",
+                f"--extractor={args.extractor}",
+            ]
+            start = time.perf_counter()
+            processes = [
+                subprocess.Popen(
+                    command,
+                    cwd=workdir,
+                    env=env,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+                for _ in range(workers)
+            ]
+            for process in processes:
+                if process.wait() != 0:
+                    sys.exit(f"A worker exited with {process.returncode}")
+            elapsed = time.perf_counter() - start
+
+            numbers = [
+                record["number"]
+                for subject in SUBJECTS
+                for records in queue.results(PERIOD, subject)
+                for record in records
+            ]
+            http.shutdown()
+            queue.close()
+    finally:
+        server.stop()
+    if len(numbers) != args.tickets or len(set(numbers)) != args.tickets:
+        sys.exit(f"{len(set(numbers))} distinct tickets in {len(numbers)} results")
+    return args.tickets / elapsed
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    arg_parser.add_argument("--tickets", type=int, default=1000)
+    arg_parser.add_argument("--latency", type=float, default=0.1)
+    arg_parser.add_argument(
+        "--threads", type=int, default=4, help="ticket pages in flight per worker"
+    )
+    arg_parser.add_argument("--extractor", default="lxml")
+    arg_parser.add_argument("--work", action="store_true", help=argparse.SUPPRESS)
+    arg_parser.add_argument("--queue", help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.work:
+        run_work(args)
+        return
+
+    print(f"{'workers':>8} {'tickets/s':>10} {'speedup':>8}")
+    baseline = None
+    for workers in args.workers:
+        rate = measure(args, workers)
+        baseline = baseline or rate
+        print(f"{workers:>8} {rate:>10.1f} {rate / baseline:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
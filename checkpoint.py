@@ -0,0 +1,121 @@
+import sqlite3
+import threading
+from typing import Iterable, Optional, Set
+
+from parser_config import CHECKPOINT_PATH
+
+
+def ticket_key(subject: str, position: int, number: Optional[str]) -> str:
+    """
+    Returns the key recording that a listed ticket was written: its number,
+    or for a ticket without one its position in the subject listing.
+    """
+    return number if number is not None else f"#{subject}:{position}"
+
+
+class CheckpointStore:
+    def __init__(self, path: str = CHECKPOINT_PATH) -> None:
+        """
+        Initializes a durable record of the progress of a scrape.
+
+        The store keeps, per period, which subject listings were fetched and
+        completed, which tickets were already written to the month file (by
+        ticket_key) and the size of that file at the last durable flush. The
+        ticket keys and the file size are always committed together, so a
+        resumed run can truncate the part file to a state that matches the
+        recorded keys exactly.
+
+        Args:
+            path (str): Path of the SQLite database.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS units (
+                    period TEXT NOT NULL,
+                    subject TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    tickets INTEGER,
+                    PRIMARY KEY (period, subject)
+                );
+                CREATE TABLE IF NOT EXISTS tickets (
+                    period TEXT NOT NULL,
+                    number TEXT NOT NULL,
+                    PRIMARY KEY (period, number)
+                );
+                CREATE TABLE IF NOT EXISTS files (
+                    period TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    complete INTEGER NOT NULL DEFAULT 0
+                );
+                """
+            )
+
+    def _execute(self, query: str, params: tuple = ()) -> list:
+        with self._lock, self._connection:
+            return self._connection.execute(query, params).fetchall()
+
+    def is_period_done(self, period: str) -> bool:
+        rows = self._execute("SELECT complete FROM files WHERE period = ?", (period,))
+        return bool(rows and rows[0][0])
+
+    def committed_size(self, period: str) -> Optional[int]:
+        """
+        Returns the durable size of the period's part file, if it was started.
+        """
+        rows = self._execute("SELECT size FROM files WHERE period = ?", (period,))
+        return rows[0][0] if rows else None
+
+    def is_unit_done(self, period: str, subject: str) -> bool:
+        rows = self._execute(
+            "SELECT state FROM units WHERE period = ? AND subject = ?",
+            (period, subject),
+        )
+        return bool(rows) and rows[0][0] == "done"
+
+    def mark_listed(self, period: str, subject: str, tickets: int) -> None:
+        self._execute(
+            "INSERT OR REPLACE INTO units (period, subject, state, tickets) "
+            "VALUES (?, ?, 'listed', ?)",
+            (period, subject, tickets),
+        )
+
+    def mark_unit_done(self, period: str, subject: str) -> None:
+        self._execute(
+            "UPDATE units SET state = 'done' WHERE period = ? AND subject = ?",
+            (period, subject),
+        )
+
+    def amended_numbers(self, period: str) -> Set[str]:
+        rows = self._execute("SELECT number FROM tickets WHERE period = ?", (period,))
+        return {row[0] for row in rows}
+
+    def commit(self, period: str, numbers: Iterable[str], size: int) -> None:
+        """
+        Records written tickets together with the flushed file size.
+
+        Args:
+            period (str): The period of the month file.
+            numbers (Iterable[str]): Keys of the tickets written since the
+                last commit, see ticket_key.
+            size (int): Size of the part file after the flush.
+        """
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO tickets (period, number) VALUES (?, ?)",
+                ((period, number) for number in numbers),
+            )
+            self._connection.execute(
+                "INSERT OR REPLACE INTO files (period, size, complete) "
+                "VALUES (?, ?, 0)",
+                (period, size),
+            )
+
+    def mark_period_done(self, period: str) -> None:
+        self._execute("UPDATE files SET complete = 1 WHERE period = ?", (period,))
+
+    def close(self) -> None:
+        self._connection.close()
@@ -0,0 +1,139 @@
+"""
+Compact in-memory storage of amended tickets.
+
+A month held for the "json" output used to be one dict per ticket, each
+with its own hash table and its own copy of the category, district,
+performer, malfunction type and status strings. CompactRecords stores a
+subject's tickets by column instead: the repetitive fields are dictionary
+encoded (one copy of each distinct value and a 4-byte code per ticket) and
+the other fields are plain lists. Records are rebuilt as dicts with their
+original keys, in their original order, when they are iterated, so the
+month files keep exactly the same JSON.
+"""
+import json
+from array import array
+from typing import IO, Dict, Iterable, Iterator, List
+
+# fields with a few dozen distinct values in a month
+LOW_CARDINALITY_FIELDS = (
+    "category",
+    "district",
+    "malfunction_type",
+    "performer",
+    "status",
+    "status_date",
+    "rating",
+    "z",
+)
+
+
+class DictionaryColumn:
+    """
+    A column storing each distinct value once and a code per row.
+    """
+
+    def __init__(self) -> None:
+        self.values: List = []
+        self.codes = array("I")
+        self._lookup: Dict = {}
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, row: int):
+        return self.values[self.codes[row]]
+
+    def append(self, value) -> None:
+        # keyed by type too, so that 1, 1.0 and True stay distinct
+        key = (type(value), value)
+        code = self._lookup.get(key)
+        if code is None:
+            code = self._lookup[key] = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+
+
+# placeholder of the fields a record does not have
+MISSING = object()
+
+
+class CompactRecords:
+    def __init__(self, records: Iterable[dict] = ()) -> None:
+        """
+        Initializes a columnar list of records.
+
+        Args:
+            records (Iterable[dict]): Initial records, e.g. amended tickets.
+        """
+        self.columns: Dict[str, object] = {}
+        # the keys of every record, in order, dictionary encoded as well
+        self.shapes = DictionaryColumn()
+        for record in records:
+            self.append(record)
+
+    def __len__(self) -> int:
+        return len(self.shapes)
+
+    def append(self, record: dict) -> None:
+        """
+        Stores one record; the dict itself is not kept.
+
+        Args:
+            record (dict): An amended ticket.
+        """
+        rows = len(self.shapes)
+        keys = tuple(record)
+        for key in keys:
+            if key not in self.columns:
+                self.add_column(key, rows)
+        for key, column in self.columns.items():
+            column.append(record.get(key, MISSING))
+        self.shapes.append(keys)
+
+    def add_column(self, key: str, rows: int) -> None:
+        if key in LOW_CARDINALITY_FIELDS:
+            column = DictionaryColumn()
+            for _ in range(rows):
+                column.append(MISSING)
+        else:
+            column = [MISSING] * rows
+        self.columns[key] = column
+
+    def row(self, index: int) -> dict:
+        """
+        Rebuilds one record, with the keys in their original order.
+        """
+        columns = self.columns
+        return {key: columns[key][index] for key in self.shapes[index]}
+
+    def __iter__(self) -> Iterator[dict]:
+        for index in range(len(self)):
+            yield self.row(index)
+
+    def __getitem__(self, index: int) -> dict:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("record index out of range")
+        return self.row(index)
+
+
+def dump_json(data: Iterable[Iterable[dict]], f: IO[str]) -> None:
+    """
+    Writes a month as json.dump(data, f, ensure_ascii=False) would, one
+    record at a time, so the records never all exist as dicts at once.
+
+    Args:
+        data (Iterable[Iterable[dict]]): One list of records per subject,
+            e.g. CompactRecords.
+        f (IO[str]): The month file.
+    """
+    f.write("[")
+    for subject_index, records in enumerate(data):
+        f.write(", [" if subject_index else "[")
+        for index, record in enumerate(records):
+            if index:
+                f.write(", ")
+            f.write(json.dumps(record, ensure_ascii=False))
+        f.write("]")
+    f.write("]")
@@ -0,0 +1,255 @@
+"""
+Airflow DAG scraping a month subject by subject, then transforming it.
+
+create_scrape_dag builds a DAG that maps one scrape_subject task over the
+configured subjects, for the month of the data interval of the run. The
+mapped tasks share an Airflow pool, which limits how many subjects are
+scraped from the portal at once, and each of them is retried on its own, so
+a failed subject does not re-run the month. Every subject is written to its
+own part file, staged in the raw bucket so that the tasks can run on any
+worker; merge_month streams them back, in the order of the subjects, into
+the month file main.py would write, which is uploaded to the raw bucket and
+transformed into the processed dataset: by local_transform.py in the worker
+if the file is small, by data_processing_spark.py submitted to Spark
+otherwise, as local_transform.choose_engine decides.
+
+The pool has to be created once:
+
+    airflow pools set 115bel_portal 4 "Subjects scraped from 115.bel at once"
+"""
+import json
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from airflow.decorators import dag, task
+from airflow.providers.apache.spark.operators.spark_submit import SparkSubmitOperator
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+# Airflow only puts the DAG folder on sys.path, the parser is one level up
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from parser_config import (  # noqa: E402
+    AIRFLOW_AWS_CONN_ID,
+    AIRFLOW_PARTS_PREFIX,
+    AIRFLOW_POOL,
+    AIRFLOW_RETRY_DELAY,
+    AIRFLOW_SPARK_CONN_ID,
+    AIRFLOW_SUBJECT_RETRIES,
+    RAW_BUCKET,
+    RAW_PREFIX,
+    SESSION_CACHE_PATH,
+    get_configured_subjects,
+)
+
+# month file formats data_processing_spark.py reads, by its --extension
+TRANSFORM_FORMATS = ["json", "ndjson"]
+
+
+def month_filename(period: str, output_format: str) -> str:
+    from parser_session import ParserSession
+
+    return ParserSession.generate_filename(period, extension=output_format)
+
+
+def s3_filesystem(aws_conn_id: str):
+    """
+    Returns a pyarrow S3 filesystem with the credentials of an Airflow
+    connection, for the local transform engine.
+    """
+    from airflow.providers.amazon.aws.hooks.s3 import S3Hook
+    from pyarrow import fs
+
+    hook = S3Hook(aws_conn_id=aws_conn_id)
+    credentials = hook.get_credentials()
+    return fs.S3FileSystem(
+        access_key=credentials.access_key,
+        secret_key=credentials.secret_key,
+        session_token=credentials.token,
+        region=hook.conn_region_name,
+    )
+
+
+def read_part(hook, key: str) -> Iterator[dict]:
+    """
+    Streams the records of a part file staged in the raw bucket.
+    """
+    body = hook.get_key(key, bucket_name=RAW_BUCKET).get()["Body"]
+    for line in body.iter_lines():
+        if line:
+            yield json.loads(line)
+
+
+def create_scrape_dag(
+    dag_id: str = "scrape_month",
+    schedule: Optional[str] = "@monthly",
+    start_date: datetime = datetime(2023, 1, 1, tzinfo=timezone.utc),
+    subjects: Optional[dict] = None,
+    output_format: str = "json",
+    pool: str = AIRFLOW_POOL,
+    retries: int = AIRFLOW_SUBJECT_RETRIES,
+    aws_conn_id: str = AIRFLOW_AWS_CONN_ID,
+    spark_conn_id: str = AIRFLOW_SPARK_CONN_ID,
+):
+    """
+    Builds the DAG scraping and transforming the month of its data interval.
+
+    Args:
+        dag_id (str): The id of the DAG.
+        schedule (Optional[str]): The schedule; a monthly run scrapes the
+            month that has just ended.
+        start_date (datetime): The first data interval.
+        subjects (Optional[dict]): The subjects to scrape, by code;
+            get_configured_subjects() when the run starts by default.
+        output_format (str): The month file format, one of TRANSFORM_FORMATS.
+        pool (str): The Airflow pool of the scrape_subject tasks.
+        retries (int): The retries of a failed subject.
+        aws_conn_id (str): The connection staging the part files and
+            uploading the month file, also used by the local transform
+            engine.
+        spark_conn_id (str): The connection large months are submitted to.
+
+    Returns:
+        DAG: The DAG.
+
+    Raises:
+        ValueError: If the transform cannot read the output format.
+    """
+    if output_format not in TRANSFORM_FORMATS:
+        raise ValueError(
+            f"The transform reads {TRANSFORM_FORMATS} month files, "
+            f"not {output_format!r}"
+        )
+
+    @dag(
+        dag_id=dag_id,
+        schedule=schedule,
+        start_date=start_date,
+        catchup=False,
+        max_active_runs=1,
+        default_args={
+            "retries": retries,
+            "retry_delay": timedelta(seconds=AIRFLOW_RETRY_DELAY),
+        },
+        tags=["115bel"],
+    )
+    def scrape_month():
+        @task
+        def month_period(data_interval_start=None) -> str:
+            from parser_session import ParserSession
+
+            return ParserSession.format_period(
+                data_interval_start.date().replace(day=1)
+            )
+
+        @task
+        def list_subjects() -> List[str]:
+            return list(subjects or get_configured_subjects())
+
+        @task(pool=pool, retry_exponential_backoff=True)
+        def scrape_subject(subject: str, period: str) -> str:
+            from airflow.providers.amazon.aws.hooks.s3 import S3Hook
+
+            from output_writers import NdjsonWriter
+            from session_pool import PooledParser, SessionPool
+
+            names = subjects or get_configured_subjects()
+            month = Path(month_filename(period, "json")).stem
+            key = f"{AIRFLOW_PARTS_PREFIX}/{month}/{subject}.ndjson"
+            # the bootstrap parameters are shared by the tasks of a host
+            cache_path = REPO_ROOT / SESSION_CACHE_PATH
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            session_pool = SessionPool(size=1, cache_path=str(cache_path))
+            try:
+                parser = PooledParser(session_pool)
+                with tempfile.TemporaryDirectory() as directory:
+                    path = Path(directory, f"{subject}.ndjson")
+                    with NdjsonWriter(str(path)) as writer:
+                        for record in parser.iter_period_tickets(
+                            period, {subject: names[subject]}
+                        ):
+                            writer.write(record)
+                    # only a complete part is staged
+                    S3Hook(aws_conn_id=aws_conn_id).load_file(
+                        filename=str(path),
+                        key=key,
+                        bucket_name=RAW_BUCKET,
+                        replace=True,
+                    )
+            finally:
+                session_pool.close()
+            return key
+
+        @task
+        def merge_month(period: str, parts: List[str]) -> str:
+            from airflow.providers.amazon.aws.hooks.s3 import S3Hook
+
+            from output_writers import write_month
+
+            hook = S3Hook(aws_conn_id=aws_conn_id)
+            # the mapped results are in the order of the subjects
+            parts = list(parts)
+            filename = month_filename(period, output_format)
+            with tempfile.TemporaryDirectory() as directory:
+                write_month(
+                    [read_part(hook, key) for key in parts],
+                    period,
+                    output_format,
+                    directory,
+                )
+                hook.load_file(
+                    filename=str(Path(directory, filename)),
+                    key=f"{RAW_PREFIX}/{filename}",
+                    bucket_name=RAW_BUCKET,
+                    replace=True,
+                )
+            if parts:
+                hook.delete_objects(bucket=RAW_BUCKET, keys=parts)
+            return Path(filename).stem
+
+        @task.branch
+        def choose_engine(month: str) -> str:
+            import local_transform
+
+            engine = local_transform.choose_engine(
+                month, output_format, filesystem=s3_filesystem(aws_conn_id)
+            )
+            return "transform_local" if engine == "local" else "transform_month"
+
+        @task
+        def transform_local(month: str) -> None:
+            from local_transform import transform
+
+            transform(
+                [month],
+                output_format,
+                engine="local",
+                filesystem=s3_filesystem(aws_conn_id),
+            )
+
+        transform_spark = SparkSubmitOperator(
+            task_id="transform_month",
+            application=str(REPO_ROOT / "data_processing_spark.py"),
+            application_args=[
+                "--start",
+                "{{ data_interval_start.strftime('%Y-%m') }}",
+                "--extension",
+                output_format,
+                "--engine",
+                "spark",
+            ],
+            conn_id=spark_conn_id,
+        )
+
+        period = month_period()
+        parts = scrape_subject.partial(period=period).expand(subject=list_subjects())
+        month = merge_month(period, parts)
+        choose_engine(month) >> [transform_local(month), transform_spark]
+
+    return scrape_month()
+
+
+scrape_month_dag = create_scrape_dag()
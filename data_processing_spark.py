@@ -1,11 +1,48 @@
 # import os
+import argparse
+import calendar
+import math
+from datetime import date, datetime, timedelta
+from typing import List, Optional
 
 import pyspark.sql.functions as f
-from pyspark.sql import SparkSession
+from pyspark.sql import SparkSession, Window
 from pyspark.sql.types import IntegerType, StringType, StructField, StructType
 
+from parser_config import GEO_INDEX_ROW_GROUP_SIZE, GEO_TILE_ZOOM
+from protocol_constants import EARTH_RADIUS
+
+RAW_PATH = "s3a://115bel/from_parser"
+PROCESSED_PATH = "s3a://115bel/processed_parquet"
+# single dataset of every processed month, partitioned by year and month
+DATASET_PATH = "s3a://115bel/processed_dataset"
+# geo index of every processed month (see geo.py), partitioned like the
+# dataset; geo.geo_index_root(DATASET_PATH)
+GEO_INDEX_PATH = "s3a://115bel/processed_dataset_geo"
+# Delta table of the processed tickets, one row per ticket number
+DELTA_PATH = "s3a://115bel/processed_delta"
+# columns clustered together by the maintenance command and the history
+# kept by VACUUM (in hours)
+ZORDER_COLUMNS = ["category", "district"]
+VACUUM_RETAIN_HOURS = 168
+
+# month names of the parser file names ("2020_may") and their numbers
+MONTH_NUMBERS = {calendar.month_name[i].lower(): i for i in range(1, 13)}
+PARTITIONS = ["year", "month"]
+
+# session settings the transform depends on: timestamps are parsed and
+# written in UTC, as by local_transform.py, and a date that does not match
+# its pattern (e.g. "6.10.2022", "31.02.2022") becomes null instead of
+# failing the job as under the default EXCEPTION policy of Spark 3
+SESSION_CONF = {
+    "spark.sql.session.timeZone": "UTC",
+    "spark.sql.legacy.timeParserPolicy": "CORRECTED",
+}
+
 schema = StructType(
     [
+        # the parser writes "address"; "adress" is only read from older files
+        StructField("address", StringType(), True),
         StructField("adress", StringType(), True),
         StructField("category", StringType(), True),
         StructField("district", StringType(), True),
@@ -27,18 +64,25 @@ schema = StructType(
 
 
 def get_spark():
-    spark = (
+    builder = (
         SparkSession.builder.master("local[*]")
         .appName("SparkDelta")
         .config("spark.hadoop.fs.s3a.impl", "org.apache.hadoop.fs.s3a.S3AFileSystem")
+        .config("spark.sql.extensions", "io.delta.sql.DeltaSparkSessionExtension")
+        .config(
+            "spark.sql.catalog.spark_catalog",
+            "org.apache.spark.sql.delta.catalog.DeltaCatalog",
+        )
         .config(
             "spark.jars.packages",
-            "io.delta:delta-core_2.12:1.1.0,"
+            "io.delta:delta-core_2.12:2.0.2,"
             "org.apache.hadoop:hadoop-aws:3.2.2,"
             "com.amazonaws:aws-java-sdk-bundle:1.12.180",
         )
-        .getOrCreate()
     )
+    for key, value in SESSION_CONF.items():
+        builder = builder.config(key, value)
+    spark = builder.getOrCreate()
     spark._jsc.hadoopConfiguration().set("com.amazonaws.services.s3.enableV4", "true")
     spark._jsc.hadoopConfiguration().set(
         "fs.s3a.impl", "org.apache.hadoop.fs.s3a.S3AFileSystem"
@@ -54,14 +98,7 @@ def get_spark():
     return spark
 
 
-def transform_spark(file):
-    spark = get_spark()
-    df = (
-        spark.read.schema(schema)
-        .format("json")
-        .load(f"s3a://115bel/from_parser/{file}.json")
-    )
-
+def transform_df(df, extra_columns=()):
     df = (
         df.withColumn(
             "request_regdate", f.to_timestamp("request_regdate", "dd.MM.yyyy HH:mm")
@@ -71,6 +108,7 @@ def transform_spark(file):
         )
         .withColumn("rating", f.col("rating").cast(IntegerType()))
         .withColumnRenamed("status", "stage")
+        .withColumn("adress", f.coalesce(f.col("address"), f.col("adress")))
     )
 
     split_col = f.split(df["status_date"], " ")
@@ -108,14 +146,243 @@ def transform_spark(file):
         "request_moddate",
         "user_comment",
         "organization_comment",
+        *extra_columns,
     )
+    return df
+
+
+def transform_spark(file, extension="json"):
+    # newline-delimited output of the parser (extension="ndjson") is read by
+    # the same JSON source, one record per line
+    spark = get_spark()
+    df = spark.read.schema(schema).format("json").load(f"{RAW_PATH}/{file}.{extension}")
+    df = transform_df(df)
     (
         df.write.mode("overwrite")
         .options(header="True", delimiter=",")
-        .parquet(f"s3a://115bel/processed_parquet/{file}.parquet")
+        .parquet(f"{PROCESSED_PATH}/{file}.parquet")
+    )
+
+
+def month_files(start: date, end: date) -> List[str]:
+    """
+    Returns the names of the parser month files from start to end, inclusive.
+
+    Args:
+        start (date): Any day of the first month.
+        end (date): Any day of the last month.
+
+    Returns:
+        List[str]: The file names without extension, e.g. "2020_may".
+    """
+    files = []
+    month = start.replace(day=1)
+    while month <= end:
+        files.append(f"{month.year}_{calendar.month_name[month.month].lower()}")
+        month = (month + timedelta(days=32)).replace(day=1)
+    return files
+
+
+def read_raw_months(spark: SparkSession, files: List[str], extension: str = "json"):
+    """
+    Reads several month files, adding their year and month.
+
+    Args:
+        spark (SparkSession): The session.
+        files (List[str]): Month file names without extension, e.g. "2020_may".
+        extension (str): "json" or "ndjson".
+
+    Returns:
+        DataFrame: The records as the parser wrote them, with "year" and
+        "month" columns, the month being the one of the file a record was
+        read from.
+    """
+    df = (
+        spark.read.schema(schema)
+        .format("json")
+        .load([f"{RAW_PATH}/{file}.{extension}" for file in files])
+    )
+
+    file_pattern = r"(\d{4})_([a-z]+)\.\w+$"
+    month_numbers = f.create_map(
+        *[f.lit(x) for item in MONTH_NUMBERS.items() for x in item]
+    )
+    df = df.withColumn(
+        "year",
+        f.regexp_extract(f.input_file_name(), file_pattern, 1).cast(IntegerType()),
+    ).withColumn(
+        "month",
+        month_numbers[f.regexp_extract(f.input_file_name(), file_pattern, 2)],
+    )
+    return df
+
+
+def read_months(spark: SparkSession, files: List[str], extension: str = "json"):
+    """
+    Reads and transforms several month files, adding their year and month.
+
+    Args:
+        spark (SparkSession): The session.
+        files (List[str]): Month file names without extension, e.g. "2020_may".
+        extension (str): "json" or "ndjson".
+
+    Returns:
+        DataFrame: The transformed records with "year" and "month" columns.
+    """
+    return transform_df(
+        read_raw_months(spark, files, extension), extra_columns=["year", "month"]
+    )
+
+
+def geo_index_df(df, extra_columns=()):
+    """
+    Computes the geo index of geo.build_geo_index with Spark expressions.
+
+    Args:
+        df (DataFrame): The records as the parser wrote them.
+        extra_columns: Columns of df kept as they are, e.g. year and month.
+
+    Returns:
+        DataFrame: The number, lat, lon and tile_id of each ticket, at
+        GEO_TILE_ZOOM; tickets without coordinates have the tile id -1.
+    """
+    half_circumference = math.pi * EARTH_RADIUS
+    tiles = 1 << GEO_TILE_ZOOM
+    scale = tiles / (2.0 * half_circumference)
+    x, y = f.col("x").cast("double"), f.col("y").cast("double")
+
+    def cell(metres):
+        return f.least(f.greatest(f.floor(metres * scale), f.lit(0)), f.lit(tiles - 1))
+
+    missing = x.isNull() | y.isNull() | f.isnan(x) | f.isnan(y)
+    return df.select(
+        "number",
+        f.degrees(2.0 * f.atan(f.exp(y / EARTH_RADIUS)) - math.pi / 2.0).alias("lat"),
+        f.degrees(x / EARTH_RADIUS).alias("lon"),
+        f.when(missing, -1)
+        .otherwise(cell(half_circumference - y) * tiles + cell(x + half_circumference))
+        .cast("long")
+        .alias("tile_id"),
+        *extra_columns,
+    )
+
+
+def transform_months(
+    files: List[str],
+    extension: str = "json",
+    by_category: bool = False,
+    spark: Optional[SparkSession] = None,
+):
+    """
+    Transforms several month files in one Spark session into one dataset.
+
+    The output at DATASET_PATH is partitioned by year and month (and by
+    category if by_category is set). The partitions are overwritten
+    dynamically, so only the months being processed are replaced and queries
+    filtering on year/month only read the matching directories. The geo
+    index of the months replaces their partitions at GEO_INDEX_PATH, one
+    file per month sorted by tile id.
+
+    Args:
+        files (List[str]): Month file names without extension, e.g. "2020_may".
+        extension (str): "json" or "ndjson".
+        by_category (bool): Also partition by category.
+        spark (Optional[SparkSession]): The session, get_spark() by default.
+    """
+    spark = spark or get_spark()
+    spark.conf.set("spark.sql.sources.partitionOverwriteMode", "dynamic")
+    raw = read_raw_months(spark, files, extension)
+    df = transform_df(raw, extra_columns=PARTITIONS)
+    partitions = PARTITIONS + (["category"] if by_category else [])
+    df.write.mode("overwrite").partitionBy(*partitions).parquet(DATASET_PATH)
+    (
+        geo_index_df(raw, extra_columns=PARTITIONS)
+        .repartition(*PARTITIONS)
+        .sortWithinPartitions("tile_id")
+        .write.mode("overwrite")
+        # row groups are sized in bytes, about 32 per row of the index
+        .option("parquet.block.size", GEO_INDEX_ROW_GROUP_SIZE * 32)
+        .partitionBy(*PARTITIONS)
+        .parquet(GEO_INDEX_PATH)
+    )
+
+
+def upsert_months(
+    files: List[str],
+    extension: str = "json",
+    spark: Optional[SparkSession] = None,
+):
+    """
+    Upserts several month files into the Delta table keyed by ticket number.
+
+    A ticket seen in several files keeps its latest version. Tickets that
+    are not in the table yet are inserted, partitioned by the year and month
+    of the file they first appeared in; existing tickets are only rewritten
+    if one of their columns changed, and keep their partition.
+
+    Args:
+        files (List[str]): Month file names without extension, e.g. "2020_may".
+        extension (str): "json" or "ndjson".
+        spark (Optional[SparkSession]): The session, get_spark() by default.
+    """
+    from delta.tables import DeltaTable
+
+    spark = spark or get_spark()
+    latest = Window.partitionBy("number").orderBy(
+        f.col("year").desc(), f.col("month").desc(), f.col("request_moddate").desc()
+    )
+    updates = (
+        read_months(spark, files, extension)
+        .withColumn("version", f.row_number().over(latest))
+        .filter(f.col("version") == 1)
+        .drop("version")
+    )
+
+    if not DeltaTable.isDeltaTable(spark, DELTA_PATH):
+        updates.write.format("delta").partitionBy(*PARTITIONS).save(DELTA_PATH)
+        return
+
+    columns = [column for column in updates.columns if column not in PARTITIONS]
+    changed = " OR ".join(
+        f"NOT (target.{column} <=> source.{column})" for column in columns
+    )
+    (
+        DeltaTable.forPath(spark, DELTA_PATH)
+        .alias("target")
+        .merge(updates.alias("source"), "target.number = source.number")
+        .whenMatchedUpdate(
+            condition=changed,
+            set={column: f"source.{column}" for column in columns},
+        )
+        .whenNotMatchedInsertAll()
+        .execute()
     )
 
 
+def maintain_delta(
+    spark: Optional[SparkSession] = None,
+    retain_hours: int = VACUUM_RETAIN_HOURS,
+):
+    """
+    Compacts the Delta table and clusters it by ZORDER_COLUMNS.
+
+    OPTIMIZE rewrites the small files left by the upserts into larger ones,
+    Z-ordered so that reads filtering on category or district skip most
+    files, then VACUUM deletes the files no longer referenced and older than
+    retain_hours.
+
+    Args:
+        spark (Optional[SparkSession]): The session, get_spark() by default.
+        retain_hours (int): History kept for time travel, in hours.
+    """
+    from delta.tables import DeltaTable
+
+    spark = spark or get_spark()
+    table = DeltaTable.forPath(spark, DELTA_PATH)
+    table.optimize().executeZOrderBy(*ZORDER_COLUMNS)
+    table.vacuum(retain_hours)
+
+
 def print_df_5_rows(file):
     spark = get_spark()
     df = spark.read.format("parquet").load(
@@ -125,9 +392,72 @@ def print_df_5_rows(file):
     df.show(5, vertical=True)
 
 
+def parse_month(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m").date()
+
+
+def parse_args() -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser(
+        description="Transform parser month files into the processed dataset"
+    )
+    arg_parser.add_argument(
+        "--start",
+        type=parse_month,
+        metavar="YYYY-MM",
+        help="first month to transform (default: the previous month)",
+    )
+    arg_parser.add_argument(
+        "--end",
+        type=parse_month,
+        metavar="YYYY-MM",
+        help="last month to transform, inclusive (default: --start)",
+    )
+    arg_parser.add_argument("--extension", choices=["json", "ndjson"], default="json")
+    arg_parser.add_argument(
+        "--by-category",
+        action="store_true",
+        help="also partition the dataset by category",
+    )
+    arg_parser.add_argument(
+        "--engine",
+        choices=["auto", "local", "spark"],
+        default="auto",
+        help="engine of the dataset transform (default: auto, which transforms "
+        "months smaller than LOCAL_TRANSFORM_MAX_BYTES without Spark)",
+    )
+    arg_parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="upsert the months into the Delta table keyed by ticket number "
+        "instead of overwriting their dataset partitions",
+    )
+    arg_parser.add_argument(
+        "--maintain",
+        action="store_true",
+        help="only compact and Z-order the Delta table, then vacuum it",
+    )
+    return arg_parser.parse_args()
+
+
 def main():
-    transform_spark("2020_may")
-    print_df_5_rows("2020_may")
+    args = parse_args()
+    if args.maintain:
+        maintain_delta()
+        return
+    start = args.start or (date.today().replace(day=1) - timedelta(days=1))
+    files = month_files(start, args.end or start)
+    if args.delta:
+        upsert_months(files, extension=args.extension)
+    else:
+        # the local engine needs pyarrow, which Spark-only runs may lack
+        from local_transform import transform
+
+        transform(
+            files,
+            extension=args.extension,
+            by_category=args.by_category,
+            engine=args.engine,
+        )
 
 
 if __name__ == "__main__":
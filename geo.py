@@ -0,0 +1,278 @@
+"""
+Coordinates and spatial grid index of the tickets.
+
+The listing gives the position of every ticket in EPSG:3857 (Web Mercator)
+metres, the projection requested by set_ticket_payload, as the "x" and "y"
+strings of each record. The functions here convert whole months at once
+with NumPy and assign every ticket the id of its Web Mercator tile, which
+is computed from the projected metres directly, without trigonometry. The
+geo index of a month is sorted by tile, so radius queries and per-tile
+aggregations only read the matching row groups.
+
+The transform writes the index of every month it processes next to the
+dataset, to the year=/month= partitions of "<dataset>_geo" (see
+local_transform.py and data_processing_spark.py). The index of a single
+month file can also be written next to it, as "<stem>.geo.parquet":
+
+    python geo.py data/2020_may.json [--zoom 14]
+"""
+import argparse
+import math
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+from parser_config import GEO_INDEX_ROW_GROUP_SIZE, GEO_TILE_ZOOM
+from protocol_constants import EARTH_RADIUS
+
+MEAN_EARTH_RADIUS_KM = 6371.0088
+HALF_CIRCUMFERENCE = math.pi * EARTH_RADIUS
+
+
+def parse_coordinates(values: List) -> np.ndarray:
+    """
+    Converts coordinate strings to float64, missing values to NaN.
+
+    Args:
+        values (List): The "x" or "y" values of the records; "null", empty
+            strings and None are missing.
+
+    Returns:
+        np.ndarray: The coordinates.
+    """
+    cleaned = ["nan" if value in (None, "", "null") else value for value in values]
+    return np.asarray(cleaned, dtype=np.float64)
+
+
+def mercator_to_latlon(x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Converts EPSG:3857 metres to WGS84 degrees.
+
+    Args:
+        x (np.ndarray): Eastings.
+        y (np.ndarray): Northings.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The latitudes and longitudes.
+    """
+    lon = np.degrees(x / EARTH_RADIUS)
+    lat = np.degrees(2.0 * np.arctan(np.exp(y / EARTH_RADIUS)) - math.pi / 2.0)
+    return lat, lon
+
+
+def latlon_to_mercator(
+    lat: np.ndarray, lon: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    x = np.radians(lon) * EARTH_RADIUS
+    y = np.log(np.tan(math.pi / 4.0 + np.radians(lat) / 2.0)) * EARTH_RADIUS
+    return x, y
+
+
+def tile_ids(x: np.ndarray, y: np.ndarray, zoom: int = GEO_TILE_ZOOM) -> np.ndarray:
+    """
+    Returns the Web Mercator tile of each point as one integer.
+
+    The tile (column, row) of the slippy map scheme at the given zoom is
+    encoded as row * 2**zoom + column; points without coordinates get -1.
+
+    Args:
+        x (np.ndarray): Eastings in EPSG:3857 metres.
+        y (np.ndarray): Northings in EPSG:3857 metres.
+        zoom (int): The zoom level; a tile is 40 075 km / 2**zoom wide at
+            the equator and narrower by cos(latitude) elsewhere.
+
+    Returns:
+        np.ndarray: The int64 tile ids.
+    """
+    tiles = 1 << zoom
+    scale = tiles / (2.0 * HALF_CIRCUMFERENCE)
+    with np.errstate(invalid="ignore"):
+        column = np.clip(np.floor((x + HALF_CIRCUMFERENCE) * scale), 0, tiles - 1)
+        row = np.clip(np.floor((HALF_CIRCUMFERENCE - y) * scale), 0, tiles - 1)
+        ids = row * tiles + column
+    return np.where(np.isnan(ids), -1, ids).astype(np.int64)
+
+
+def haversine_km(
+    lat: np.ndarray, lon: np.ndarray, center_lat: float, center_lon: float
+) -> np.ndarray:
+    lat, lon = np.radians(lat), np.radians(lon)
+    center_lat, center_lon = math.radians(center_lat), math.radians(center_lon)
+    a = (
+        np.sin((lat - center_lat) / 2.0) ** 2
+        + np.cos(lat) * math.cos(center_lat) * np.sin((lon - center_lon) / 2.0) ** 2
+    )
+    return 2.0 * MEAN_EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def tiles_around(
+    lat: float, lon: float, radius_km: float, zoom: int = GEO_TILE_ZOOM
+) -> List[int]:
+    """
+    Returns the ids of the tiles covering a circle's bounding box.
+    """
+    dlat = math.degrees(radius_km / MEAN_EARTH_RADIUS_KM)
+    dlon = dlat / max(math.cos(math.radians(lat)), 1e-12)
+    lats = np.array([lat - dlat, lat + dlat])
+    lons = np.array([lon - dlon, lon + dlon])
+    x, y = latlon_to_mercator(np.clip(lats, -85.05, 85.05), lons)
+    corners = tile_ids(x, y, zoom)
+    tiles = 1 << zoom
+    # the first corner is south-west: the largest row, the smallest column
+    max_row, min_column = divmod(int(corners[0]), tiles)
+    min_row, max_column = divmod(int(corners[1]), tiles)
+    return [
+        row * tiles + column
+        for row in range(min_row, max_row + 1)
+        for column in range(min_column, max_column + 1)
+    ]
+
+
+def build_geo_index(records: List[dict], zoom: int = GEO_TILE_ZOOM) -> pa.Table:
+    """
+    Builds the geo index of a month: number, lat, lon and tile id of each
+    ticket, sorted by tile id.
+
+    Args:
+        records (List[dict]): The amended tickets of the month.
+        zoom (int): The zoom level of the tiles.
+
+    Returns:
+        pa.Table: The index.
+    """
+    x = parse_coordinates([record.get("x") for record in records])
+    y = parse_coordinates([record.get("y") for record in records])
+    lat, lon = mercator_to_latlon(x, y)
+    table = pa.table(
+        {
+            "number": pa.array(
+                [record.get("number") for record in records], pa.string()
+            ),
+            "lat": pa.array(lat, from_pandas=True),
+            "lon": pa.array(lon, from_pandas=True),
+            "tile_id": pa.array(tile_ids(x, y, zoom)),
+        }
+    )
+    table = table.sort_by("tile_id")
+    return table.replace_schema_metadata({"zoom": str(zoom)})
+
+
+def geo_index_path(month_file: Path) -> Path:
+    return month_file.with_name(month_file.name.split(".")[0] + ".geo.parquet")
+
+
+def geo_index_root(dataset_root: str) -> str:
+    """
+    Returns the root of the geo index partitions of a dataset, e.g.
+    "s3://115bel/processed_dataset_geo"; it is a sibling of the dataset, as
+    Spark would not read a dataset with other files among its partitions.
+    """
+    return dataset_root.rstrip("/") + "_geo"
+
+
+def write_index_table(
+    index: pa.Table, path: str, filesystem: Optional[fs.FileSystem] = None
+) -> None:
+    pq.write_table(
+        index, path, filesystem=filesystem, row_group_size=GEO_INDEX_ROW_GROUP_SIZE
+    )
+
+
+def index_zoom(path: Path) -> int:
+    """
+    Returns the zoom level of the tile ids of a geo index file.
+
+    Spark cannot set the key-value metadata of its Parquet files, so the
+    files of data_processing_spark.py have no "zoom" entry; they are written
+    at GEO_TILE_ZOOM like those of the local transform.
+    """
+    metadata = pq.read_schema(path).metadata or {}
+    return int(metadata.get(b"zoom", GEO_TILE_ZOOM))
+
+
+def write_geo_index(month_file: Path, zoom: int = GEO_TILE_ZOOM) -> Path:
+    """
+    Writes the geo index of a month file next to it, as "<stem>.geo.parquet".
+
+    Args:
+        month_file (Path): A .json or .ndjson month file of the parser.
+        zoom (int): The zoom level of the tiles.
+
+    Returns:
+        Path: The index file.
+    """
+    from local_transform import read_records
+
+    records = read_records(month_file.read_bytes(), month_file.suffix.lstrip("."))
+    path = geo_index_path(month_file)
+    write_index_table(build_geo_index(records, zoom), str(path))
+    return path
+
+
+def tickets_within(
+    index_files: List[Path], lat: float, lon: float, radius_km: float
+) -> pa.Table:
+    """
+    Returns the tickets within radius_km of a point, from geo index files.
+
+    Only the row groups holding the tiles around the point are read; the
+    exact distance is computed for their tickets alone.
+
+    Args:
+        index_files (List[Path]): Geo index files, e.g. one per month; the
+            Parquet files of the partitions of geo_index_root or the
+            "<stem>.geo.parquet" files of write_geo_index.
+        lat (float): Latitude of the center.
+        lon (float): Longitude of the center.
+        radius_km (float): The radius in kilometres.
+
+    Returns:
+        pa.Table: The matching rows of the index, with a "distance_km" column.
+    """
+    matches = []
+    for path in index_files:
+        zoom = index_zoom(path)
+        candidates = pq.read_table(
+            path, filters=[("tile_id", "in", tiles_around(lat, lon, radius_km, zoom))]
+        )
+        distance = haversine_km(
+            candidates["lat"].to_numpy(zero_copy_only=False),
+            candidates["lon"].to_numpy(zero_copy_only=False),
+            lat,
+            lon,
+        )
+        inside = distance <= radius_km
+        matches.append(
+            candidates.filter(pa.array(inside)).append_column(
+                "distance_km", pa.array(distance[inside])
+            )
+        )
+    return pa.concat_tables(matches) if matches else pa.table({})
+
+
+def tile_counts(index_files: List[Path]) -> pa.Table:
+    """
+    Counts the tickets of every tile over several geo index files, for
+    heatmaps; only the tile id column is read.
+    """
+    tiles = pa.concat_tables(
+        pq.read_table(path, columns=["tile_id"]) for path in index_files
+    )
+    return tiles.group_by("tile_id").aggregate([("tile_id", "count")])
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("month_files", nargs="+", type=Path)
+    arg_parser.add_argument("--zoom", type=int, default=GEO_TILE_ZOOM)
+    args = arg_parser.parse_args()
+    for month_file in args.month_files:
+        print(write_geo_index(month_file, args.zoom))
+
+
+if __name__ == "__main__":
+    main()
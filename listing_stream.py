@@ -0,0 +1,213 @@
+"""
+Incremental decoding of the FOIDATA listing response.
+
+The listing is one JSON object whose "row" member is the array of tickets.
+ListingDecoder is fed the body as it is downloaded and yields every row as
+soon as it is complete, so the rows can be processed while the rest of the
+body is still arriving and the body is never held in memory as a whole.
+The other members of the object, e.g. the error of an expired session, are
+collected in ListingDecoder.members.
+
+read_ahead decouples the download from the consumer of the rows: a reader
+thread drains the response at network speed, so a slow consumer does not
+keep the connection open until a server or proxy times it out.
+"""
+import codecs
+import json
+import queue
+import threading
+from json.decoder import WHITESPACE
+from typing import Dict, Iterator, List
+
+# placeholder of a value that is not complete yet
+INCOMPLETE = object()
+# marks the end of the rows of read_ahead
+END = object()
+
+
+class ListingDecoder:
+    def __init__(self, array_key: str = "row") -> None:
+        """
+        Initializes a decoder of one listing response.
+
+        Args:
+            array_key (str): The member whose array elements are yielded.
+        """
+        self.array_key = array_key
+        self.members: Dict[str, object] = {}
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._text = ""
+        self._pos = 0
+        self._state = "start"
+        self._key = None
+
+    @property
+    def done(self) -> bool:
+        return self._state == "done"
+
+    def feed(self, data: bytes, final: bool = False) -> Iterator[dict]:
+        """
+        Decodes the next chunk of the body.
+
+        Args:
+            data (bytes): The chunk.
+            final (bool): Whether this is the end of the body.
+
+        Yields:
+            dict: The rows completed by this chunk.
+        """
+        # only the part not decoded yet is kept
+        self._text = self._text[self._pos :] + self._utf8.decode(data, final)
+        self._pos = 0
+        yield from self._parse(final)
+
+    def close(self) -> List[dict]:
+        """
+        Decodes the end of the body.
+
+        Returns:
+            List[dict]: The last rows, if any.
+
+        Raises:
+            ValueError: If the body is not a complete JSON object.
+        """
+        rows = list(self.feed(b"", final=True))
+        if not self.done:
+            raise ValueError("The listing response is truncated")
+        return rows
+
+    def _value(self, final: bool):
+        try:
+            value, end = self._json.raw_decode(self._text, self._pos)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            return INCOMPLETE
+        # a number at the end of the buffer may go on in the next chunk
+        if end == len(self._text) and not final:
+            return INCOMPLETE
+        self._pos = end
+        return value
+
+    def _expect(self, char: str, expected: str) -> None:
+        if char not in expected:
+            raise ValueError(
+                f"Unexpected {char!r} in the listing response, expected {expected!r}"
+            )
+        self._pos += 1
+
+    def _parse(self, final: bool) -> Iterator[dict]:
+        text = self._text
+        while True:
+            self._pos = WHITESPACE.match(text, self._pos).end()
+            if self._pos == len(text):
+                return
+            char = text[self._pos]
+            state = self._state
+            if state == "start":
+                self._expect(char, "{")
+                self._state = "first_key"
+            elif state == "first_key":
+                if char == "}":
+                    self._pos += 1
+                    self._state = "done"
+                else:
+                    self._state = "key"
+            elif state == "key":
+                self._expect(char, '"')
+                self._pos -= 1
+                key = self._value(final)
+                if key is INCOMPLETE:
+                    return
+                self._key = key
+                self._state = "colon"
+            elif state == "colon":
+                self._expect(char, ":")
+                self._state = "rows" if self._key == self.array_key else "value"
+            elif state == "value":
+                value = self._value(final)
+                if value is INCOMPLETE:
+                    return
+                self.members[self._key] = value
+                self._state = "next_member"
+            elif state == "next_member":
+                self._expect(char, ",}")
+                self._state = "key" if char == "," else "done"
+            elif state == "rows":
+                self._expect(char, "[")
+                self._state = "first_row"
+            elif state == "first_row":
+                if char == "]":
+                    self._pos += 1
+                    self._state = "next_member"
+                else:
+                    self._state = "row"
+            elif state == "row":
+                row = self._value(final)
+                if row is INCOMPLETE:
+                    return
+                yield row
+                self._state = "next_row"
+            elif state == "next_row":
+                self._expect(char, ",]")
+                self._state = "row" if char == "," else "next_member"
+            else:
+                raise ValueError("Unexpected data after the listing response")
+
+
+def read_ahead(rows: Iterator[dict], max_rows: int) -> Iterator[dict]:
+    """
+    Iterates over rows in a reader thread, buffering up to max_rows of them.
+
+    An error of the rows is raised by the returned iterator once the rows
+    read before it are consumed. If the returned iterator is closed early,
+    the reader stops and closes the rows.
+
+    Args:
+        rows (Iterator[dict]): The rows, e.g. of a streamed response.
+        max_rows (int): Rows read ahead of the consumer at most.
+
+    Returns:
+        Iterator[dict]: The same rows.
+    """
+    buffer = queue.Queue(max_rows)
+    stop = threading.Event()
+
+    def put(item: tuple) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read() -> None:
+        try:
+            for row in rows:
+                if not put((row, None)):
+                    return
+        except BaseException as exc:
+            put((END, exc))
+        else:
+            put((END, None))
+        finally:
+            close = getattr(rows, "close", None)
+            if close is not None:
+                close()
+
+    def consume() -> Iterator[dict]:
+        try:
+            while True:
+                row, error = buffer.get()
+                if row is END:
+                    if error is not None:
+                        raise error
+                    return
+                yield row
+        finally:
+            stop.set()
+
+    threading.Thread(target=read, daemon=True).start()
+    return consume()
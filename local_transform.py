@@ -0,0 +1,377 @@
+"""
+Spark-free engine for the monthly transform of the parser output.
+
+transform_local_months has the contract of transform_months: it reads month
+files of the parser and writes them to the partitions of the processed
+dataset, applying the same derivations, but with vectorized Arrow compute
+kernels in the current process instead of a JVM, and writes the geo index
+of each month (see geo.py) next to the dataset. transform, which
+data_processing_spark.py and the Airflow DAG go through, picks the engine
+of each month by the size of its file.
+
+    python local_transform.py 2020_may [--extension ndjson] [--engine local]
+"""
+import argparse
+import calendar
+import json
+from typing import List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+from geo import build_geo_index, geo_index_root, write_index_table
+from logs.set_logger import logger
+from output_writers import processed_schema, spark_schema_json
+from parser_config import LOCAL_TRANSFORM_MAX_BYTES
+from ticket_transform import INT32_MAX, INT32_MIN, PROCESSED_COLUMNS
+
+# the locations of data_processing_spark.py, for pyarrow's S3 filesystem
+RAW_URI = "s3://115bel/from_parser"
+DATASET_URI = "s3://115bel/processed_dataset"
+
+# month names of the parser file names ("2020_may") and their numbers
+MONTH_NUMBERS = {calendar.month_name[i].lower(): i for i in range(1, 13)}
+
+# characters escaped by Spark in partition directory names and the name of
+# the partition of null values
+PARTITION_ESCAPED_CHARS = frozenset(
+    [chr(code) for code in range(1, 32)] + list("\"#%'*/:=?\\\x7f{[]^")
+)
+DEFAULT_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+# fields of the parser records read by the transform, all as strings like
+# the schema of the Spark job; "address", or the "adress" key of older
+# files if it is null, fills the "adress" column
+SOURCE_FIELDS = (
+    "number",
+    "category",
+    "malfunction_type",
+    "performer",
+    "address",
+    "district",
+    "status",
+    "status_date",
+    "rating",
+    "request_regdate",
+    "request_moddate",
+    "user_comment",
+    "organization_comment",
+)
+
+INT_REGEX = r"^\s*(?P<integer>[+-]?\d+)(?:\.\d*)?\s*$"
+SECOND_TOKEN_REGEX = r"^[^ ]* (?P<token>[^ ]*)"
+
+
+def read_records(data: bytes, extension: str) -> List[dict]:
+    """
+    Decodes a month file: a JSON array with one array of records per
+    subject, or one record per line for the "ndjson" extension.
+    """
+    if extension == "ndjson":
+        return [json.loads(line) for line in data.splitlines() if line.strip()]
+    return [record for records in json.loads(data) for record in records]
+
+
+def records_to_table(records: List[dict]) -> pa.Table:
+    columns = {}
+    for field in SOURCE_FIELDS:
+        values = []
+        for record in records:
+            value = record.get(field)
+            if field == "address" and value is None:
+                value = record.get("adress")
+            values.append(
+                value if value is None or isinstance(value, str) else str(value)
+            )
+        columns[field] = pa.array(values, type=pa.string())
+    return pa.table(columns)
+
+
+def parse_strict(column: pa.ChunkedArray, fmt: str):
+    # strptime accepts single-digit fields and rolls invalid days over into
+    # the next month, Spark's patterns do not: the value must format back
+    # to the same string
+    parsed = pc.strptime(column, format=fmt, unit="us", error_is_null=True)
+    exact = pc.equal(pc.strftime(parsed, format=fmt), column)
+    return pc.if_else(exact, parsed, None)
+
+
+def transform_table(table: pa.Table) -> pa.Table:
+    """
+    Applies the transformations of transform_spark to a table of records.
+
+    Args:
+        table (pa.Table): String columns named as in SOURCE_FIELDS.
+
+    Returns:
+        pa.Table: The processed table, with the processed_parquet schema.
+    """
+    status_date = table["status_date"]
+
+    status = pc.if_else(
+        pc.match_substring(status_date, "Выполнено"),
+        "Выполнено",
+        pc.if_else(
+            pc.match_substring(status_date, "Просрочено"),
+            "Просрочено",
+            pc.if_else(
+                pc.match_substring(status_date, "до "),
+                "В процессе выполнения",
+                pa.scalar(None, pa.string()),
+            ),
+        ),
+    )
+
+    second_token = pc.struct_field(
+        pc.extract_regex(status_date, SECOND_TOKEN_REGEX), [0]
+    )
+    deadline = parse_strict(second_token, "%d.%m.%Y").cast(pa.date32())
+    deadline = pc.if_else(pc.match_substring(status_date, "до "), deadline, None)
+
+    integer = pc.struct_field(pc.extract_regex(table["rating"], INT_REGEX), [0])
+    integer = pc.cast(integer, pa.int64())
+    in_range = pc.and_(
+        pc.greater_equal(integer, INT32_MIN), pc.less_equal(integer, INT32_MAX)
+    )
+    rating = pc.if_else(in_range, integer, None).cast(pa.int32())
+
+    columns = {
+        "number": table["number"],
+        "category": table["category"],
+        "malfunction_type": table["malfunction_type"],
+        "performer": table["performer"],
+        "adress": table["address"],
+        "district": table["district"],
+        "stage": table["status"],
+        "status": status,
+        "current_deadline": deadline,
+        "rating": rating,
+        "request_regdate": parse_strict(table["request_regdate"], "%d.%m.%Y %H:%M"),
+        "request_moddate": parse_strict(table["request_moddate"], "%d.%m.%Y %H:%M"),
+        "user_comment": table["user_comment"],
+        "organization_comment": table["organization_comment"],
+    }
+    schema = processed_schema()
+    return pa.table(
+        [
+            pa.chunked_array(columns[name]).cast(schema.field(name).type)
+            for name in PROCESSED_COLUMNS
+        ],
+        schema=schema,
+    )
+
+
+def month_partition(file: str) -> Tuple[int, int]:
+    """
+    Returns the year and month of a parser month file name, e.g. (2020, 5)
+    for "2020_may", as read_months derives them from the file path.
+    """
+    year, name = file.split("_", 1)
+    return int(year), MONTH_NUMBERS[name]
+
+
+def escape_partition_value(value: Optional[str]) -> str:
+    """
+    Escapes a partition value for a directory name like Spark, which
+    percent-encodes the characters of PARTITION_ESCAPED_CHARS and writes
+    nulls and empty strings as its default partition.
+    """
+    if value is None or value == "":
+        return DEFAULT_PARTITION
+    return "".join(
+        f"%{ord(char):02X}" if char in PARTITION_ESCAPED_CHARS else char
+        for char in value
+    )
+
+
+def resolve(uri: str, filesystem: Optional[fs.FileSystem]) -> Tuple[fs.FileSystem, str]:
+    # paths of an explicit filesystem are the URIs without their scheme, as
+    # pyarrow's S3 filesystem takes "bucket/key"
+    if filesystem is None:
+        return fs.FileSystem.from_uri(uri)
+    return filesystem, uri.split("://", 1)[-1]
+
+
+def read_month_records(
+    file: str,
+    extension: str,
+    raw_root: str = RAW_URI,
+    filesystem: Optional[fs.FileSystem] = None,
+) -> List[dict]:
+    source, source_path = resolve(f"{raw_root}/{file}.{extension}", filesystem)
+    with source.open_input_stream(source_path) as f:
+        return read_records(f.read(), extension)
+
+
+def write_partition(
+    table: pa.Table, target: fs.FileSystem, partition_path: str
+) -> None:
+    # the dynamic overwrite of transform_months replaces every file of a
+    # partition it writes rows to
+    table = table.replace_schema_metadata(
+        {"org.apache.spark.sql.parquet.row.metadata": spark_schema_json(table.schema)}
+    )
+    target.delete_dir_contents(partition_path, missing_dir_ok=True)
+    target.create_dir(partition_path)
+    pq.write_table(
+        table,
+        f"{partition_path}/part-00000.snappy.parquet",
+        filesystem=target,
+        compression="snappy",
+        use_deprecated_int96_timestamps=True,
+    )
+
+
+def transform_local_months(
+    files: List[str],
+    extension: str = "json",
+    by_category: bool = False,
+    raw_root: str = RAW_URI,
+    dataset_root: str = DATASET_URI,
+    filesystem: Optional[fs.FileSystem] = None,
+) -> None:
+    """
+    Transforms several month files like transform_months, without Spark.
+
+    Each month replaces its year=/month= partition of the dataset (its
+    year=/month=/category= partitions if by_category is set) and its
+    year=/month= partition of the geo index at geo_index_root(dataset_root);
+    the other partitions are left untouched.
+
+    Args:
+        files (List[str]): Month file names without extension, e.g. "2020_may".
+        extension (str): "json" or "ndjson".
+        by_category (bool): Also partition by category.
+        raw_root (str): The directory (or S3 URI) of the parser files.
+        dataset_root (str): The directory (or S3 URI) of the dataset.
+        filesystem (Optional[fs.FileSystem]): The filesystem of both roots,
+            inferred from their URIs by default.
+    """
+    target, target_path = resolve(dataset_root, filesystem)
+    geo_target, geo_path = resolve(geo_index_root(dataset_root), filesystem)
+    for file in files:
+        records = read_month_records(file, extension, raw_root, filesystem)
+        table = transform_table(records_to_table(records))
+        year, month = month_partition(file)
+        month_path = f"{target_path}/year={year}/month={month}"
+        geo_month_path = f"{geo_path}/year={year}/month={month}"
+        geo_target.delete_dir_contents(geo_month_path, missing_dir_ok=True)
+        geo_target.create_dir(geo_month_path)
+        write_index_table(
+            build_geo_index(records),
+            f"{geo_month_path}/part-00000.parquet",
+            filesystem=geo_target,
+        )
+        if not by_category:
+            write_partition(table, target, month_path)
+        else:
+            categories = table["category"]
+            for category in pc.unique(categories).to_pylist():
+                rows = (
+                    pc.is_null(categories)
+                    if category is None
+                    else pc.equal(categories, category)
+                )
+                write_partition(
+                    table.filter(rows).drop(["category"]),
+                    target,
+                    f"{month_path}/category={escape_partition_value(category)}",
+                )
+        logger.info(f"Transformed {table.num_rows} records of {file} without Spark")
+    target.open_output_stream(f"{target_path}/_SUCCESS").close()
+
+
+def choose_engine(
+    file: str,
+    extension: str = "json",
+    raw_root: str = RAW_URI,
+    filesystem: Optional[fs.FileSystem] = None,
+) -> str:
+    """
+    Returns "local" for month files smaller than LOCAL_TRANSFORM_MAX_BYTES,
+    "spark" otherwise.
+    """
+    source, source_path = resolve(f"{raw_root}/{file}.{extension}", filesystem)
+    info = source.get_file_info(source_path)
+    if info.type == fs.FileType.NotFound:
+        raise FileNotFoundError(f"{raw_root}/{file}.{extension}")
+    engine = "local" if info.size < LOCAL_TRANSFORM_MAX_BYTES else "spark"
+    logger.info(f"{file}.{extension} is {info.size} bytes, using the {engine} engine")
+    return engine
+
+
+def transform(
+    files: List[str],
+    extension: str = "json",
+    by_category: bool = False,
+    engine: str = "auto",
+    raw_root: str = RAW_URI,
+    dataset_root: str = DATASET_URI,
+    filesystem: Optional[fs.FileSystem] = None,
+) -> None:
+    """
+    Transforms several month files into the dataset, with the local engine
+    or with Spark.
+
+    With engine="auto" every month is sent to the engine returned by
+    choose_engine; the months left for Spark are transformed together by
+    transform_months, so a JVM is only started if one of them is large.
+    Spark always reads and writes the locations of data_processing_spark.py.
+
+    Args:
+        files (List[str]): Month file names without extension, e.g. "2020_may".
+        extension (str): "json" or "ndjson".
+        by_category (bool): Also partition by category.
+        engine (str): "local", "spark" or "auto".
+        raw_root (str): The directory (or S3 URI) of the parser files.
+        dataset_root (str): The directory (or S3 URI) of the dataset.
+        filesystem (Optional[fs.FileSystem]): The filesystem of both roots,
+            inferred from their URIs by default.
+    """
+    engines = {
+        file: (
+            choose_engine(file, extension, raw_root, filesystem)
+            if engine == "auto"
+            else engine
+        )
+        for file in files
+    }
+    local_files = [file for file in files if engines[file] == "local"]
+    spark_files = [file for file in files if engines[file] == "spark"]
+    if local_files:
+        transform_local_months(
+            local_files, extension, by_category, raw_root, dataset_root, filesystem
+        )
+    if spark_files:
+        from data_processing_spark import transform_months
+
+        transform_months(spark_files, extension=extension, by_category=by_category)
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument(
+        "files", nargs="+", metavar="file", help='month file name, e.g. "2020_may"'
+    )
+    arg_parser.add_argument("--extension", choices=["json", "ndjson"], default="json")
+    arg_parser.add_argument(
+        "--by-category",
+        action="store_true",
+        help="also partition the dataset by category",
+    )
+    arg_parser.add_argument(
+        "--engine", choices=["auto", "local", "spark"], default="auto"
+    )
+    args = arg_parser.parse_args()
+    transform(
+        args.files,
+        extension=args.extension,
+        by_category=args.by_category,
+        engine=args.engine,
+    )
+
+
+if __name__ == "__main__":
+    main()
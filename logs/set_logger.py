@@ -22,6 +22,9 @@ def get_configured_logger(config_path: Path) -> logging.Logger:
     """
     Reads a config file and returs a customized logger
 
+    Relative paths of log files are resolved against the repository, so
+    that the logs are kept in one place whatever the working directory.
+
     Parameters
     ----------
     config_path : Path
@@ -34,7 +37,10 @@ def get_configured_logger(config_path: Path) -> logging.Logger:
     """
     with config_path.open("r") as f:
         config = yaml.safe_load(f.read())
-        logging.config.dictConfig(config=config)
+    for handler in config["handlers"].values():
+        if "filename" in handler:
+            handler["filename"] = str(config_path.parent.parent / handler["filename"])
+    logging.config.dictConfig(config=config)
 
     return logging.getLogger("parserLogger")
 
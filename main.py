@@ -1,32 +1,376 @@
+import argparse
+import asyncio
 from datetime import date
-from parser import Parser, ParserSession
+from parser import ParserSession
 
+from backfill import parse_month, run_backfill
+from checkpoint import CheckpointStore
 from logs.set_logger import logger
-from parser_config import get_configured_subjects
+from metrics import MetricsFileWriter, serve_metrics
+from parser_config import (
+    ADAPTIVE_MAX_LIMIT,
+    CHANGELOG_PATH,
+    LISTING_GRID,
+    MAX_IN_FLIGHT,
+    MAX_REQUESTS_PER_HOST,
+    METRICS_FILE_INTERVAL,
+    METRICS_PATH,
+    PARSE_WORKERS,
+    PIPELINE_QUEUE_SIZE,
+    SESSION_POOL_SIZE,
+    STATE_INDEX_PATH,
+    WORK_QUEUE_HOST,
+    WORK_QUEUE_PATH,
+    WORK_QUEUE_PORT,
+    get_configured_subjects,
+)
+from rate_control import RateController
+from response_archive import ResponseArchive, reextract
+from session_pool import PooledParser, SessionPool
+from ticket_extractors import get_extractors
+from work_queue import (
+    SqliteWorkQueue,
+    open_queue,
+    run_coordinator,
+    run_worker,
+    serve_queue,
+)
 
 
-def main() -> None:
+def parse_args() -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser(description="115.bel web scraper")
+    arg_parser.add_argument(
+        "--start",
+        type=parse_month,
+        metavar="YYYY-MM",
+        help="first month to scrape instead of the previous month; with the "
+        "requests engine the months are scheduled as one backfill",
+    )
+    arg_parser.add_argument(
+        "--end",
+        type=parse_month,
+        metavar="YYYY-MM",
+        help="last month to scrape, inclusive (default: --start)",
+    )
+    arg_parser.add_argument(
+        "--engine",
+        choices=["requests", "async", "pipeline"],
+        default="requests",
+        help="HTTP engine used for scraping",
+    )
+    arg_parser.add_argument(
+        "--workers",
+        type=int,
+        help="number of ticket pages fetched concurrently (default: --per-host, "
+        "as every ticket page is on one host) (requests/pipeline engine)",
+    )
+    arg_parser.add_argument(
+        "--per-host",
+        type=int,
+        default=MAX_REQUESTS_PER_HOST,
+        help="maximum in-flight requests to one host",
+    )
+    arg_parser.add_argument(
+        "--sessions",
+        type=int,
+        default=SESSION_POOL_SIZE,
+        help="number of independent portal sessions; expired sessions are "
+        "renewed and the failed request retried (requests/pipeline engine)",
+    )
+    arg_parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="adapt the number of in-flight requests to the server latency and "
+        "errors instead of --workers/--per-host, and retry failed requests "
+        "(requests/pipeline engine)",
+    )
+    arg_parser.add_argument(
+        "--listing-grid",
+        type=int,
+        default=LISTING_GRID,
+        metavar="N",
+        help="fetch each listing as N x N map tiles in parallel, splitting "
+        "dense tiles further, instead of one request (requests/pipeline engine)",
+    )
+    arg_parser.add_argument(
+        "--stream-listing",
+        action="store_true",
+        help="decode listings as they are downloaded and fetch ticket pages "
+        "from the first rows on (requests/pipeline engine)",
+    )
+    arg_parser.add_argument(
+        "--in-flight",
+        type=int,
+        default=MAX_IN_FLIGHT,
+        help="maximum in-flight requests (async engine)",
+    )
+    arg_parser.add_argument(
+        "--parse-workers",
+        type=int,
+        default=PARSE_WORKERS,
+        help="number of processes parsing ticket pages (pipeline engine)",
+    )
+    arg_parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=PIPELINE_QUEUE_SIZE,
+        help="capacity of the queues between pipeline stages (pipeline engine)",
+    )
+    arg_parser.add_argument(
+        "--output",
+        choices=["json", "ndjson", "parquet", "zstd"],
+        help="month file format (default: json, or ndjson with --checkpoint); "
+        "ndjson streams records to disk as they arrive, "
+        "parquet streams typed records in the processed_parquet layout and zstd "
+        "streams them to a seekable compressed archive indexed by ticket number",
+    )
+    arg_parser.add_argument(
+        "--checkpoint",
+        metavar="PATH",
+        help="resume from (and record progress to) this SQLite checkpoint; "
+        "writes the month files as ndjson, the only --output it supports "
+        "(requests engine)",
+    )
+    arg_parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only re-fetch tickets that are new or not closed, according to "
+        "the ticket state index (requests engine)",
+    )
+    arg_parser.add_argument(
+        "--state-index",
+        metavar="PATH",
+        default=STATE_INDEX_PATH,
+        help="ticket state index used by --incremental",
+    )
+    arg_parser.add_argument(
+        "--changelog",
+        metavar="PATH",
+        default=CHANGELOG_PATH,
+        help="status change log written by --incremental",
+    )
+    arg_parser.add_argument(
+        "--archive",
+        metavar="DIR",
+        help="keep the raw listing and ticket page responses in this archive "
+        "(requests/pipeline engine)",
+    )
+    arg_parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="rebuild the month files of every archived period from --archive, "
+        "without network access",
+    )
+    arg_parser.add_argument(
+        "--extractor",
+        choices=sorted(get_extractors()),
+        default="soup",
+        help="ticket page HTML extraction backend",
+    )
+    arg_parser.add_argument(
+        "--metrics-port",
+        type=int,
+        metavar="PORT",
+        help="serve per-stage metrics in the Prometheus text format on "
+        "http://0.0.0.0:PORT/metrics",
+    )
+    arg_parser.add_argument(
+        "--metrics-file",
+        metavar="PATH",
+        nargs="?",
+        const=METRICS_PATH,
+        help=f"write per-stage metrics to a JSON file every "
+        f"{METRICS_FILE_INTERVAL}s (default path: {METRICS_PATH})",
+    )
+    arg_parser.add_argument(
+        "--coordinator",
+        metavar="PATH",
+        nargs="?",
+        const=WORK_QUEUE_PATH,
+        help="queue the listings of the periods in a shared work queue, then "
+        f"write the month files from the results of the workers (default "
+        f"path: {WORK_QUEUE_PATH})",
+    )
+    arg_parser.add_argument(
+        "--queue-port",
+        type=int,
+        metavar="PORT",
+        help="serve the work queue of --coordinator to remote workers on "
+        f"http://HOST:PORT/ (e.g. {WORK_QUEUE_PORT})",
+    )
+    arg_parser.add_argument(
+        "--queue-host",
+        metavar="HOST",
+        default=WORK_QUEUE_HOST,
+        help="interface of --queue-port; any other than a loopback one "
+        "requires the shared token of the WORK_QUEUE_TOKEN environment "
+        f"variable, which remote workers send as well (default: "
+        f"{WORK_QUEUE_HOST})",
+    )
+    arg_parser.add_argument(
+        "--worker",
+        metavar="QUEUE",
+        help="process the items of a work queue, given as the SQLite path of "
+        "a coordinator on this host or its URL, until the coordinator has "
+        "queued every listing and no item is left",
+    )
+    args = arg_parser.parse_args()
+    if args.end and not args.start:
+        arg_parser.error("--end requires --start")
+    if args.queue_port is not None and not args.coordinator:
+        arg_parser.error("--queue-port requires --coordinator")
+    if args.worker and args.coordinator:
+        arg_parser.error("--worker and --coordinator are separate processes")
+    if args.offline and not args.archive:
+        arg_parser.error("--offline requires --archive")
+    if args.checkpoint and args.output not in (None, "ndjson"):
+        arg_parser.error("--checkpoint only supports --output ndjson")
+    args.output = args.output or ("ndjson" if args.checkpoint else "json")
+    if (args.checkpoint or args.incremental) and args.engine != "requests":
+        arg_parser.error(
+            "--checkpoint and --incremental are only supported by the requests engine"
+        )
+    # --offline only reads the archive, it does not scrape with any engine
+    scrapes_archive = args.archive and not args.offline
+    if (scrapes_archive or args.adaptive) and args.engine == "async":
+        arg_parser.error(
+            "--archive and --adaptive are not supported by the async engine"
+        )
+    return args
+
+
+def create_parser(args: argparse.Namespace):
+    """
+    Creates the session pool and the parser of the requests engine.
+
+    Returns:
+        tuple: The SessionPool, the PooledParser and the number of workers.
+    """
+    per_host, controller = args.per_host, None
+    workers = args.workers or per_host
+    if args.adaptive:
+        # the limiter sets the concurrency, the pool only has to be big enough
+        workers = per_host = ADAPTIVE_MAX_LIMIT
+        controller = RateController()
+    parser_kwargs = dict(
+        max_workers=workers,
+        max_requests_per_host=per_host,
+        controller=controller,
+        extractor=get_extractors()[args.extractor](),
+        archive=ResponseArchive(args.archive) if args.archive else None,
+        listing_grid=args.listing_grid,
+        stream_listing=args.stream_listing,
+    )
     logger.info("Start obtaining HTTP headers and payload")
-    config = ParserSession()
-    payload_params = config.get_payload()
-    cookies = config.cookies
-    session = config.session
+    pool = SessionPool(size=args.sessions, parser_kwargs=parser_kwargs)
     logger.info("Initializing main parser")
-    parser_session = Parser(
-        session=session,
-        cookies=cookies,
-        p_instance=payload_params["p_instance"],
-        p_request=payload_params["p_request"],
-        protected=payload_params["protected"],
-        salt=payload_params["salt"],
-    )
+    parser_session = PooledParser(pool, **parser_kwargs)
+    return pool, parser_session, workers
+
+
+def run_requests_engine(args: argparse.Namespace, periods: list, subjects: dict):
+    pool, parser_session, workers = create_parser(args)
+    logger.info("Start parsing")
+    if args.engine == "pipeline":
+        from pipeline import ScrapePipeline
+
+        ScrapePipeline(
+            parser_session,
+            fetch_workers=workers,
+            parse_workers=args.parse_workers,
+            queue_size=args.queue_size,
+        ).parse(periods=periods, subjects=subjects, output_format=args.output)
+    elif args.start and not (args.incremental or args.checkpoint):
+        run_backfill(
+            parser_session,
+            periods,
+            subjects,
+            workers=workers,
+            output_format=args.output,
+        )
+    elif args.incremental:
+        from ticket_index import TicketStateIndex, refresh
+
+        index = TicketStateIndex(args.state_index)
+        refresh(parser_session, periods, subjects, index, args.changelog)
+    else:
+        checkpoint = CheckpointStore(args.checkpoint) if args.checkpoint else None
+        parser_session.parse(
+            periods=periods,
+            subjects=subjects,
+            output_format=args.output,
+            checkpoint=checkpoint,
+        )
+    pool.close()
+
+
+async def run_async_engine(args: argparse.Namespace, periods: list, subjects: dict):
+    from async_parser import AsyncParser, AsyncParserSession
+
+    logger.info("Start obtaining HTTP headers and payload")
+    async with AsyncParserSession(max_connections=args.in_flight) as config:
+        payload_params = await config.get_payload()
+        logger.info("Initializing async parser")
+        parser_session = AsyncParser(
+            session=config.session,
+            cookies=config.cookies,
+            p_instance=payload_params["p_instance"],
+            p_request=payload_params["p_request"],
+            protected=payload_params["protected"],
+            salt=payload_params["salt"],
+            max_in_flight=args.in_flight,
+            max_requests_per_host=args.per_host,
+            extractor=get_extractors()[args.extractor](),
+        )
+        logger.info("Start parsing")
+        await parser_session.parse_async(
+            periods=periods, subjects=subjects, output_format=args.output
+        )
+
+
+def main() -> None:
+    args = parse_args()
+    if args.metrics_port is not None:
+        serve_metrics(args.metrics_port)
+    metrics_writer = None
+    if args.metrics_file:
+        metrics_writer = MetricsFileWriter(args.metrics_file)
+        metrics_writer.start()
     periods = []
     logger.info("Obtaining periods")
-    periods.append(ParserSession.generate_template_date(date.today()))
+    if args.start:
+        periods.extend(
+            ParserSession.generate_periods(args.start, args.end or args.start)
+        )
+    else:
+        periods.append(ParserSession.generate_template_date(date.today()))
     logger.info("Obtaining subjects")
     subjects = get_configured_subjects()
-    logger.info("Start parsing")
-    parser_session.parse(periods=periods, subjects=subjects)
+    if args.worker:
+        pool, parser_session, _ = create_parser(args)
+        logger.info(f"Processing the work queue at {args.worker}")
+        run_worker(open_queue(args.worker), parser_session)
+        pool.close()
+    elif args.coordinator:
+        queue = SqliteWorkQueue(args.coordinator)
+        if args.queue_port is not None:
+            serve_queue(queue, args.queue_port, host=args.queue_host)
+        run_coordinator(queue, periods, subjects, output_format=args.output)
+    elif args.offline:
+        logger.info("Re-extracting the archived responses")
+        reextract(
+            ResponseArchive(args.archive),
+            subjects,
+            parse_workers=args.parse_workers,
+            extractor_class=get_extractors()[args.extractor],
+            output_format=args.output,
+        )
+    elif args.engine == "async":
+        asyncio.run(run_async_engine(args, periods, subjects))
+    else:
+        run_requests_engine(args, periods, subjects)
+    if metrics_writer is not None:
+        metrics_writer.stop()
     logger.info("Finished parsing")
 
 
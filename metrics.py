@@ -0,0 +1,266 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from logs.set_logger import logger
+from parser_config import METRICS_FILE_INTERVAL, METRICS_LATENCY_BUCKETS
+
+# label values of one series, e.g. (("stage", "detail"),)
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in labels)
+    return "{" + pairs + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[Tuple[str, Labels, float]]:
+        for labels, value in self.values.items():
+            yield self.name, labels, value
+
+    def snapshot(self) -> List[dict]:
+        return [
+            {"labels": dict(labels), "value": value}
+            for labels, value in self.values.items()
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        self.values[tuple(sorted(labels.items()))] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...]) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        # per series: the count of each bucket, then the sum and the count
+        self.values: Dict[Labels, list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        series = self.values.get(key)
+        if series is None:
+            series = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def samples(self) -> Iterator[Tuple[str, Labels, float]]:
+        for labels, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", labels + (("le", str(bound)),), cumulative
+            yield f"{self.name}_bucket", labels + (("le", "+Inf"),), count
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+    def snapshot(self) -> List[dict]:
+        return [
+            {
+                "labels": dict(labels),
+                "buckets": dict(zip(map(str, self.buckets), counts)),
+                "sum": total,
+                "count": count,
+            }
+            for labels, (counts, total, count) in self.values.items()
+        ]
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        """
+        Initializes the per-stage metrics of a scrape.
+
+        The stages are "bootstrap" (session set-up), "listing" (FOIDATA
+        requests), "detail" (ticket page requests), "parse" (ticket page
+        extraction), "merge" (amending tickets) and "write" (month files).
+        Each stage has a call counter, an error counter, a latency histogram
+        and an in-flight gauge; the network and write stages also count
+        bytes.
+        """
+        self._lock = threading.Lock()
+        self.calls = Counter("scraper_stage_calls_total", "Calls of each stage")
+        self.errors = Counter(
+            "scraper_stage_errors_total", "Calls of each stage that raised"
+        )
+        self.seconds = Histogram(
+            "scraper_stage_seconds",
+            "Latency of each stage in seconds",
+            METRICS_LATENCY_BUCKETS,
+        )
+        self.in_flight = Gauge(
+            "scraper_stage_in_flight", "Calls of each stage in progress"
+        )
+        self.bytes = Counter(
+            "scraper_stage_bytes_total", "Bytes received or written by each stage"
+        )
+        self.metrics = [
+            self.calls,
+            self.errors,
+            self.seconds,
+            self.in_flight,
+            self.bytes,
+        ]
+
+    @contextmanager
+    def stage(self, stage: str) -> Iterator[None]:
+        """
+        Times the enclosed block as one call of a stage.
+
+        Args:
+            stage (str): The stage name.
+        """
+        with self._lock:
+            self.in_flight.inc(stage=stage)
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - start, failed)
+            with self._lock:
+                self.in_flight.dec(stage=stage)
+
+    def observe(self, stage: str, seconds: float, failed: bool = False) -> None:
+        """
+        Records one call of a stage timed elsewhere, e.g. in a worker process.
+        """
+        with self._lock:
+            self.calls.inc(stage=stage)
+            self.seconds.observe(seconds, stage=stage)
+            if failed:
+                self.errors.inc(stage=stage)
+
+    def add_bytes(self, stage: str, size: int) -> None:
+        with self._lock:
+            self.bytes.inc(size, stage=stage)
+
+    def render_prometheus(self) -> str:
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            for metric in self.metrics:
+                lines.append(f"# HELP {metric.name} {metric.help_text}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+                for name, labels, value in metric.samples():
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "timestamp": time.time(),
+                **{metric.name: metric.snapshot() for metric in self.metrics},
+            }
+
+
+registry = MetricsRegistry()
+
+
+def serve_metrics(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """
+    Serves the registry on http://host:port/metrics from a daemon thread.
+
+    Args:
+        port (int): The port to listen on.
+        host (str): The interface to listen on.
+
+    Returns:
+        ThreadingHTTPServer: The running server.
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args) -> None:
+            pass
+
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
+
+
+class MetricsFileWriter:
+    def __init__(self, path: str, interval: float = METRICS_FILE_INTERVAL) -> None:
+        """
+        Initializes a writer of periodic JSON snapshots of the registry.
+
+        The file is replaced atomically, so readers never see a partial
+        snapshot; the last one is written on stop().
+
+        Args:
+            path (str): The JSON file.
+            interval (float): Seconds between snapshots.
+        """
+        self.path = Path(path)
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def write(self) -> None:
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump(registry.snapshot(), f)
+        os.replace(tmp_path, self.path)
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.write()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.write()
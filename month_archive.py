@@ -0,0 +1,309 @@
+"""
+Seekable zstd-compressed month files with a ticket number index.
+
+A month archive "<YYYY_month>.ndjson.zst" holds the records of a month as
+newline-delimited JSON, compressed in independent zstd frames of a few
+hundred records, so the file is also readable by any zstd tool. The sidecar
+"<YYYY_month>.ndjson.zst.idx" holds the offset and length of every frame and
+a sorted array of fixed-size entries (ticket number, frame, line in the
+frame); it is memory-mapped and binary searched, so reading one ticket
+decompresses a single frame.
+
+    python month_archive.py data/2020_may.ndjson.zst 2047.10.061022
+    python month_archive.py --convert data/2020_may.json
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import zstandard
+
+from metrics import registry
+from parser_config import ARCHIVE_FRAME_RECORDS, ARCHIVE_ZSTD_LEVEL
+
+INDEX_MAGIC = b"TIX1"
+# magic, number of frames, number of entries
+INDEX_HEADER = struct.Struct("<4sII")
+# frame offset and length
+INDEX_FRAME = struct.Struct("<QI")
+# ticket number (NUL-padded), frame, line in the frame
+INDEX_ENTRY = struct.Struct("<24sIH")
+KEY_SIZE = 24
+
+
+def index_key(number: str) -> bytes:
+    key = number.encode("utf8")
+    if len(key) > KEY_SIZE:
+        raise ValueError(f"Ticket number {number!r} is longer than {KEY_SIZE} bytes")
+    return key.ljust(KEY_SIZE, b"\0")
+
+
+class MonthArchiveWriter:
+    def __init__(
+        self,
+        path: str,
+        frame_records: int = ARCHIVE_FRAME_RECORDS,
+        level: int = ARCHIVE_ZSTD_LEVEL,
+    ) -> None:
+        """
+        Initializes a streaming writer of a month archive and its index.
+
+        Records are buffered and compressed as one zstd frame every
+        frame_records records. Like NdjsonWriter, the archive is written to
+        "<path>.part" and renamed on close, after its index; if the writer is
+        left through an exception the part file is kept as is.
+
+        Args:
+            path (str): The final path of the archive.
+            frame_records (int): Number of records per frame.
+            level (int): The zstd compression level.
+        """
+        self.path = Path(path)
+        self.part_path = self.path.with_name(self.path.name + ".part")
+        self.index_path = self.path.with_name(self.path.name + ".idx")
+        self.frame_records = max(1, frame_records)
+        self.compressor = zstandard.ZstdCompressor(level=level)
+        self.records_written = 0
+        self._lines: List[bytes] = []
+        self._numbers: List[Optional[str]] = []
+        self._frames: List[Tuple[int, int]] = []
+        self._entries: List[Tuple[bytes, int, int]] = []
+        self._offset = 0
+        self._file = None
+
+    def __enter__(self) -> "MonthArchiveWriter":
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.flush()
+            self._file.close()
+
+    def open(self) -> None:
+        self._file = open(self.part_path, "wb")
+
+    def write(self, record: dict) -> None:
+        """
+        Buffers one record for the current frame. A record without a ticket
+        number is archived but left out of the index, so it is only read by
+        iterating over the archive.
+
+        Args:
+            record (dict): An amended ticket.
+        """
+        self._lines.append(json.dumps(record, ensure_ascii=False).encode("utf8"))
+        self._numbers.append(record.get("number"))
+        self.records_written += 1
+        if len(self._lines) >= self.frame_records:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Compresses the buffered records as one frame.
+        """
+        if not self._lines:
+            return
+        with registry.stage("write"):
+            frame = self.compressor.compress(b"\n".join(self._lines) + b"\n")
+            self._file.write(frame)
+        registry.add_bytes("write", len(frame))
+        for line, number in enumerate(self._numbers):
+            if number is None:
+                continue
+            self._entries.append((index_key(number), len(self._frames), line))
+        self._frames.append((self._offset, len(frame)))
+        self._offset += len(frame)
+        self._lines = []
+        self._numbers = []
+
+    def close(self) -> None:
+        """
+        Writes the last frame and the index, then moves the archive to its
+        final name.
+        """
+        self.flush()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._entries.sort()
+        index_part = self.index_path.with_name(self.index_path.name + ".part")
+        with open(index_part, "wb") as f:
+            f.write(
+                INDEX_HEADER.pack(INDEX_MAGIC, len(self._frames), len(self._entries))
+            )
+            for frame in self._frames:
+                f.write(INDEX_FRAME.pack(*frame))
+            for entry in self._entries:
+                f.write(INDEX_ENTRY.pack(*entry))
+        os.replace(index_part, self.index_path)
+        os.replace(self.part_path, self.path)
+
+
+class MonthArchive:
+    def __init__(self, path: str) -> None:
+        """
+        Opens a month archive and memory-maps its index.
+
+        Args:
+            path (str): The path of the archive; the index is "<path>.idx".
+        """
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        with open(self.path.with_name(self.path.name + ".idx"), "rb") as f:
+            self._index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, frames, self._count = INDEX_HEADER.unpack_from(self._index, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{path}.idx is not a month archive index")
+        self._entries_start = INDEX_HEADER.size + frames * INDEX_FRAME.size
+        self._decompressor = zstandard.ZstdDecompressor()
+
+    def __enter__(self) -> "MonthArchive":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def entry(self, position: int) -> Tuple[int, int]:
+        """
+        Returns the frame and the line of an index entry.
+        """
+        _, frame, line = INDEX_ENTRY.unpack_from(
+            self._index, self._entries_start + position * INDEX_ENTRY.size
+        )
+        return frame, line
+
+    def key(self, position: int) -> bytes:
+        start = self._entries_start + position * INDEX_ENTRY.size
+        return self._index[start : start + KEY_SIZE]
+
+    def search(self, key: bytes) -> int:
+        """
+        Returns the position of the first index entry not below key.
+        """
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def read_frame(self, frame: int) -> List[bytes]:
+        offset, length = INDEX_FRAME.unpack_from(
+            self._index, INDEX_HEADER.size + frame * INDEX_FRAME.size
+        )
+        self._file.seek(offset)
+        return self._decompressor.decompress(self._file.read(length)).splitlines()
+
+    def get(self, number: str) -> Optional[dict]:
+        """
+        Reads one ticket, decompressing only the frame that holds it.
+
+        Args:
+            number (str): The ticket number.
+
+        Returns:
+            Optional[dict]: The record, None if the ticket is not archived.
+        """
+        key = index_key(number)
+        position = self.search(key)
+        if position == self._count or self.key(position) != key:
+            return None
+        frame, line = self.entry(position)
+        return json.loads(self.read_frame(frame)[line])
+
+    def range(self, first: str, last: str) -> Iterator[dict]:
+        """
+        Reads the tickets whose numbers sort between first and last,
+        inclusive, in number order; every frame is decompressed once.
+
+        Args:
+            first (str): The lowest ticket number.
+            last (str): The highest ticket number.
+
+        Yields:
+            dict: The records.
+        """
+        last_key = index_key(last)
+        frames = {}
+        position = self.search(index_key(first))
+        while position < self._count and self.key(position) <= last_key:
+            frame, line = self.entry(position)
+            if frame not in frames:
+                frames[frame] = self.read_frame(frame)
+            yield json.loads(frames[frame][line])
+            position += 1
+
+    def __iter__(self) -> Iterator[dict]:
+        """
+        Reads every record, in the order they were written.
+        """
+        self._file.seek(0)
+        with self._decompressor.stream_reader(
+            self._file, read_across_frames=True, closefd=False
+        ) as reader:
+            buffered = b""
+            while True:
+                chunk = reader.read(1 << 20)
+                if not chunk:
+                    break
+                lines = (buffered + chunk).split(b"\n")
+                buffered = lines.pop()
+                for line in lines:
+                    yield json.loads(line)
+
+    def close(self) -> None:
+        self._index.close()
+        self._file.close()
+
+
+def convert(month_file: Path) -> Path:
+    """
+    Converts a .json or .ndjson month file of the parser to a month archive.
+
+    Args:
+        month_file (Path): The month file.
+
+    Returns:
+        Path: The archive, next to the month file.
+    """
+    from local_transform import read_records
+
+    records = read_records(month_file.read_bytes(), month_file.suffix.lstrip("."))
+    path = month_file.with_name(month_file.name.split(".")[0] + ".ndjson.zst")
+    with MonthArchiveWriter(path) as writer:
+        for record in records:
+            writer.write(record)
+    return path
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("path", type=Path, help="month archive or month file")
+    arg_parser.add_argument("numbers", nargs="*", help="ticket numbers to read")
+    arg_parser.add_argument(
+        "--convert", action="store_true", help="convert a .json/.ndjson month file"
+    )
+    args = arg_parser.parse_args()
+
+    if args.convert:
+        print(convert(args.path))
+        return
+    with MonthArchive(args.path) as archive:
+        for number in args.numbers:
+            print(json.dumps(archive.get(number), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional
+
+from compact_records import dump_json
+from metrics import registry
+from parser_config import NDJSON_FLUSH_EVERY, PARQUET_ROW_GROUP_SIZE
+from parser_session import ParserSession
+from ticket_transform import PROCESSED_COLUMNS, transform_record
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is only needed for the parquet output
+    pa = pq = None
+
+# month file formats written record by record instead of dumped at once,
+# with the extension of their files
+STREAMING_FORMATS = {
+    "ndjson": "ndjson",
+    "parquet": "parquet",
+    "zstd": "ndjson.zst",
+}
+
+
+class NdjsonWriter:
+    def __init__(
+        self,
+        path: str,
+        flush_every: int = NDJSON_FLUSH_EVERY,
+        resume_from: Optional[int] = None,
+        on_flush: Optional[Callable[[int], None]] = None,
+    ) -> None:
+        """
+        Initializes a streaming writer of newline-delimited JSON records.
+
+        Records are appended to a "<path>.part" file as soon as they are
+        written and the file is flushed and fsynced every flush_every
+        records. The part file is atomically renamed to path on close, so a
+        file under its final name is always complete. If the writer is left
+        through an exception, the part file is kept as is.
+
+        Args:
+            path (str): The final path of the file.
+            flush_every (int): Number of records between flush/fsync calls.
+            resume_from (Optional[int]): Size of an existing part file to
+                continue from; anything written after that size is dropped.
+            on_flush (Optional[Callable[[int], None]]): Called after every
+                fsync with the durable size of the part file.
+        """
+        self.path = Path(path)
+        self.part_path = self.path.with_name(self.path.name + ".part")
+        self.flush_every = max(1, flush_every)
+        self.resume_from = resume_from
+        self.on_flush = on_flush
+        self.records_written = 0
+        self._file = None
+        self._flushed_size = 0
+
+    def __enter__(self) -> "NdjsonWriter":
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.flush()
+            self._file.close()
+
+    def open(self) -> None:
+        if self.resume_from is not None and self.part_path.exists():
+            os.truncate(self.part_path, self.resume_from)
+            self._flushed_size = self.resume_from
+            self._file = open(self.part_path, "a", encoding="utf8")
+        else:
+            self._file = open(self.part_path, "w", encoding="utf8")
+
+    def write(self, record: dict) -> None:
+        """
+        Appends one record to the part file.
+
+        Args:
+            record (dict): An amended ticket.
+        """
+        # one call per line, so that a flush never commits half a record
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.records_written += 1
+        if self.records_written % self.flush_every == 0:
+            self.flush()
+
+    def flush(self) -> None:
+        with registry.stage("write"):
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        size = os.fstat(self._file.fileno()).st_size
+        registry.add_bytes("write", size - self._flushed_size)
+        self._flushed_size = size
+        if self.on_flush is not None:
+            self.on_flush(size)
+
+    def close(self) -> None:
+        """
+        Flushes the remaining records and moves the file to its final name.
+        """
+        self.flush()
+        self._file.close()
+        os.replace(self.part_path, self.path)
+
+
+def processed_schema():
+    """
+    Returns the Arrow schema of the processed_parquet layout.
+
+    Spark reads file sources as nullable and stores its timestamps as INT96,
+    see ParquetWriter.
+    """
+    types = {
+        "current_deadline": pa.date32(),
+        "rating": pa.int32(),
+        "request_regdate": pa.timestamp("us"),
+        "request_moddate": pa.timestamp("us"),
+    }
+    return pa.schema(
+        [(column, types.get(column, pa.string())) for column in PROCESSED_COLUMNS]
+    )
+
+
+def spark_schema_json(schema) -> str:
+    """
+    Returns the Spark SQL schema stored by Spark in the Parquet footer, so
+    that Spark reads the files back with the types it would have written.
+    """
+    spark_types = {
+        pa.string(): "string",
+        pa.int32(): "integer",
+        pa.date32(): "date",
+        pa.timestamp("us"): "timestamp",
+    }
+    fields = [
+        {
+            "name": field.name,
+            "type": spark_types[field.type],
+            "nullable": True,
+            "metadata": {},
+        }
+        for field in schema
+    ]
+    return json.dumps({"type": "struct", "fields": fields}, separators=(",", ":"))
+
+
+class ParquetWriter:
+    def __init__(self, path: str, row_group_size: int = PARQUET_ROW_GROUP_SIZE) -> None:
+        """
+        Initializes a streaming writer of typed, processed Parquet records.
+
+        Every record goes through transform_record, the Python counterpart of
+        transform_spark, and a row group is written every row_group_size
+        records. The output has the layout of a Spark write: a directory
+        holding a snappy-compressed part file and a _SUCCESS marker, with
+        INT96 timestamps. It is built as "<path>.part" and renamed to path on
+        close, replacing an existing directory; if the writer is left through
+        an exception the part directory is kept as is.
+
+        Args:
+            path (str): The final path of the directory.
+            row_group_size (int): Number of records per row group.
+        """
+        if pa is None:
+            raise ImportError("ParquetWriter requires the pyarrow package")
+        self.path = Path(path)
+        self.part_path = self.path.with_name(self.path.name + ".part")
+        self.row_group_size = max(1, row_group_size)
+        self.schema = processed_schema().with_metadata(
+            {
+                "org.apache.spark.sql.parquet.row.metadata": spark_schema_json(
+                    processed_schema()
+                )
+            }
+        )
+        self.records_written = 0
+        self._rows: List[dict] = []
+        self._writer = None
+
+    def __enter__(self) -> "ParquetWriter":
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.flush()
+            self._writer.close()
+
+    def open(self) -> None:
+        shutil.rmtree(self.part_path, ignore_errors=True)
+        self.part_path.mkdir(parents=True)
+        self._writer = pq.ParquetWriter(
+            self.part_path / "part-00000.snappy.parquet",
+            self.schema,
+            compression="snappy",
+            use_deprecated_int96_timestamps=True,
+        )
+
+    def write(self, record: dict) -> None:
+        """
+        Transforms one record and buffers it for the current row group.
+
+        Args:
+            record (dict): An amended ticket.
+        """
+        self._rows.append(transform_record(record))
+        self.records_written += 1
+        if len(self._rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._rows:
+            return
+        with registry.stage("write"):
+            self._writer.write_table(
+                pa.Table.from_pylist(self._rows, schema=self.schema)
+            )
+        self._rows = []
+
+    def close(self) -> None:
+        """
+        Writes the last row group and moves the directory to its final name.
+        """
+        self.flush()
+        self._writer.close()
+        registry.add_bytes(
+            "write", sum(path.stat().st_size for path in self.part_path.iterdir())
+        )
+        (self.part_path / "_SUCCESS").touch()
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self.part_path, self.path)
+
+
+def open_month_writer(period: str, output_format: str, directory: str = "./data"):
+    """
+    Creates the streaming writer of a month file, in ./data by default.
+
+    Args:
+        period (str): The period of the month file.
+        output_format (str): One of STREAMING_FORMATS.
+        directory (str): The directory of the month file.
+
+    Returns:
+        NdjsonWriter, ParquetWriter or MonthArchiveWriter: The writer, not
+        yet opened.
+    """
+    extension = STREAMING_FORMATS[output_format]
+    filename = ParserSession.generate_filename(period, extension=extension)
+    path = f"{directory}/{filename}"
+    if output_format == "parquet":
+        return ParquetWriter(path)
+    if output_format == "zstd":
+        from month_archive import MonthArchiveWriter
+
+        return MonthArchiveWriter(path)
+    return NdjsonWriter(path)
+
+
+def write_month(
+    data: Iterable[Iterable[dict]],
+    period: str,
+    output_format: str,
+    directory: str = "./data",
+) -> None:
+    """
+    Writes the month file of a period, in ./data by default, from records
+    held in memory.
+
+    Args:
+        data (Iterable[Iterable[dict]]): The amended tickets, one list (or
+            CompactRecords) per subject.
+        period (str): The period of the month file.
+        output_format (str): "json" or one of STREAMING_FORMATS.
+        directory (str): The directory of the month file.
+    """
+    if output_format in STREAMING_FORMATS:
+        with open_month_writer(period, output_format, directory) as writer:
+            for records in data:
+                for record in records:
+                    writer.write(record)
+        return
+
+    filename = ParserSession.generate_filename(period=period)
+    path = f"{directory}/{filename}"
+    with registry.stage("write"), open(path, "w+", encoding="utf8") as f:
+        dump_json(data, f)
+    registry.add_bytes("write", os.path.getsize(path))
@@ -1,26 +1,122 @@
 import json
+import math
 import re
-from typing import Dict, List
-
-from bs4 import BeautifulSoup
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
 from tqdm import tqdm
 
+from checkpoint import CheckpointStore, ticket_key
+from compact_records import CompactRecords
+from listing_stream import ListingDecoder, read_ahead
+from logs.set_logger import logger
+from metrics import registry
+from output_writers import (
+    STREAMING_FORMATS,
+    NdjsonWriter,
+    open_month_writer,
+    write_month,
+)
 from parser_config import (
     AJAX_URL,
     DISTRICT_PATTERN,
     HOST_URL,
     LINK_PATTERN,
+    LISTING_EXTENT,
+    LISTING_GRID,
+    LISTING_READ_AHEAD_ROWS,
+    LISTING_STREAM_CHUNK_SIZE,
+    LISTING_TILE_MAX_DEPTH,
+    LISTING_TILE_MAX_TICKETS,
+    LISTING_ZOOM,
     MALFUNCTION_TYPE_PATTERN,
+    MAX_REQUESTS_PER_HOST,
+    MAX_WORKERS,
     PERFORMER_PATTERN,
+    REQUEST_TIMEOUT,
     TICKET_NUMBER_PATTERN,
 )
 from parser_session import ParserSession
-from protocol_constants import set_apls_headers, set_ticket_headers, set_ticket_payload
+from protocol_constants import (
+    get_payload_items,
+    set_apls_headers,
+    set_ticket_headers,
+    set_ticket_payload,
+)
+from ticket_extractors import SoupExtractor
+
+INFOTEXT_PATTERNS = {
+    "number": TICKET_NUMBER_PATTERN,
+    "district": DISTRICT_PATTERN,
+    "malfunction_type": MALFUNCTION_TYPE_PATTERN,
+    "performer": PERFORMER_PATTERN,
+    "request_link": LINK_PATTERN,
+}
+COMPILED_INFOTEXT_PATTERNS = {
+    field: re.compile(pattern) for field, pattern in INFOTEXT_PATTERNS.items()
+}
+# all fields in the order they appear in an INFOTEXT, matched in one pass;
+# only the gaps between the fields may span lines, the fields themselves
+# stop at a line break as their own patterns do
+INFOTEXT_REGEX = re.compile("(?s:.*?)".join(INFOTEXT_PATTERNS.values()))
+GEO_FIELDS = ("x", "y", "z")
+TICKET_COLUMNS = (*INFOTEXT_PATTERNS, *GEO_FIELDS)
+
+Extent = Tuple[float, float, float, float]
+
+
+def split_extent(extent: Extent, tiles: int) -> List[Extent]:
+    """
+    Splits a map extent into a tiles x tiles grid, row by row.
+
+    Args:
+        extent (Extent): min x, min y, max x and max y.
+        tiles (int): Number of tiles along each axis.
+
+    Returns:
+        List[Extent]: The extents of the tiles.
+    """
+    min_x, min_y, max_x, max_y = extent
+    width, height = (max_x - min_x) / tiles, (max_y - min_y) / tiles
+    return [
+        (
+            min_x + column * width,
+            min_y + row * height,
+            max_x if column == tiles - 1 else min_x + (column + 1) * width,
+            max_y if row == tiles - 1 else min_y + (row + 1) * height,
+        )
+        for row in range(tiles)
+        for column in range(tiles)
+    ]
+
+
+class SessionExpiredError(Exception):
+    """
+    Raised when the portal reports that the APEX session has expired.
+    """
 
 
 class Parser:
     def __init__(
-        self, session, cookies, p_instance, p_request, protected, salt
+        self,
+        session,
+        cookies,
+        p_instance,
+        p_request,
+        protected,
+        salt,
+        max_workers: int = MAX_WORKERS,
+        max_requests_per_host: int = MAX_REQUESTS_PER_HOST,
+        extractor=None,
+        archive=None,
+        controller=None,
+        listing_grid: int = LISTING_GRID,
+        stream_listing: bool = False,
     ) -> None:
         """
         Initializes a Parser object with session parameters, cookies, and other data.
@@ -32,6 +128,22 @@ class Parser:
             p_request (str): The p_request parameter used in the POST request payload.
             protected (str): The protected parameter used in the POST request payload.
             salt (str): The salt parameter used in the POST request payload.
+            max_workers (int): The number of ticket pages fetched concurrently.
+                A value of 1 keeps the sequential behaviour.
+            max_requests_per_host (int): The maximum number of in-flight
+                requests to a single host, regardless of max_workers.
+            extractor: The ticket page extractor (see ticket_extractors.py).
+                Defaults to the reference SoupExtractor.
+            archive: An optional ResponseArchive (see response_archive.py)
+                that keeps the raw listing and ticket page responses.
+            controller: An optional RateController (see rate_control.py)
+                that adapts concurrency and retries failed requests.
+            listing_grid (int): The listing of a subject is fetched as
+                listing_grid x listing_grid map tiles, max_workers at a time,
+                instead of one request for the whole extent (1).
+            stream_listing (bool): Decode listings as they are downloaded
+                and start fetching ticket pages from the first rows, instead
+                of after the whole listing (see listing_stream.py).
         """
         self.session = session
         self.cookies = cookies
@@ -39,7 +151,36 @@ class Parser:
         self.p_request = p_request
         self.protected = protected
         self.salt = salt
-        self.ticket_headers = {}
+        self.ticket_headers = set_ticket_headers(cookies)
+        self.apls_headers = set_apls_headers(cookies)
+        self.max_workers = max(1, max_workers)
+        self.max_requests_per_host = max(1, max_requests_per_host)
+        self._host_limits: Dict[str, threading.BoundedSemaphore] = {}
+        self._host_limits_lock = threading.Lock()
+        self.extractor = extractor or SoupExtractor()
+        self.archive = archive
+        self.controller = controller
+        self.listing_grid = max(1, listing_grid)
+        self.stream_listing = stream_listing
+
+    def _host_limit(self, url: str) -> threading.BoundedSemaphore:
+        """
+        Returns the semaphore that caps in-flight requests to the host of a URL.
+
+        Args:
+            url (str): The URL that is about to be requested.
+
+        Returns:
+            threading.BoundedSemaphore: The semaphore shared by all requests
+            to the same host.
+        """
+        host = urlsplit(url).netloc
+        with self._host_limits_lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(
+                    self.max_requests_per_host
+                )
+            return self._host_limits[host]
 
     def parse_ticket_html(self, html_doc: str) -> dict:
         """
@@ -52,50 +193,51 @@ class Parser:
             dict: A dictionary containing the extracted data, including
             status, dates, comments, and ratings.
         """
-        soup = BeautifulSoup(html_doc, "html.parser")
+        with registry.stage("parse"):
+            return self.extractor.extract(html_doc)
 
-        request_status = soup.select_one("div.current_problem_status > span")
-        request_status = request_status.contents[0].strip() if request_status else ""
-
-        request_status_date = soup.select_one("div.current_problem_status_date")
-        request_status_date = (
-            request_status_date.contents[0].strip() if request_status_date else ""
-        )
+    def request(
+        self, method: str, url: str, kind: str = "detail", **kwargs
+    ) -> requests.Response:
+        """
+        Sends a request with the session, through the rate controller if set.
 
-        user_comment = soup.select_one("div.t-Region-body > div:nth-child(2)")
-        user_comment = (
-            user_comment.contents[1].replace("\r", "").replace("\n", " ").strip()
-            if user_comment
-            else ""
-        )
+        Args:
+            method (str): The HTTP method.
+            url (str): The URL.
+            kind (str): "listing" or "detail", whose latencies the rate
+                controller tracks apart.
+            **kwargs: Extra arguments of requests.Session.request.
 
-        organization_comment = soup.select_one("div.t-Region-body > div:nth-child(3)")
-        organization_comment = (
-            organization_comment.contents[1].strip() if organization_comment else ""
+        Returns:
+            requests.Response: The response.
+        """
+        if self.controller is None:
+            return self.session.request(method, url, **kwargs)
+        return self.controller.request(
+            lambda: self.session.request(
+                method, url, timeout=REQUEST_TIMEOUT, **kwargs
+            ),
+            kind,
         )
 
-        request_regdate = soup.select_one("div.current_problem_regdate")
-        request_regdate = request_regdate.contents[1].strip() if request_regdate else ""
-
-        request_moddate = soup.select_one("div.current_problem_moddate")
-        request_moddate = request_moddate.contents[1].strip() if request_moddate else ""
-
-        rating = soup.find("input", {"id": "P35_RATING"})
-        rating = rating.get("value") if rating else None
+    def fetch_ticket_html(self, ticket: dict) -> str:
+        """
+        Fetches the HTML of a ticket page.
 
-        address = soup.select_one("span.current_problem_address")
-        address = address.contents[0].replace("\n", " ").strip() if address else ""
+        Args:
+            ticket (dict): A dictionary containing the link to a ticket page.
 
-        return {
-            "status": request_status,
-            "status_date": request_status_date,
-            "user_comment": user_comment,
-            "organization_comment": organization_comment,
-            "request_regdate": request_regdate,
-            "request_moddate": request_moddate,
-            "rating": rating,
-            "address": address,
-        }
+        Returns:
+            str: The HTML of the ticket page.
+        """
+        ticket_url = ticket["request_link"]
+        with self._host_limit(ticket_url), registry.stage("detail"):
+            r = self.request("GET", ticket_url, headers=self.apls_headers)
+        registry.add_bytes("detail", len(r.content))
+        if self.archive is not None:
+            self.archive.put_ticket_page(ticket["number"], r.text.encode("utf8"))
+        return r.text
 
     def fetch_ticket_info(self, ticket: dict) -> dict:
         """
@@ -107,9 +249,34 @@ class Parser:
         Returns:
             dict: A dictionary containing the extracted data
         """
-        ticket_url = ticket["request_link"]
-        r = self.session.get(url=ticket_url)
-        return self.parse_ticket_html(r.text)
+        return self.parse_ticket_html(self.fetch_ticket_html(ticket))
+
+    def iter_ticket_info(self, tickets: Iterable[dict]) -> Iterator[dict]:
+        """
+        Fetches ticket pages with a bounded pool of workers.
+
+        At most max_workers requests are in flight at any time and results
+        are yielded in the same order as the input tickets.
+
+        Args:
+            tickets (Iterable[dict]): Tickets containing links to ticket pages.
+
+        Yields:
+            dict: The extracted data of each ticket, in input order.
+        """
+        if self.max_workers == 1:
+            for ticket in tickets:
+                yield self.fetch_ticket_info(ticket)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            in_flight = deque()
+            for ticket in tickets:
+                if len(in_flight) >= self.max_workers:
+                    yield in_flight.popleft().result()
+                in_flight.append(executor.submit(self.fetch_ticket_info, ticket))
+            while in_flight:
+                yield in_flight.popleft().result()
 
     def get_amended_tickets(self, tickets: List[dict], category: dict) -> List[dict]:
         """
@@ -123,17 +290,51 @@ class Parser:
             List[dict]: A list of amended tickets.
 
         """
-        amended_tickets = []
+        return list(self.iter_amended_tickets(tickets, category))
 
-        self.session.headers.update(set_apls_headers(self.cookies))
-        for ticket in tqdm(tickets):
-            apl = self.fetch_ticket_info(ticket)
-            del ticket["request_link"]
+    def iter_amended_tickets(
+        self, tickets: Iterable[dict], category: dict
+    ) -> Iterator[dict]:
+        """
+        Amend tickets with ticket data and category, one at a time.
+
+        Args:
+            tickets (Iterable[dict]): Tickets to be amended with APL ticket;
+                a streamed listing is consumed as its rows arrive.
+            category (dict): A dictionary containing the category of each ticket.
+
+        Yields:
+            dict: The amended tickets, in input order.
+
+        """
+        # tickets handed to the workers whose page is not amended yet
+        pending = deque()
+
+        def submitted() -> Iterator[dict]:
+            for ticket in tqdm(tickets):
+                pending.append(ticket)
+                yield ticket
+
+        for apl in self.iter_ticket_info(submitted()):
+            yield self.amend_ticket(pending.popleft(), apl, category)
 
-            amended_ticket = {**ticket, **apl, **category}
-            amended_tickets.append(amended_ticket)
+    @staticmethod
+    def amend_ticket(ticket: dict, apl: dict, category: dict) -> dict:
+        """
+        Merge a listing ticket with its ticket page data and category.
 
-        return amended_tickets
+        Args:
+            ticket (dict): A ticket from the listing; its link is dropped.
+            apl (dict): The data extracted from the ticket page.
+            category (dict): A dictionary containing the category of the ticket.
+
+        Returns:
+            dict: The amended ticket.
+
+        """
+        with registry.stage("merge"):
+            del ticket["request_link"]
+            return {**ticket, **apl, **category}
 
     def extract_ticket_info(self, infotext: str) -> Dict[str, str]:
         """
@@ -146,67 +347,372 @@ class Parser:
             Dict[str, str]: A dictionary containing ticket information.
 
         """
-        number = re.search(TICKET_NUMBER_PATTERN, infotext)
-        district = re.search(DISTRICT_PATTERN, infotext)
-        malfunction_type = re.search(MALFUNCTION_TYPE_PATTERN, infotext)
-        performer = re.search(PERFORMER_PATTERN, infotext)
-        link = re.search(LINK_PATTERN, infotext)
+        return dict(zip(INFOTEXT_PATTERNS, self.extract_infotext_values(infotext)))
 
-        return {
-            "number": number.group(1) if number else None,
-            "district": district.group(1) if district else None,
-            "malfunction_type": malfunction_type.group(1) if malfunction_type else None,
-            "performer": performer.group(1) if performer else "",
-            "request_link": HOST_URL + link.group(1) if link else None,
-        }
+    @staticmethod
+    def extract_infotext_values(infotext: str) -> tuple:
+        """
+        Extract ticket information from the given string in a single pass.
+
+        An INFOTEXT lists its fields in a fixed order, so one scan with the
+        combined INFOTEXT_REGEX finds all of them. If the text does not
+        match that layout, every field is looked up with its own pattern.
+
+        Args:
+            infotext (str): A string containing ticket information.
+
+        Returns:
+            tuple: number, district, malfunction_type, performer and
+            request_link, in this order.
 
-    def parse_tickets(self, raw_tickets: dict) -> List[dict]:
         """
-        Parse raw ticket data into a list of ticket dictionaries.
+        match = INFOTEXT_REGEX.search(infotext)
+        if match:
+            number, district, malfunction_type, performer, link = match.groups()
+        else:
+            searches = [
+                pattern.search(infotext)
+                for pattern in COMPILED_INFOTEXT_PATTERNS.values()
+            ]
+            number, district, malfunction_type, performer, link = (
+                search.group(1) if search else None for search in searches
+            )
+
+        return (
+            number,
+            district,
+            malfunction_type,
+            performer if performer is not None else "",
+            HOST_URL + link if link is not None else None,
+        )
+
+    def parse_tickets_columnar(self, raw_tickets: dict) -> Dict[str, list]:
+        """
+        Parse raw ticket data into one list per field.
 
         Args:
             raw_tickets (dict): A dictionary containing raw ticket data.
 
         Returns:
-            List[dict]: A list of ticket dictionaries.
+            Dict[str, list]: The values of each field of TICKET_COLUMNS, in
+            row order.
 
         """
-        tickets = []
+        columns = {field: [] for field in TICKET_COLUMNS}
+        info_columns = [columns[field].append for field in INFOTEXT_PATTERNS]
+        geo_columns = [(field, columns[field].append) for field in GEO_FIELDS]
         for raw_ticket in raw_tickets["row"]:
-            infotext = raw_ticket["INFOTEXT"]
+            values = self.extract_infotext_values(raw_ticket["INFOTEXT"])
+            for append, value in zip(info_columns, values):
+                append(value)
             geo_params = raw_ticket["GEOMETRY"]["sdo_point"]
+            for field, append in geo_columns:
+                append(geo_params.get(field))
 
-            infotext_params = self.extract_ticket_info(infotext)
-            infotext_params.update(geo_params)
+        return columns
 
-            tickets.append(infotext_params)
+    def parse_ticket(self, raw_ticket: dict) -> dict:
+        """
+        Parse one row of the listing into a ticket dictionary.
 
-        return tickets
+        Args:
+            raw_ticket (dict): A row of raw ticket data.
+
+        Returns:
+            dict: The ticket, with the fields of TICKET_COLUMNS.
 
-    def fetch_ticket_data(self, payload: dict) -> List[dict]:
+        """
+        geo_params = raw_ticket["GEOMETRY"]["sdo_point"]
+        return dict(
+            zip(
+                TICKET_COLUMNS,
+                (
+                    *self.extract_infotext_values(raw_ticket["INFOTEXT"]),
+                    *(geo_params.get(field) for field in GEO_FIELDS),
+                ),
+            )
+        )
+
+    def parse_tickets(self, raw_tickets: dict) -> List[dict]:
+        """
+        Parse raw ticket data into a list of ticket dictionaries.
+
+        Args:
+            raw_tickets (dict): A dictionary containing raw ticket data.
+
+        Returns:
+            List[dict]: A list of ticket dictionaries.
+
+        """
+        columns = self.parse_tickets_columnar(raw_tickets)
+        return [dict(zip(TICKET_COLUMNS, row)) for row in zip(*columns.values())]
+
+    def fetch_ticket_data(self, payload: dict, keep_response: bool = True) -> dict:
         """
         Fetch ticket data using the given payload.
 
         Args:
             payload (dict): A dictionary containing request data.
+            keep_response (bool): Store the response in the archive, if any.
 
         Returns:
             List[dict]: A list of ticket dictionaries.
 
         Raises:
-            Exception: If the session has expired.
+            SessionExpiredError: If the session has expired.
 
         """
-        r = self.session.post(url=AJAX_URL, data=payload)
+        with registry.stage("listing"):
+            r = self.request(
+                "POST",
+                AJAX_URL,
+                kind="listing",
+                data=payload,
+                headers=self.ticket_headers,
+            )
+        registry.add_bytes("listing", len(r.content))
         ticket_data: list[dict] = r.json()
+        try:
+            self.check_ticket_data(ticket_data)
+        except SessionExpiredError:
+            if self.controller is not None:
+                self.controller.on_session_expired()
+            raise
+        # only a valid listing is archived, --offline replays it
+        if self.archive is not None and keep_response:
+            items = get_payload_items(payload)
+            self.archive.put_listing(
+                items["P19_PERIOD"], items["P19_SUBJECT"], r.content
+            )
+        return ticket_data
+
+    def stream_ticket_rows(self, payload: dict) -> Iterator[dict]:
+        """
+        Fetch ticket data using the given payload, decoding the rows as the
+        response arrives.
+
+        The response is read until its first row before returning, so an
+        expired session is reported by this call rather than by the
+        iteration; the rest is read by a background thread, independently
+        of how fast the rows are consumed. The archive, if any, gets the
+        body once it is complete and checked.
+
+        Args:
+            payload (dict): A dictionary containing request data.
+
+        Returns:
+            Iterator[dict]: The raw rows of the listing.
+
+        Raises:
+            SessionExpiredError: If the session has expired.
+
+        """
+        with registry.stage("listing"):
+            r = self.request(
+                "POST",
+                AJAX_URL,
+                kind="listing",
+                data=payload,
+                headers=self.ticket_headers,
+                stream=True,
+            )
+
+        def rows() -> Iterator[dict]:
+            decoder = ListingDecoder()
+            body = [] if self.archive is not None else None
+            with r:
+                for chunk in r.iter_content(LISTING_STREAM_CHUNK_SIZE):
+                    registry.add_bytes("listing", len(chunk))
+                    if body is not None:
+                        body.append(chunk)
+                    yield from decoder.feed(chunk)
+            yield from decoder.close()
+            try:
+                self.check_ticket_data(decoder.members)
+            except SessionExpiredError:
+                if self.controller is not None:
+                    self.controller.on_session_expired()
+                raise
+            if body is not None:
+                items = get_payload_items(payload)
+                self.archive.put_listing(
+                    items["P19_PERIOD"], items["P19_SUBJECT"], b"".join(body)
+                )
+
+        rows = rows()
+        first = next(rows, None)
+        if first is None:
+            return iter(())
+        # the rest is downloaded while the first tickets are fetched
+        return chain([first], read_ahead(rows, LISTING_READ_AHEAD_ROWS))
+
+    @staticmethod
+    def check_ticket_data(ticket_data: dict) -> dict:
+        """
+        Checks that an AJAX response does not report an expired session.
+
+        Args:
+            ticket_data (dict): The decoded AJAX response.
+
+        Returns:
+            dict: The same response, if the session is still valid.
+
+        Raises:
+            SessionExpiredError: If the session has expired.
+
+        """
         if "Your session has expired" in ticket_data.values():
-            raise Exception(
+            raise SessionExpiredError(
                 "Your session has expired. You need to update your session params"
             )
 
         return ticket_data
 
-    def fetch_period_tickets(self, period: str, subjects: dict) -> List[dict]:
+    def fetch_subject_tickets(self, period: str, subject: str) -> List[dict]:
+        """
+        Fetch and parse the ticket listing of one subject.
+
+        Args:
+            period (str): A string representing the period for which to fetch tickets.
+            subject (str): The subject for which to fetch tickets.
+
+        Returns:
+            List[dict]: A list of ticket dictionaries, not yet amended.
+
+        """
+        if self.listing_grid > 1:
+            return self.fetch_tiled_tickets(period, subject)
+        payload = set_ticket_payload(
+            protected=self.protected,
+            salt=self.salt,
+            p_instance=self.p_instance,
+            p_request=self.p_request,
+            period=period,
+            subject=subject,
+        )
+        ticket_data = self.fetch_ticket_data(payload)
+        return self.parse_tickets(ticket_data)
+
+    def stream_subject_tickets(self, period: str, subject: str) -> Iterator[dict]:
+        """
+        Fetch the ticket listing of one subject, parsing every ticket as
+        soon as its row is downloaded.
+
+        Args:
+            period (str): A string representing the period for which to fetch tickets.
+            subject (str): The subject for which to fetch tickets.
+
+        Returns:
+            Iterator[dict]: The tickets, not yet amended.
+
+        Raises:
+            SessionExpiredError: If the session has expired.
+
+        """
+        payload = set_ticket_payload(
+            protected=self.protected,
+            salt=self.salt,
+            p_instance=self.p_instance,
+            p_request=self.p_request,
+            period=period,
+            subject=subject,
+        )
+        return map(self.parse_ticket, self.stream_ticket_rows(payload))
+
+    def iter_subject_tickets(self, period: str, subject: str) -> Iterable[dict]:
+        """
+        Fetch the ticket listing of one subject, streamed if stream_listing
+        is set and the listing is not tiled.
+        """
+        if self.stream_listing and self.listing_grid == 1:
+            return self.stream_subject_tickets(period, subject)
+        return self.fetch_subject_tickets(period, subject)
+
+    def fetch_tile_rows(
+        self, period: str, subject: str, extent: Extent, zoom: int
+    ) -> List[dict]:
+        """
+        Fetch the raw listing rows of one map tile.
+        """
+        payload = set_ticket_payload(
+            protected=self.protected,
+            salt=self.salt,
+            p_instance=self.p_instance,
+            p_request=self.p_request,
+            period=period,
+            subject=subject,
+            extent=extent,
+            zoom=zoom,
+        )
+        return self.fetch_ticket_data(payload, keep_response=False)["row"]
+
+    def fetch_tiled_tickets(self, period: str, subject: str) -> List[dict]:
+        """
+        Fetch and parse the ticket listing of one subject tile by tile.
+
+        The listing extent is split into listing_grid x listing_grid tiles
+        fetched in parallel. A tile returning LISTING_TILE_MAX_TICKETS
+        tickets or more is fetched again as four smaller tiles, one zoom
+        level deeper, so that no single response grows with the subject.
+        Tickets on the border of two tiles are kept once, in tile order. The
+        archive, if any, keeps the merged rows as the listing of the subject.
+
+        Args:
+            period (str): A string representing the period for which to fetch tickets.
+            subject (str): The subject for which to fetch tickets.
+
+        Returns:
+            List[dict]: A list of ticket dictionaries, not yet amended.
+
+        """
+        tiles: Dict[tuple, List[dict]] = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {}
+
+            def submit(path: tuple, extent: Extent, zoom: int) -> None:
+                future = executor.submit(
+                    self.fetch_tile_rows, period, subject, extent, zoom
+                )
+                futures[future] = (path, extent, zoom)
+
+            zoom = LISTING_ZOOM + int(math.log2(self.listing_grid))
+            for index, extent in enumerate(
+                split_extent(LISTING_EXTENT, self.listing_grid)
+            ):
+                submit((index,), extent, zoom)
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, extent, zoom = futures.pop(future)
+                    rows = future.result()
+                    if (
+                        len(rows) >= LISTING_TILE_MAX_TICKETS
+                        and len(path) <= LISTING_TILE_MAX_DEPTH
+                    ):
+                        logger.debug(
+                            f"Subject {subject}: splitting tile {path} "
+                            f"of {len(rows)} tickets"
+                        )
+                        for index, child in enumerate(split_extent(extent, 2)):
+                            submit(path + (index,), child, zoom + 1)
+                    else:
+                        tiles[path] = rows
+
+        rows, tickets, seen = [], [], set()
+        for path in sorted(tiles):
+            tile_rows = tiles[path]
+            for row, ticket in zip(tile_rows, self.parse_tickets({"row": tile_rows})):
+                if ticket["number"] is None or ticket["number"] not in seen:
+                    seen.add(ticket["number"])
+                    rows.append(row)
+                    tickets.append(ticket)
+        logger.debug(f"Subject {subject}: {len(tickets)} tickets in {len(tiles)} tiles")
+        if self.archive is not None:
+            body = json.dumps({"row": rows}, ensure_ascii=False).encode("utf8")
+            self.archive.put_listing(period, subject, body)
+        return tickets
+
+    def fetch_period_tickets(self, period: str, subjects: dict) -> List[CompactRecords]:
         """
         Fetch tickets for the given period and subjects.
 
@@ -215,56 +721,162 @@ class Parser:
             subjects (dict): dict containing the subjects for which to fetch tickets.
 
         Returns:
-            List[dict]: A list of ticket dictionaries.
+            List[CompactRecords]: The amended tickets, one CompactRecords per
+            subject.
 
         """
-        payloads = [
-            set_ticket_payload(
-                protected=self.protected,
-                salt=self.salt,
-                p_instance=self.p_instance,
-                p_request=self.p_request,
-                period=period,
-                subject=subject,
-            )
-            for subject in subjects
-        ]
-
-        tickets_for_period: List[dict] = []
-        self.session.headers.update(self.ticket_headers)
-        for subject, payload in zip(subjects, payloads):
-            ticket_data = self.fetch_ticket_data(payload)
-            ticket_content = self.parse_tickets(ticket_data)
+        tickets_for_period: List[CompactRecords] = []
+        for subject in subjects:
+            ticket_content = self.iter_subject_tickets(period, subject)
             category = {"category": subjects[subject]}
-            amended_apls = self.get_amended_tickets(ticket_content, category)
+            amended_apls = CompactRecords(
+                self.iter_amended_tickets(ticket_content, category)
+            )
             tickets_for_period.append(amended_apls)
 
         return tickets_for_period
 
-    def parse(self, periods: list, subjects: dict) -> None:
+    def iter_period_tickets(self, period: str, subjects: dict) -> Iterator[dict]:
+        """
+        Fetch tickets for the given period and subjects, one at a time.
+
+        Args:
+            period (str): A string representing the period for which to fetch tickets.
+            subjects (dict): dict containing the subjects for which to fetch tickets.
+
+        Yields:
+            dict: The amended tickets, subject after subject.
+
+        """
+        for subject in subjects:
+            ticket_content = self.iter_subject_tickets(period, subject)
+            category = {"category": subjects[subject]}
+            yield from self.iter_amended_tickets(ticket_content, category)
+
+    def parse(
+        self,
+        periods: list,
+        subjects: dict,
+        output_format: str = "json",
+        checkpoint: Optional[CheckpointStore] = None,
+    ) -> None:
         """
         Parse ticket data for the given periods and subjects.
 
         Args:
             periods (list): representing the periods for which to parse data.
             subjects (dict): dict containing the subjects for which to parse data.
+            output_format (str): "json" dumps each month as one JSON array;
+                "ndjson" streams every record to disk as soon as it is amended,
+                "parquet" streams typed, processed records (see
+                ticket_transform.py) in row groups and "zstd" streams them to
+                a seekable compressed archive (see month_archive.py).
+            checkpoint (Optional[CheckpointStore]): Progress store used to
+                resume an interrupted run; requires the "ndjson" output.
 
         """
-        self.ticket_headers = set_ticket_headers(self.cookies)
         for period in tqdm(periods):
-            data = self.fetch_period_tickets(period, subjects)
-            self.dump_to_file(data=data, period=period)
+            if checkpoint is not None:
+                self.resume_to_file(period, subjects, checkpoint)
+            elif output_format in STREAMING_FORMATS:
+                self.stream_to_file(period, subjects, output_format)
+            else:
+                data = self.fetch_period_tickets(period, subjects)
+                self.dump_to_file(data=data, period=period)
+
+    def stream_to_file(
+        self, period: str, subjects: dict, output_format: str = "ndjson"
+    ) -> None:
+        """
+        Stream ticket data to a newline-delimited JSON or Parquet file.
+
+        Args:
+            period (str): str representing the period for which the data is being dumped
+            subjects (dict): dict containing the subjects for which to fetch tickets.
+            output_format (str): "ndjson", "parquet" or "zstd".
+
+        """
+        with open_month_writer(period, output_format) as writer:
+            for record in self.iter_period_tickets(period, subjects):
+                writer.write(record)
+
+    def resume_to_file(
+        self, period: str, subjects: dict, checkpoint: CheckpointStore
+    ) -> None:
+        """
+        Stream ticket data to a newline-delimited JSON file, resuming from
+        the progress recorded in a checkpoint store.
 
-    def dump_to_file(self, data: List[dict], period: str) -> None:
+        Completed subjects are skipped and tickets already written are not
+        fetched again. The part file is truncated to its last committed size,
+        which drops any record written after the last durable flush.
+
+        Args:
+            period (str): str representing the period for which the data is being dumped
+            subjects (dict): dict containing the subjects for which to fetch tickets.
+            checkpoint (CheckpointStore): The progress store.
+
+        """
+        if checkpoint.is_period_done(period):
+            logger.info(f"Skipping completed period {period}")
+            return
+
+        pending: List[str] = []
+
+        def commit(size: int) -> None:
+            checkpoint.commit(period, pending, size)
+            pending.clear()
+
+        filename = ParserSession.generate_filename(period=period, extension="ndjson")
+        writer = NdjsonWriter(
+            f"./data/{filename}",
+            resume_from=checkpoint.committed_size(period),
+            on_flush=commit,
+        )
+        if (
+            writer.resume_from is not None
+            and writer.path.exists()
+            and not writer.part_path.exists()
+        ):
+            # the part file was completed and renamed, but the run stopped
+            # before the period was recorded as done
+            logger.info(f"Skipping completed period {period}")
+            checkpoint.mark_period_done(period)
+            return
+        with writer:
+            for subject in subjects:
+                if checkpoint.is_unit_done(period, subject):
+                    continue
+                tickets = self.fetch_subject_tickets(period, subject)
+                checkpoint.mark_listed(period, subject, len(tickets))
+                amended = checkpoint.amended_numbers(period)
+                keys = [
+                    ticket_key(subject, position, ticket.get("number"))
+                    for position, ticket in enumerate(tickets)
+                ]
+                tickets = [t for t, key in zip(tickets, keys) if key not in amended]
+                keys = [key for key in keys if key not in amended]
+                category = {"category": subjects[subject]}
+                records = self.iter_amended_tickets(tickets, category)
+                for key, record in zip(keys, records):
+                    # a write can flush and commit, so the key goes first
+                    pending.append(key)
+                    writer.write(record)
+                writer.flush()
+                checkpoint.mark_unit_done(period, subject)
+        checkpoint.mark_period_done(period)
+
+    def dump_to_file(
+        self, data: List[dict], period: str, output_format: str = "json"
+    ) -> None:
         """
         Dump ticket data to a file.
 
         Args:
-            data (List[dict]): A list of ticket dictionaries.
+            data (List[dict]): The amended tickets, one list (or CompactRecords)
+                per subject.
             period (str): str representing the period for which the data is being dumped
+            output_format (str): "json" or a streaming format, as in parse.
 
         """
-        filename = ParserSession.generate_filename(period=period)
-        path = f"./data/{filename}"
-        with open(path, "w+", encoding="utf8") as f:
-            json.dump(data, f, ensure_ascii=False)
+        write_month(data, period, output_format)
@@ -1,3 +1,5 @@
+import os
+
 import requests
 
 requests.packages.urllib3.disable_warnings()
@@ -9,9 +11,140 @@ try:
 except AttributeError:
     pass
 
-ENTRYPOINT_URL = "https://115.xn--90ais/portal/f?p=10901:"
-HOST_URL = "https://115.xn--90ais/portal/"
-AJAX_URL = "https://115.xn--90ais/portal/wwv_flow.ajax"
+# the portal can be replaced by a local stand-in, e.g. the replay server of
+# the benchmarks: PORTAL_URL=http://127.0.0.1:8115/ python main.py
+HOST_URL = os.environ.get("PORTAL_URL", "https://115.xn--90ais/portal/")
+ENTRYPOINT_URL = HOST_URL + "f?p=10901:"
+AJAX_URL = HOST_URL + "wwv_flow.ajax"
+
+# politeness cap for in-flight requests to a single host and the number of
+# ticket pages fetched concurrently; every ticket page is on the portal
+# host, so more workers than the cap would only wait for it
+MAX_REQUESTS_PER_HOST = 4
+MAX_WORKERS = MAX_REQUESTS_PER_HOST
+
+# number of requests kept in flight by the asyncio engine
+MAX_IN_FLIGHT = 200
+
+# processes parsing ticket pages and the size of the queues between the
+# fetch, parse and write stages of the pipeline engine
+PARSE_WORKERS = os.cpu_count() or 1
+PIPELINE_QUEUE_SIZE = 64
+
+# map extent of the FOIDATA listing (EPSG:3857 metres: min x, min y, max x,
+# max y) and its zoom level, as sent by the map of the portal
+LISTING_EXTENT = (
+    3103495.265163666,
+    7141386.464106095,
+    3150255.616417175,
+    7210179.788385880,
+)
+LISTING_ZOOM = 11
+# the listing extent can be split into LISTING_GRID x LISTING_GRID tiles,
+# each fetched by its own request; a tile returning at least
+# LISTING_TILE_MAX_TICKETS tickets is split in four, down to
+# LISTING_TILE_MAX_DEPTH levels below the grid
+LISTING_GRID = 1
+LISTING_TILE_MAX_TICKETS = 2000
+LISTING_TILE_MAX_DEPTH = 4
+# bytes read at a time from a streamed listing response and the decoded
+# rows read ahead of the ticket page fetches, above the size of a listing
+# so that its download never waits for them
+LISTING_STREAM_CHUNK_SIZE = 64 * 1024
+LISTING_READ_AHEAD_ROWS = 100000
+
+# number of records between flush/fsync calls of the streaming writers
+NDJSON_FLUSH_EVERY = 500
+
+# number of records per row group of the parquet output
+PARQUET_ROW_GROUP_SIZE = 10000
+
+# number of records per independently decompressible zstd frame of the
+# month archives and their compression level
+ARCHIVE_FRAME_RECORDS = 256
+ARCHIVE_ZSTD_LEVEL = 9
+
+# month files smaller than this are transformed without Spark
+LOCAL_TRANSFORM_MAX_BYTES = 512 * 1024 * 1024
+
+# zoom level of the Web Mercator tiles of the geo index (about 1.4 km wide
+# in Minsk) and the number of tickets per row group of its files
+GEO_TILE_ZOOM = 14
+GEO_INDEX_ROW_GROUP_SIZE = 4096
+
+# SQLite database recording the progress of resumable scrapes
+CHECKPOINT_PATH = "./data/checkpoint.sqlite3"
+
+# state index and status change log of incremental refreshes; tickets in
+# the closed status are not fetched again
+STATE_INDEX_PATH = "./data/ticket_state.sqlite3"
+CHANGELOG_PATH = "./data/status_changes.ndjson"
+CLOSED_STATUS = "Заявка закрыта"
+
+# independent APEX sessions used by the requests engine, the file caching
+# their bootstrap parameters between processes, the age after which cached
+# parameters are not reused and the retries of a call after a session expiry
+SESSION_POOL_SIZE = 1
+SESSION_CACHE_PATH = "./data/sessions.json"
+SESSION_CACHE_TTL = 30 * 60
+SESSION_RETRIES = 2
+
+# number of tickets fetched by one task of the backfill scheduler, the
+# months it scrapes at once (each held in memory until written) and the
+# retries of a failed listing or chunk before its month is given up
+BACKFILL_CHUNK_SIZE = 50
+BACKFILL_MONTHS_IN_FLIGHT = 2
+BACKFILL_RETRIES = 2
+
+# shared work queue of distributed scrapes: its SQLite database, the HTTP
+# interface and port it is served on by the coordinator and the token its
+# clients must send (from the environment, required to serve beyond this
+# host), the tickets per detail batch, the lease of an item (in seconds),
+# its deliveries before it is marked failed and the polling interval of
+# idle workers
+WORK_QUEUE_PATH = "./data/work_queue.sqlite3"
+WORK_QUEUE_HOST = "127.0.0.1"
+WORK_QUEUE_PORT = 8116
+WORK_QUEUE_TOKEN = os.environ.get("WORK_QUEUE_TOKEN")
+WORK_BATCH_SIZE = 50
+WORK_LEASE_SECONDS = 300
+WORK_MAX_ATTEMPTS = 5
+WORK_POLL_INTERVAL = 2.0
+
+# Airflow DAG of dags/scrape_month_dag.py: the pool limiting the subjects
+# scraped at once, the retries of a failed subject and the delay before the
+# first one (in seconds), the raw bucket and prefix read by
+# data_processing_spark.py, the prefix staging the per-subject part files in
+# that bucket and the connections used to upload the files and submit the
+# transform
+AIRFLOW_POOL = "115bel_portal"
+AIRFLOW_SUBJECT_RETRIES = 3
+AIRFLOW_RETRY_DELAY = 300
+RAW_BUCKET = "115bel"
+RAW_PREFIX = "from_parser"
+AIRFLOW_PARTS_PREFIX = "parser_parts"
+AIRFLOW_AWS_CONN_ID = "aws_default"
+AIRFLOW_SPARK_CONN_ID = "spark_default"
+
+# adaptive rate control: starting and highest number of in-flight requests,
+# allowed ratio of the smoothed latency to the baseline (lowest) one and the
+# fraction of the gap to a slower request by which the baseline rises,
+# timeout of one request and retries with jittered exponential backoff (in
+# seconds)
+ADAPTIVE_INITIAL_LIMIT = 4
+ADAPTIVE_MAX_LIMIT = 64
+ADAPTIVE_LATENCY_TOLERANCE = 3.0
+ADAPTIVE_BASELINE_DECAY = 0.01
+REQUEST_TIMEOUT = 60
+REQUEST_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+
+# latency histogram buckets of the per-stage metrics (in seconds), the
+# JSON metrics file and the seconds between its snapshots
+METRICS_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+METRICS_PATH = "./data/metrics.json"
+METRICS_FILE_INTERVAL = 15
 
 
 def get_configured_subjects() -> dict:
@@ -41,55 +174,6 @@ def get_configured_subjects() -> dict:
     }
 
 
-# historical list of periods
-# periods = [
-# "Вторник, 01 Январь, 2019",
-# "Пятница, 01 Февраль, 2019",
-# "Пятница, 01 Март, 2019",
-# "Понедельник, 01 Апрель, 2019",
-# "Среда, 01 Май, 2019",
-# "Суббота, 01 Июнь, 2019",
-# "Понедельник, 01 Июль, 2019",
-# "Четверг, 01 Август, 2019",
-# "Воскресенье, 01 Сентябрь, 2019",
-# "Вторник, 01 Октябрь, 2019",
-# "Пятница, 01 Ноябрь, 2019",
-# "Воскресенье, 01 Декабрь, 2019",
-# "Суббота, 01 Февраль, 2020",
-# "Воскресенье, 01 Март, 2020",
-# "Среда, 01 Апрель, 2020",
-# "Пятница, 01 Май, 2020",
-# "Понедельник, 01 Июнь, 2020",
-# "Среда, 01 Июль, 2020",
-# "Суббота, 01 Август, 2020",
-# "Вторник, 01 Сентябрь, 2020",
-# "Четверг, 01 Октябрь, 2020",
-# "Воскресенье, 01 Ноябрь, 2020",
-# "Вторник, 01 Декабрь, 2020",
-# 'Пятница, 01 Январь, 2021',
-# 'Понедельник, 01 Февраль, 2021',
-# 'Понедельник, 01 Март, 2021',
-# 'Четверг, 01 Апрель, 2021',
-# 'Суббота, 01 Май, 2021',
-# 'Вторник, 01 Июнь, 2021',
-# 'Четверг, 01 Июль, 2021',
-# 'Воскресенье, 01 Август, 2021',
-# 'Среда, 01 Сентябрь, 2021',
-# 'Пятница, 01 Октябрь, 2021',
-# 'Понедельник, 01 Ноябрь, 2021',
-# "Среда, 01 Декабрь, 2021",
-# "Суббота, 01 Январь, 2022",
-# "Вторник, 01 Февраль, 2022",
-# "Вторник, 01 Март, 2022",
-# "Пятница, 01 Апрель, 2022",
-# "Воскресенье, 01 Май, 2022",
-# "Среда, 01 Июнь, 2022",
-# "Пятница, 01 Июль, 2022",
-# "Понедельник, 01 Август, 2022",
-# "Четверг, 01 Сентябрь, 2022",
-# "Суббота, 01 Октябрь, 2022",
-# ]
-
 RUSSIAN_WEEKDAYS = {
     0: "Понедельник",
     1: "Вторник",
@@ -1,10 +1,12 @@
 import re
 from datetime import date, timedelta
+from typing import List
 
 import requests
 from bs4 import BeautifulSoup
 
 from logs.set_logger import logger
+from metrics import registry
 from parser_config import (
     ENTRYPOINT_URL,
     HOST_URL,
@@ -36,7 +38,20 @@ class ParserSession:
             cookiesJar (RequestsCookieJar): The cookies object to set.
         """
         cookies_dict = requests.utils.dict_from_cookiejar(value)
-        self._cookies = f'ORA_WWV_APP_10901={cookies_dict["ORA_WWV_APP_10901"]}; ORA_WWV_RAC_INSTANCE=2'  # noqa: E501
+        self._cookies = self.format_cookies(cookies_dict["ORA_WWV_APP_10901"])
+
+    @staticmethod
+    def format_cookies(app_cookie: str) -> str:
+        """
+        Formats the Cookie header value sent with every portal request.
+
+        Args:
+            app_cookie (str): The value of the ORA_WWV_APP_10901 cookie.
+
+        Returns:
+            str: The Cookie header value.
+        """
+        return f"ORA_WWV_APP_10901={app_cookie}; ORA_WWV_RAC_INSTANCE=2"
 
     def get_payload(self) -> dict:
         """
@@ -45,13 +60,14 @@ class ParserSession:
         Returns:
             dict: A dictionary that contains the payload parameters.
         """
-        r = self.session.get(url=ENTRYPOINT_URL)
-        # TODO: Separate the logic of initializing the cookies and
-        # retrieving the payload into separate methods.
-        self.cookies = r.cookies
-        logger.debug("Cookies were initialized")
-        url_map = self.retrieve_url_map(r.text)
-        payload_params = self.retrieve_payload_params(url_map)
+        with registry.stage("bootstrap"):
+            r = self.session.get(url=ENTRYPOINT_URL)
+            # TODO: Separate the logic of initializing the cookies and
+            # retrieving the payload into separate methods.
+            self.cookies = r.cookies
+            logger.debug("Cookies were initialized")
+            url_map = self.retrieve_url_map(r.text)
+            payload_params = self.retrieve_payload_params(url_map)
         logger.debug("ParserSesssion payload params were received")
         return payload_params
 
@@ -66,7 +82,20 @@ class ParserSession:
             dict: A dictionary that contains the payload parameters.
         """
         r = self.session.get(url=url_map)
-        soup = BeautifulSoup(r.text, "html.parser")
+        return self.extract_payload_params(r.text)
+
+    @staticmethod
+    def extract_payload_params(html_doc: str) -> dict:
+        """
+        Extracts the payload parameters from the HTML of the map page.
+
+        Args:
+            html_doc (str): The HTML of the map page.
+
+        Returns:
+            dict: A dictionary that contains the payload parameters.
+        """
+        soup = BeautifulSoup(html_doc, "html.parser")
 
         protected = soup.select_one("#pPageItemsProtected")["value"]
         p_instance = soup.select_one("#pInstance")["value"]
@@ -84,7 +113,8 @@ class ParserSession:
             "salt": salt,
         }
 
-    def retrieve_url_map(self, response_text: str) -> str:
+    @staticmethod
+    def retrieve_url_map(response_text: str) -> str:
         """
         Extracts the URL map.
 
@@ -102,12 +132,13 @@ class ParserSession:
         return url_map
 
     @staticmethod
-    def generate_filename(period: str) -> str:
+    def generate_filename(period: str, extension: str = "json") -> str:
         """
         Generate a filename in the format "YYYY_month.json" for a given period string.
 
         Args:
             period (str): period in the format "Weekday, 01 Month, YYYY".
+            extension (str): The file extension, "json" by default.
 
         Returns:
             str: A string representing the filename, in the format "YYYY_month.json"
@@ -121,7 +152,7 @@ class ParserSession:
         if not eng_month:
             raise ValueError(f"No translation found for month '{ru_month}'")
 
-        return f"{year}_{eng_month.lower()}.json"
+        return f"{year}_{eng_month.lower()}.{extension}"
 
     @staticmethod
     def generate_template_date(input_date: date) -> str:
@@ -137,8 +168,40 @@ class ParserSession:
         first_day_prev_month = (input_date.replace(day=1) - timedelta(days=1)).replace(
             day=1
         )
-        ru_day_of_week = RUSSIAN_WEEKDAYS[first_day_prev_month.weekday()]
-        ru_month = RUSSIAN_MONTHS[first_day_prev_month.month]
+        return ParserSession.format_period(first_day_prev_month)
+
+    @staticmethod
+    def format_period(first_day: date) -> str:
+        """
+        Format the first day of a month as a period string in Russian.
+
+        Args:
+            first_day (date): The first day of the month.
+
+        Returns:
+            str: The period in the format "Weekday, 01 Month, YYYY".
+        """
+        ru_day_of_week = RUSSIAN_WEEKDAYS[first_day.weekday()]
+        ru_month = RUSSIAN_MONTHS[first_day.month]
 
-        formatted_date = f"{ru_day_of_week}, {first_day_prev_month:%d} {ru_month}, {first_day_prev_month:%Y}"  # noqa: E501
+        formatted_date = f"{ru_day_of_week}, {first_day:%d} {ru_month}, {first_day:%Y}"
         return formatted_date
+
+    @staticmethod
+    def generate_periods(start: date, end: date) -> List[str]:
+        """
+        Generate the period strings of every month from start to end, inclusive.
+
+        Args:
+            start (date): Any day of the first month.
+            end (date): Any day of the last month.
+
+        Returns:
+            List[str]: The periods in chronological order.
+        """
+        periods = []
+        month = start.replace(day=1)
+        while month <= end:
+            periods.append(ParserSession.format_period(month))
+            month = (month + timedelta(days=32)).replace(day=1)
+        return periods
@@ -0,0 +1,246 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from parser import Parser
+from typing import Callable, Dict, List, Tuple
+
+from tqdm import tqdm
+
+from compact_records import CompactRecords
+from logs.set_logger import logger
+from metrics import registry
+from output_writers import STREAMING_FORMATS, open_month_writer
+from parser_config import MAX_WORKERS, PARSE_WORKERS, PIPELINE_QUEUE_SIZE
+
+_worker_extractor = None
+
+
+def init_parse_worker(extractor_class: type) -> None:
+    """
+    Creates the extractor of a parse worker process once, at start-up.
+
+    Args:
+        extractor_class (type): The extractor class used by the parser.
+    """
+    global _worker_extractor
+    _worker_extractor = extractor_class()
+
+
+def parse_in_worker(html_doc: str) -> dict:
+    return _worker_extractor.extract(html_doc)
+
+
+def timed_parse_in_worker(html_doc: str) -> Tuple[dict, float]:
+    # the metrics registry of a worker process is not the one exported, so
+    # the parse time is sent back with the result
+    start = time.perf_counter()
+    return _worker_extractor.extract(html_doc), time.perf_counter() - start
+
+
+def failed_future(exc: BaseException) -> Future:
+    future = Future()
+    future.set_exception(exc)
+    return future
+
+
+class ScrapePipeline:
+    _done = object()
+
+    def __init__(
+        self,
+        parser: Parser,
+        fetch_workers: int = MAX_WORKERS,
+        parse_workers: int = PARSE_WORKERS,
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+    ) -> None:
+        """
+        Initializes a fetch -> parse -> write pipeline around a Parser.
+
+        Ticket pages are downloaded by a pool of threads, parsed by a pool of
+        processes and merged by a single writer thread. The stages are
+        connected by bounded queues, so a slow stage holds back the stages
+        before it instead of letting work pile up in memory. Records keep
+        the order of the listing.
+
+        Args:
+            parser (Parser): The parser used for the network requests.
+            fetch_workers (int): Number of threads downloading ticket pages.
+            parse_workers (int): Number of processes parsing ticket pages.
+            queue_size (int): Capacity of each queue between stages.
+        """
+        self.parser = parser
+        self.fetch_workers = max(1, fetch_workers)
+        self.parse_workers = max(1, parse_workers)
+        self.queue_size = max(1, queue_size)
+
+    def dispatch_parsing(
+        self,
+        fetched: queue.Queue,
+        parsed: queue.Queue,
+        parse_executor: ProcessPoolExecutor,
+    ) -> None:
+        """
+        Hands downloaded pages to the parse pool, in order.
+
+        Download errors are forwarded to the writer as failed futures so that
+        every stage keeps draining its queue.
+        """
+        while True:
+            item = fetched.get()
+            if item is self._done:
+                parsed.put(self._done)
+                return
+            subject, ticket, html_future = item
+            try:
+                parse_future = parse_executor.submit(
+                    timed_parse_in_worker, html_future.result()
+                )
+            except Exception as exc:
+                parse_future = failed_future(exc)
+            parsed.put((subject, ticket, parse_future))
+
+    def write_records(
+        self,
+        parsed: queue.Queue,
+        subjects: dict,
+        emit: Callable[[str, dict], None],
+        errors: list,
+    ) -> None:
+        """
+        Merges parsed pages into amended tickets and hands them to emit.
+
+        After the first error the remaining items are drained and discarded.
+        """
+        while True:
+            item = parsed.get()
+            if item is self._done:
+                return
+            if errors:
+                continue
+            subject, ticket, parse_future = item
+            try:
+                apl, seconds = parse_future.result()
+            except Exception as exc:
+                errors.append(exc)
+                continue
+            registry.observe("parse", seconds)
+            category = {"category": subjects[subject]}
+            try:
+                emit(subject, self.parser.amend_ticket(ticket, apl, category))
+            except Exception as exc:
+                errors.append(exc)
+
+    def run_period(
+        self, period: str, subjects: dict, emit: Callable[[str, dict], None]
+    ) -> None:
+        """
+        Run the pipeline for one period.
+
+        Args:
+            period (str): A string representing the period for which to fetch tickets.
+            subjects (dict): dict containing the subjects for which to fetch tickets.
+            emit (Callable[[str, dict], None]): Called by the writer stage with
+                the subject and the amended ticket, in listing order.
+
+        """
+        fetched = queue.Queue(maxsize=self.queue_size)
+        parsed = queue.Queue(maxsize=self.queue_size)
+        errors: list = []
+
+        with ThreadPoolExecutor(
+            max_workers=self.fetch_workers
+        ) as fetch_executor, ProcessPoolExecutor(
+            max_workers=self.parse_workers,
+            initializer=init_parse_worker,
+            initargs=(type(self.parser.extractor),),
+        ) as parse_executor:
+            stages = [
+                threading.Thread(
+                    target=self.dispatch_parsing,
+                    args=(fetched, parsed, parse_executor),
+                ),
+                threading.Thread(
+                    target=self.write_records,
+                    args=(parsed, subjects, emit, errors),
+                ),
+            ]
+            for stage in stages:
+                stage.start()
+
+            try:
+                for subject in subjects:
+                    if errors:
+                        break
+                    tickets = self.parser.iter_subject_tickets(period, subject)
+                    listed = 0
+                    for ticket in tqdm(tickets):
+                        html_future = fetch_executor.submit(
+                            self.parser.fetch_ticket_html, ticket
+                        )
+                        fetched.put((subject, ticket, html_future))
+                        listed += 1
+                    logger.debug(f"Subject {subject}: {listed} tickets listed")
+            finally:
+                fetched.put(self._done)
+                for stage in stages:
+                    stage.join()
+
+        if errors:
+            raise errors[0]
+
+    def fetch_period_tickets(self, period: str, subjects: dict) -> List[CompactRecords]:
+        """
+        Fetch tickets for the given period and subjects through the pipeline.
+
+        Args:
+            period (str): A string representing the period for which to fetch tickets.
+            subjects (dict): dict containing the subjects for which to fetch tickets.
+
+        Returns:
+            List[CompactRecords]: The amended tickets, one CompactRecords per
+            subject.
+
+        """
+        results: Dict[str, CompactRecords] = {
+            subject: CompactRecords() for subject in subjects
+        }
+        self.run_period(
+            period, subjects, lambda subject, record: results[subject].append(record)
+        )
+        return list(results.values())
+
+    def stream_to_file(
+        self, period: str, subjects: dict, output_format: str = "ndjson"
+    ) -> None:
+        """
+        Stream ticket data of one period to a newline-delimited JSON or
+        Parquet file.
+
+        Args:
+            period (str): str representing the period for which the data is being dumped
+            subjects (dict): dict containing the subjects for which to fetch tickets.
+            output_format (str): "ndjson", "parquet" or "zstd".
+
+        """
+        with open_month_writer(period, output_format) as writer:
+            self.run_period(
+                period, subjects, lambda subject, record: writer.write(record)
+            )
+
+    def parse(self, periods: list, subjects: dict, output_format: str = "json") -> None:
+        """
+        Parse ticket data for the given periods and subjects.
+
+        Args:
+            periods (list): representing the periods for which to parse data.
+            subjects (dict): dict containing the subjects for which to parse data.
+            output_format (str): "json" or a streaming format, as in Parser.parse.
+
+        """
+        for period in tqdm(periods):
+            if output_format in STREAMING_FORMATS:
+                self.stream_to_file(period, subjects, output_format)
+            else:
+                data = self.fetch_period_tickets(period, subjects)
+                self.parser.dump_to_file(data=data, period=period)
@@ -1,5 +1,16 @@
 # ruff: disable=line-too-long
 import json
+from typing import Tuple
+
+from parser_config import LISTING_EXTENT, LISTING_ZOOM
+
+# digits after the decimal point of the extent coordinates, which the map
+# sends as integers, without the point
+EXTENT_DECIMALS = 9
+
+# radius in metres of the sphere of EPSG:3857 (Web Mercator), the projection
+# of the coordinates requested by set_ticket_payload
+EARTH_RADIUS = 6378137.0
 
 
 def set_apls_headers(cookies) -> dict:
@@ -53,6 +64,8 @@ def set_ticket_payload(
     p_request,
     period: str = "",
     subject: str = "",
+    extent: Tuple[float, float, float, float] = LISTING_EXTENT,
+    zoom: int = LISTING_ZOOM,
 ) -> dict:
     payload_json_params = {
         "pageItems": {
@@ -73,12 +86,12 @@ def set_ticket_payload(
         "p_debug": "",
         "p_request": p_request,
         "x01": "3857",
-        "x02": "3103495265163666",
-        "x03": "7141386464106095",
-        "x04": "3150255616417175",
-        "x05": "7210179788385880",
+        "x02": encode_coordinate(extent[0]),
+        "x03": encode_coordinate(extent[1]),
+        "x04": encode_coordinate(extent[2]),
+        "x05": encode_coordinate(extent[3]),
         "x06": "N",
-        "x07": "11",
+        "x07": str(zoom),
         "x10": "FOIDATA",
         "p_json": payload_json_params,
     }
@@ -86,3 +99,26 @@ def set_ticket_payload(
     payload["p_json"] = json.dumps(payload["p_json"])
 
     return payload
+
+
+def encode_coordinate(value: float) -> str:
+    """
+    Formats an extent coordinate as the map does: "3103495.265163666" is
+    sent as "3103495265163666".
+    """
+    return f"{value:.{EXTENT_DECIMALS}f}".replace(".", "")
+
+
+def decode_coordinate(value: str) -> float:
+    return int(value) / 10**EXTENT_DECIMALS
+
+
+def get_payload_extent(payload: dict) -> Tuple[float, float, float, float]:
+    return tuple(
+        decode_coordinate(payload[key]) for key in ("x02", "x03", "x04", "x05")
+    )
+
+
+def get_payload_items(payload: dict) -> dict:
+    items = json.loads(payload["p_json"])["pageItems"]["itemsToSubmit"]
+    return {item["n"]: item["v"] for item in items}
@@ -0,0 +1,217 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+import requests
+
+from logs.set_logger import logger
+from parser_config import (
+    ADAPTIVE_BASELINE_DECAY,
+    ADAPTIVE_INITIAL_LIMIT,
+    ADAPTIVE_LATENCY_TOLERANCE,
+    ADAPTIVE_MAX_LIMIT,
+    BACKOFF_BASE,
+    BACKOFF_CAP,
+    REQUEST_RETRIES,
+)
+
+RETRYABLE_ERRORS = (requests.Timeout, requests.ConnectionError)
+TOO_MANY_REQUESTS = 429
+
+
+def is_retryable(status_code: int) -> bool:
+    """
+    Returns True for the responses that signal an overloaded server: 5xx
+    and 429 Too Many Requests.
+    """
+    return status_code >= 500 or status_code == TOO_MANY_REQUESTS
+
+
+def retry_after(r: requests.Response) -> Optional[float]:
+    """
+    Returns the delay in seconds asked for by the Retry-After header of a
+    response, given as seconds or as an HTTP date, or None without one.
+    """
+    value = r.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        initial: int = ADAPTIVE_INITIAL_LIMIT,
+        minimum: int = 1,
+        maximum: int = ADAPTIVE_MAX_LIMIT,
+        latency_tolerance: float = ADAPTIVE_LATENCY_TOLERANCE,
+        decrease_factor: float = 0.5,
+        baseline_decay: float = ADAPTIVE_BASELINE_DECAY,
+    ) -> None:
+        """
+        Initializes an AIMD limit on the number of in-flight requests.
+
+        Every successful request adds 1 / limit to the limit, which grows it
+        by one per round of requests. A failure, or a smoothed latency above
+        latency_tolerance times the baseline latency, multiplies the limit
+        by decrease_factor, at most once per smoothed latency so that a burst
+        of failures counts as one congestion signal.
+
+        Latencies are tracked per kind of request, since a listing takes far
+        longer than a ticket page. The baseline of a kind is its lowest
+        latency, which rises by baseline_decay of the gap to every slower
+        request, so that one unusually fast response is forgotten.
+
+        Args:
+            initial (int): The starting limit.
+            minimum (int): The lowest limit.
+            maximum (int): The highest limit.
+            latency_tolerance (float): Allowed ratio of the smoothed latency
+                to the lowest latency before the limit is decreased.
+            decrease_factor (float): The multiplicative decrease.
+            baseline_decay (float): The fraction of the gap to a slower
+                latency by which the baseline rises.
+        """
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_tolerance = latency_tolerance
+        self.decrease_factor = decrease_factor
+        self.baseline_decay = baseline_decay
+        self.in_flight = 0
+        self.min_latency: Dict[str, float] = {}
+        self.smoothed_latency: Dict[str, float] = {}
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def on_success(self, latency: float, kind: str = "detail") -> None:
+        with self._condition:
+            baseline = self.min_latency.get(kind, latency)
+            if latency < baseline:
+                baseline = latency
+            else:
+                baseline += self.baseline_decay * (latency - baseline)
+            self.min_latency[kind] = baseline
+            smoothed = 0.9 * self.smoothed_latency.get(kind, latency) + 0.1 * latency
+            self.smoothed_latency[kind] = smoothed
+            if smoothed > self.latency_tolerance * baseline:
+                self._decrease(smoothed)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                self._condition.notify_all()
+
+    def on_failure(self) -> None:
+        with self._condition:
+            self._decrease(max(self.smoothed_latency.values(), default=0))
+
+    def _decrease(self, window: float) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < window:
+            return
+        self._last_decrease = now
+        limit = max(self.minimum, self.limit * self.decrease_factor)
+        if int(limit) < int(self.limit):
+            logger.debug(f"Concurrency limit decreased to {int(limit)}")
+        self.limit = limit
+
+
+class Backoff:
+    def __init__(self, base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP) -> None:
+        self.base = base
+        self.cap = cap
+
+    def delay(self, attempt: int) -> float:
+        """
+        Returns a full-jitter exponential delay for a retry attempt.
+        """
+        return random.uniform(0, min(self.cap, self.base * 2**attempt))
+
+
+class RateController:
+    def __init__(
+        self,
+        limiter: Optional[AdaptiveLimiter] = None,
+        backoff: Optional[Backoff] = None,
+        retries: int = REQUEST_RETRIES,
+    ) -> None:
+        """
+        Initializes the controller wrapped around every request of a Parser.
+
+        Args:
+            limiter (Optional[AdaptiveLimiter]): The concurrency limit.
+            backoff (Optional[Backoff]): The delays between retries.
+            retries (int): Number of retries after a 5xx or 429 response or
+                a timeout or connection error.
+        """
+        self.limiter = limiter or AdaptiveLimiter()
+        self.backoff = backoff or Backoff()
+        self.retries = retries
+
+    def request(
+        self, send: Callable[[], requests.Response], kind: str = "detail"
+    ) -> requests.Response:
+        """
+        Sends a request within the concurrency limit, retrying server errors.
+
+        A 429 Too Many Requests response is a failure like a 5xx one; the
+        retry waits at least as long as its Retry-After header asks.
+
+        Args:
+            send (Callable[[], requests.Response]): Sends the request once.
+            kind (str): The kind of request whose latency is tracked,
+                "listing" or "detail".
+
+        Returns:
+            requests.Response: The first response below 500 other than 429.
+
+        Raises:
+            requests.HTTPError: If the last attempt got a 5xx or 429 response.
+            requests.RequestException: If the last attempt failed to connect
+                or timed out.
+        """
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire()
+            start = time.monotonic()
+            asked = 0.0
+            try:
+                r = send()
+            except RETRYABLE_ERRORS:
+                self.limiter.on_failure()
+                if attempt == self.retries:
+                    raise
+            else:
+                if not is_retryable(r.status_code):
+                    self.limiter.on_success(time.monotonic() - start, kind)
+                    return r
+                self.limiter.on_failure()
+                if attempt == self.retries:
+                    r.raise_for_status()
+                asked = retry_after(r) or 0.0
+                # give the connection back before sleeping
+                r.close()
+            finally:
+                self.limiter.release()
+            time.sleep(max(self.backoff.delay(attempt), asked))
+
+    def on_session_expired(self) -> None:
+        self.limiter.on_failure()
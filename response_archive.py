@@ -0,0 +1,189 @@
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from parser import Parser
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from compact_records import CompactRecords
+from logs.set_logger import logger
+from parser_config import PARSE_WORKERS
+from pipeline import init_parse_worker, parse_in_worker
+from ticket_extractors import SoupExtractor
+
+LISTING = "listing"
+TICKET_PAGE = "ticket"
+
+
+class ResponseArchive:
+    def __init__(self, root: str) -> None:
+        """
+        Initializes a compressed, content-addressed archive of raw responses.
+
+        Bodies are stored once per SHA-256 digest under
+        "<root>/objects/<2 hex>/<digest>.gz". An SQLite index maps every
+        fetch (listing of a period and subject, or page of a ticket number)
+        to the digest of its body and the time it was fetched.
+
+        Args:
+            root (str): The archive directory.
+        """
+        self.root = Path(root)
+        (self.root / "objects").mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            self.root / "index.sqlite3", check_same_thread=False
+        )
+        with self._connection:
+            self._connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    kind TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    digest TEXT NOT NULL,
+                    fetched_at TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS responses_key
+                    ON responses (kind, key, fetched_at);
+                """
+            )
+
+    def object_path(self, digest: str) -> Path:
+        return self.root / "objects" / digest[:2] / f"{digest}.gz"
+
+    def put(self, kind: str, key: str, body: bytes) -> str:
+        """
+        Stores a response body and indexes it under a kind and key.
+
+        Args:
+            kind (str): LISTING or TICKET_PAGE.
+            key (str): "<period>|<subject>" for listings, the ticket number
+                for ticket pages.
+            body (bytes): The raw response body.
+
+        Returns:
+            str: The digest of the body.
+        """
+        digest = hashlib.sha256(body).hexdigest()
+        path = self.object_path(digest)
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            # a unique name, as several threads may store the same body
+            fd, tmp_path = tempfile.mkstemp(
+                prefix=f"{path.name}.", suffix=".tmp", dir=path.parent
+            )
+            with os.fdopen(fd, "wb") as f:
+                f.write(gzip.compress(body))
+            os.replace(tmp_path, path)
+        fetched_at = datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO responses (kind, key, digest, fetched_at) "
+                "VALUES (?, ?, ?, ?)",
+                (kind, key, digest, fetched_at),
+            )
+        return digest
+
+    def put_listing(self, period: str, subject: str, body: bytes) -> str:
+        return self.put(LISTING, f"{period}|{subject}", body)
+
+    def put_ticket_page(self, number: Optional[str], body: bytes) -> Optional[str]:
+        # a page is found again by its ticket number, so the page of a ticket
+        # without one is not archived
+        if number is None:
+            return None
+        return self.put(TICKET_PAGE, number, body)
+
+    def read(self, digest: str) -> bytes:
+        return gzip.decompress(self.object_path(digest).read_bytes())
+
+    def latest(self, kind: str, key: str) -> Optional[bytes]:
+        """
+        Returns the most recently fetched body for a kind and key, if any.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT digest FROM responses WHERE kind = ? AND key = ? "
+                "ORDER BY fetched_at DESC, rowid DESC LIMIT 1",
+                (kind, key),
+            ).fetchone()
+        return self.read(row[0]) if row else None
+
+    def listings(self) -> Iterator[Tuple[str, str]]:
+        """
+        Yields the archived (period, subject) listings.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT DISTINCT key FROM responses WHERE kind = ? ORDER BY key",
+                (LISTING,),
+            ).fetchall()
+        for (key,) in rows:
+            period, subject = key.split("|", 1)
+            yield period, subject
+
+
+def reextract(
+    archive: ResponseArchive,
+    subjects: dict,
+    parse_workers: int = PARSE_WORKERS,
+    extractor_class: Optional[type] = None,
+    output_format: str = "json",
+) -> None:
+    """
+    Rebuild month files from the archive, without any network access.
+
+    The archived listings are parsed with Parser.parse_tickets and the latest
+    archived page of every listed ticket is parsed by a process pool.
+    Tickets whose page was never archived are skipped.
+
+    Args:
+        archive (ResponseArchive): The response archive.
+        subjects (dict): dict containing the subjects and their names.
+        parse_workers (int): Number of processes parsing ticket pages.
+        extractor_class (Optional[type]): The extractor, SoupExtractor by default.
+        output_format (str): "json" or a streaming format, as in Parser.parse.
+    """
+    parser = Parser(None, "", "", "", "", "")
+    extractor_class = extractor_class or SoupExtractor
+    periods: Dict[str, List[str]] = {}
+    for period, subject in archive.listings():
+        periods.setdefault(period, []).append(subject)
+
+    with ProcessPoolExecutor(
+        max_workers=parse_workers,
+        initializer=init_parse_worker,
+        initargs=(extractor_class,),
+    ) as executor:
+        for period, archived_subjects in periods.items():
+            data = []
+            for subject in subjects:
+                if subject not in archived_subjects:
+                    continue
+                body = archive.latest(LISTING, f"{period}|{subject}")
+                tickets = parser.parse_tickets(json.loads(body))
+                pages = [archive.latest(TICKET_PAGE, t["number"]) for t in tickets]
+                missing = sum(page is None for page in pages)
+                if missing:
+                    logger.warning(
+                        f"{period}, subject {subject}: {missing} pages not archived"
+                    )
+                tickets = [t for t, page in zip(tickets, pages) if page is not None]
+                html_docs = (page.decode("utf8") for page in pages if page is not None)
+                apls = executor.map(parse_in_worker, html_docs, chunksize=32)
+                category = {"category": subjects[subject]}
+                data.append(
+                    CompactRecords(
+                        parser.amend_ticket(ticket, apl, category)
+                        for ticket, apl in zip(tickets, apls)
+                    )
+                )
+
+            parser.dump_to_file(data=data, period=period, output_format=output_format)
+            logger.info(f"Re-extracted {period} from the archive")
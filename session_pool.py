@@ -0,0 +1,247 @@
+import fcntl
+import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from parser import Parser, SessionExpiredError
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+import requests
+
+from logs.set_logger import logger
+from parser_config import (
+    SESSION_CACHE_PATH,
+    SESSION_CACHE_TTL,
+    SESSION_POOL_SIZE,
+    SESSION_RETRIES,
+)
+from parser_session import ParserSession
+
+T = TypeVar("T")
+
+
+@contextmanager
+def locked_cache(cache_path: Path):
+    """
+    Holds an exclusive lock on the session cache for the calling process.
+    """
+    lock_path = cache_path.with_name(cache_path.name + ".lock")
+    with open(lock_path, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class SessionPool:
+    def __init__(
+        self,
+        size: int = SESSION_POOL_SIZE,
+        cache_path: str = SESSION_CACHE_PATH,
+        cache_ttl: float = SESSION_CACHE_TTL,
+        retries: int = SESSION_RETRIES,
+        parser_kwargs: Optional[dict] = None,
+    ) -> None:
+        """
+        Initializes a pool of independent APEX sessions.
+
+        Each session (cookie plus p_instance, p_request, protected and salt)
+        is wrapped in its own Parser with its own requests session. Sessions
+        are handed out round-robin. A session that reports expiry is
+        re-bootstrapped by a background thread while the failed call is
+        retried on another session.
+
+        Bootstrap parameters are cached in a JSON file guarded by a file
+        lock, so that processes on the same host reuse them instead of
+        loading the entrypoint and map pages again.
+
+        Args:
+            size (int): Number of sessions in the pool.
+            cache_path (str): Path of the bootstrap parameter cache.
+            cache_ttl (float): Age in seconds after which cached parameters
+                are no longer reused.
+            retries (int): Number of retries of a call after a session expiry.
+            parser_kwargs (Optional[dict]): Extra arguments of every Parser.
+        """
+        self.size = max(1, size)
+        self.cache_path = Path(cache_path)
+        self.cache_ttl = cache_ttl
+        self.retries = retries
+        self.parser_kwargs = parser_kwargs or {}
+        self._lock = threading.Condition()
+        self._next = 0
+        self._refreshing: Dict[int, Future] = {}
+        self._refresher = ThreadPoolExecutor(max_workers=1)
+        self.parsers: List[Parser] = [
+            self.make_parser(params) for params in self.load_sessions()
+        ]
+
+    @staticmethod
+    def bootstrap() -> dict:
+        """
+        Opens a new APEX session.
+
+        Returns:
+            dict: The cookies and payload parameters of the session.
+        """
+        config = ParserSession()
+        payload_params = config.get_payload()
+        return {"cookies": config.cookies, "created": time.time(), **payload_params}
+
+    def make_parser(self, params: dict) -> Parser:
+        return Parser(
+            session=requests.Session(),
+            cookies=params["cookies"],
+            p_instance=params["p_instance"],
+            p_request=params["p_request"],
+            protected=params["protected"],
+            salt=params["salt"],
+            **self.parser_kwargs,
+        )
+
+    def read_cache(self) -> List[dict]:
+        if not self.cache_path.exists():
+            return []
+        with self.cache_path.open(encoding="utf8") as f:
+            return json.load(f)
+
+    def write_cache(self, sessions: List[dict]) -> None:
+        tmp_path = self.cache_path.with_name(self.cache_path.name + ".tmp")
+        with tmp_path.open("w", encoding="utf8") as f:
+            json.dump(sessions, f)
+        tmp_path.replace(self.cache_path)
+
+    def is_fresh(self, params: Optional[dict]) -> bool:
+        return params is not None and time.time() - params["created"] < self.cache_ttl
+
+    def load_sessions(self) -> List[dict]:
+        """
+        Returns the parameters of every slot, bootstrapping the missing ones.
+        """
+        with locked_cache(self.cache_path):
+            cached = self.read_cache()
+            sessions = []
+            for slot in range(self.size):
+                params = cached[slot] if slot < len(cached) else None
+                if not self.is_fresh(params):
+                    logger.debug(f"Bootstrapping session {slot}")
+                    params = self.bootstrap()
+                sessions.append(params)
+            self.write_cache(sessions + cached[self.size :])
+        return sessions
+
+    def reload_session(self, slot: int, stale_cookies: str) -> dict:
+        """
+        Returns new parameters for a slot whose session has expired.
+
+        If another process already replaced the expired session in the
+        cache, its parameters are reused.
+        """
+        with locked_cache(self.cache_path):
+            cached = self.read_cache()
+            params = cached[slot] if slot < len(cached) else None
+            if params is None or params["cookies"] == stale_cookies:
+                logger.info(f"Session {slot} expired, bootstrapping a new one")
+                params = self.bootstrap()
+                cached = cached + [None] * (slot + 1 - len(cached))
+                cached[slot] = params
+                self.write_cache(cached)
+        return params
+
+    def refresh(self, slot: int, stale: Parser) -> None:
+        try:
+            parser = self.make_parser(self.reload_session(slot, stale.cookies))
+        except Exception:
+            logger.exception(f"Failed to refresh session {slot}")
+            parser = stale
+        with self._lock:
+            self.parsers[slot] = parser
+            del self._refreshing[slot]
+            self._lock.notify_all()
+
+    def schedule_refresh(self, slot: int, stale: Parser) -> None:
+        with self._lock:
+            if slot in self._refreshing or self.parsers[slot] is not stale:
+                return
+            self._refreshing[slot] = self._refresher.submit(self.refresh, slot, stale)
+
+    def acquire(self) -> Tuple[int, Parser]:
+        """
+        Returns the next usable session, waiting while all are refreshing.
+        """
+        with self._lock:
+            while len(self._refreshing) == self.size:
+                self._lock.wait()
+            while True:
+                slot = self._next
+                self._next = (self._next + 1) % self.size
+                if slot not in self._refreshing:
+                    return slot, self.parsers[slot]
+
+    def call(self, fn: Callable[[Parser], T]) -> T:
+        """
+        Runs fn with a session of the pool, retrying after session expiry.
+
+        Args:
+            fn (Callable[[Parser], T]): The call, given the Parser of a session.
+
+        Returns:
+            T: The result of fn.
+
+        Raises:
+            SessionExpiredError: If every attempt hit an expired session.
+        """
+        for attempt in range(self.retries + 1):
+            slot, parser = self.acquire()
+            try:
+                return fn(parser)
+            except SessionExpiredError:
+                if attempt == self.retries:
+                    raise
+                self.schedule_refresh(slot, parser)
+
+    def close(self) -> None:
+        self._refresher.shutdown(wait=True)
+
+
+class PooledParser(Parser):
+    def __init__(self, pool: SessionPool, **parser_kwargs) -> None:
+        """
+        Initializes a Parser whose requests are spread over a SessionPool.
+
+        Only the network methods are routed through the pool, so every
+        engine built on Parser works unchanged.
+
+        Args:
+            pool (SessionPool): The session pool.
+            **parser_kwargs: Extra arguments of Parser.
+        """
+        first = pool.parsers[0]
+        super().__init__(
+            session=first.session,
+            cookies=first.cookies,
+            p_instance=first.p_instance,
+            p_request=first.p_request,
+            protected=first.protected,
+            salt=first.salt,
+            **parser_kwargs,
+        )
+        self.pool = pool
+
+    def fetch_subject_tickets(self, period: str, subject: str) -> List[dict]:
+        return self.pool.call(
+            lambda parser: Parser.fetch_subject_tickets(parser, period, subject)
+        )
+
+    def stream_subject_tickets(self, period: str, subject: str) -> Iterator[dict]:
+        # an expired session is reported before the first row is returned
+        return self.pool.call(
+            lambda parser: Parser.stream_subject_tickets(parser, period, subject)
+        )
+
+    def fetch_ticket_html(self, ticket: dict) -> str:
+        with self._host_limit(ticket["request_link"]):
+            return self.pool.call(lambda parser: parser.fetch_ticket_html(ticket))
@@ -0,0 +1,90 @@
+"""
+The async engine must not shadow the synchronous Parser methods with
+coroutines and must keep the per-host cap of the requests engine.
+"""
+import asyncio
+import inspect
+from parser import Parser
+
+from async_parser import AsyncParser, gather_bounded
+
+
+class FakeResponse:
+    def __init__(self, body: str) -> None:
+        self.body = body
+
+    async def __aenter__(self) -> "FakeResponse":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        pass
+
+    async def read(self) -> bytes:
+        return self.body.encode()
+
+    async def text(self) -> str:
+        return self.body
+
+
+class FakeSession:
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def get(self, url: str, headers: dict) -> "FakeRequest":
+        return FakeRequest(self, url)
+
+
+class FakeRequest:
+    def __init__(self, session: FakeSession, url: str) -> None:
+        self.session = session
+        self.url = url
+
+    async def __aenter__(self) -> FakeResponse:
+        self.session.in_flight += 1
+        self.session.max_in_flight = max(
+            self.session.max_in_flight, self.session.in_flight
+        )
+        await asyncio.sleep(0.001)
+        return FakeResponse(self.url)
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.session.in_flight -= 1
+
+
+def test_sync_methods_are_not_coroutines():
+    for name, method in inspect.getmembers(AsyncParser, inspect.isfunction):
+        if hasattr(Parser, name):
+            assert not inspect.iscoroutinefunction(method), name
+
+
+def test_detail_requests_respect_the_per_host_limit():
+    session = FakeSession()
+    parser = AsyncParser(
+        session, "", "", "", "", "", max_in_flight=50, max_requests_per_host=3
+    )
+    parser.parse_ticket_html = lambda html_doc: {"page": html_doc}
+    tickets = [{"request_link": f"http://host/{i}"} for i in range(40)]
+
+    apls = asyncio.run(
+        gather_bounded(parser.fetch_ticket_info_async, tickets, parser.max_in_flight)
+    )
+
+    assert apls == [{"page": ticket["request_link"]} for ticket in tickets]
+    assert session.max_in_flight == 3
+
+
+def test_gather_bounded_limits_concurrency_and_keeps_order():
+    running, peak = 0, 0
+
+    async def work(item: int) -> int:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.001 * (item % 3))
+        running -= 1
+        return item * 2
+
+    assert asyncio.run(gather_bounded(work, range(20), 4)) == [i * 2 for i in range(20)]
+    assert peak == 4
+    assert asyncio.run(gather_bounded(work, [], 4)) == []
@@ -0,0 +1,81 @@
+"""
+The backfill must write every month as soon as it is done, hold only a few
+months at a time and survive the failure of a chunk.
+"""
+import json
+from parser import Parser
+
+import pytest
+
+from backfill import run_backfill
+
+PERIODS = [
+    "Суббота, 01 Октябрь, 2022",
+    "Вторник, 01 Ноябрь, 2022",
+    "Четверг, 01 Декабрь, 2022",
+]
+FILES = ["2022_october.json", "2022_november.json", "2022_december.json"]
+SUBJECTS = {"1": "Водоснабжение", "2": "Отопление"}
+
+
+def make_parser(tmp_path, events: list, failures: dict) -> Parser:
+    parser = Parser(None, "", "", "", "", "")
+
+    def fetch_subject_tickets(period: str, subject: str) -> list:
+        events.append(("list", period, sorted(p.name for p in tmp_path.iterdir())))
+        return [
+            {"number": f"{period}|{subject}-{i}", "request_link": ""} for i in range(5)
+        ]
+
+    def fetch_ticket_info(ticket: dict) -> dict:
+        if failures.get(ticket["number"], 0):
+            failures[ticket["number"]] -= 1
+            raise ConnectionError(ticket["number"])
+        return {"status": "Заявка закрыта"}
+
+    parser.fetch_subject_tickets = fetch_subject_tickets
+    parser.fetch_ticket_info = fetch_ticket_info
+    return parser
+
+
+def read_numbers(path) -> list:
+    return [r["number"] for records in json.loads(path.read_text()) for r in records]
+
+
+@pytest.fixture
+def data(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    return tmp_path / "data"
+
+
+def test_months_are_written_one_window_at_a_time(data):
+    events = []
+    parser = make_parser(data, events, {})
+
+    run_backfill(parser, PERIODS, SUBJECTS, workers=4, chunk_size=2, months_in_flight=1)
+
+    # a period is only listed once the previous month file is written
+    for index, period in enumerate(PERIODS):
+        listed = [files for kind, p, files in events if p == period]
+        assert all(files == sorted(FILES[:index]) for files in listed)
+    numbers = read_numbers(data / FILES[0])
+    assert numbers == [f"{PERIODS[0]}|{s}-{i}" for s in SUBJECTS for i in range(5)]
+
+
+def test_failed_chunk_is_retried(data):
+    number = f"{PERIODS[1]}|2-3"
+    parser = make_parser(data, [], {number: 2})
+
+    run_backfill(parser, PERIODS, SUBJECTS, workers=4, chunk_size=2, retries=2)
+
+    assert number in read_numbers(data / FILES[1])
+
+
+def test_failed_month_does_not_stop_the_others(data):
+    parser = make_parser(data, [], {f"{PERIODS[1]}|2-3": 10})
+
+    with pytest.raises(RuntimeError):
+        run_backfill(parser, PERIODS, SUBJECTS, workers=4, chunk_size=2, retries=1)
+
+    assert sorted(path.name for path in data.iterdir()) == sorted([FILES[0], FILES[2]])
@@ -0,0 +1,111 @@
+"""
+Resuming a checkpointed scrape must never lose a month file that was
+already written, and the ndjson writer must only ever write whole lines.
+"""
+import json
+import parser
+from functools import partial
+from parser import Parser
+
+import pytest
+
+from checkpoint import CheckpointStore
+from output_writers import NdjsonWriter
+
+PERIOD = "Суббота, 01 Октябрь, 2022"
+SUBJECTS = {"1": "Водоснабжение", "2": "Отопление"}
+
+
+def make_parser(unnumbered: bool = False) -> Parser:
+    parser = Parser(None, "", "", "", "", "")
+    parser.fetch_subject_tickets = lambda period, subject: [
+        {"number": None if unnumbered and i == 1 else f"{subject}-{i}"}
+        for i in range(3)
+    ]
+    parser.iter_amended_tickets = lambda tickets, category: (
+        {**ticket, **category} for ticket in tickets
+    )
+    return parser
+
+
+def kill_after_first_commit(checkpoint: CheckpointStore) -> None:
+    # the process dies right after the first durable flush: nothing after
+    # it reaches the store
+    def commit(period, numbers, size):
+        CheckpointStore.commit(checkpoint, period, numbers, size)
+        checkpoint.commit = lambda *args: None
+        raise KeyboardInterrupt
+
+    checkpoint.commit = commit
+
+
+def test_crash_before_period_is_marked_done(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    month_file = tmp_path / "data" / "2022_october.ndjson"
+    checkpoint = CheckpointStore(str(tmp_path / "checkpoint.sqlite3"))
+
+    def crash(period: str) -> None:
+        raise KeyboardInterrupt
+
+    # the part file is renamed, then the run stops
+    checkpoint.mark_period_done = crash
+    with pytest.raises(KeyboardInterrupt):
+        make_parser().resume_to_file(PERIOD, SUBJECTS, checkpoint)
+    del checkpoint.mark_period_done
+    written = month_file.read_bytes()
+    assert written.count(b"\n") == 6
+
+    make_parser().resume_to_file(PERIOD, SUBJECTS, checkpoint)
+
+    assert month_file.read_bytes() == written
+    assert checkpoint.is_period_done(PERIOD)
+
+
+@pytest.mark.parametrize("unnumbered", [False, True])
+def test_kill_at_flush_boundary(tmp_path, monkeypatch, unnumbered):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    monkeypatch.setattr(parser, "NdjsonWriter", partial(NdjsonWriter, flush_every=2))
+    checkpoint = CheckpointStore(str(tmp_path / "checkpoint.sqlite3"))
+
+    kill_after_first_commit(checkpoint)
+    with pytest.raises(KeyboardInterrupt):
+        make_parser(unnumbered).resume_to_file(PERIOD, SUBJECTS, checkpoint)
+    del checkpoint.commit
+    make_parser(unnumbered).resume_to_file(PERIOD, SUBJECTS, checkpoint)
+
+    month_file = tmp_path / "data" / "2022_october.ndjson"
+    records = [json.loads(line) for line in month_file.open(encoding="utf8")]
+    listings = make_parser(unnumbered).fetch_subject_tickets
+    assert records == [
+        {**ticket, "category": SUBJECTS[subject]}
+        for subject in SUBJECTS
+        for ticket in listings(PERIOD, subject)
+    ]
+
+
+class WriteLog:
+    def __init__(self, file) -> None:
+        self.file = file
+        self.writes = []
+
+    def write(self, text: str) -> int:
+        self.writes.append(text)
+        return self.file.write(text)
+
+    def __getattr__(self, name: str):
+        return getattr(self.file, name)
+
+
+def test_ndjson_lines_are_written_at_once(tmp_path):
+    writer = NdjsonWriter(tmp_path / "2022_october.ndjson", flush_every=1)
+    writer.open()
+    writer._file = log = WriteLog(writer._file)
+    records = [{"number": f"1-{i}", "category": "Водоснабжение"} for i in range(3)]
+
+    for record in records:
+        writer.write(record)
+    writer.close()
+
+    assert log.writes == [json.dumps(r, ensure_ascii=False) + "\n" for r in records]
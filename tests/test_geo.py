@@ -0,0 +1,159 @@
+"""
+The tile index must put every ticket in its slippy map tile, radius queries
+must find exactly the tickets within the radius, and both transform engines
+must write the same index next to the dataset.
+"""
+import json
+import math
+import random
+
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+
+from geo import (
+    build_geo_index,
+    haversine_km,
+    latlon_to_mercator,
+    tickets_within,
+    tile_ids,
+    tiles_around,
+    write_geo_index,
+)
+from local_transform import transform
+
+MINSK = (53.9, 27.5667)
+
+
+def make_records(count: int = 500, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    lat = np.array([MINSK[0] + rng.uniform(-0.15, 0.15) for _ in range(count)])
+    lon = np.array([MINSK[1] + rng.uniform(-0.25, 0.25) for _ in range(count)])
+    x, y = latlon_to_mercator(lat, lon)
+    records = [
+        {"number": f"{i}.10.061022", "x": str(x[i]), "y": str(y[i])}
+        for i in range(count)
+    ]
+    # listings have tickets without coordinates
+    records += [
+        {"number": "missing.1", "x": "null", "y": "null"},
+        {"number": "missing.2", "x": None, "y": ""},
+    ]
+    return records
+
+
+def slippy_tile(lat: float, lon: float, zoom: int) -> int:
+    tiles = 1 << zoom
+    column = math.floor((lon + 180.0) / 360.0 * tiles)
+    row = math.floor(
+        (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * tiles
+    )
+    return row * tiles + column
+
+
+def test_tile_ids_match_the_slippy_map_scheme():
+    points = [MINSK, (0.5, 0.5), (-33.9, 18.4), (64.1, -21.9), (40.7, -74.0)]
+    lat, lon = np.array(points).T
+    x, y = latlon_to_mercator(lat, lon)
+
+    for zoom in (1, 10, 14, 18):
+        assert tile_ids(x, y, zoom).tolist() == [
+            slippy_tile(*point, zoom) for point in points
+        ]
+
+
+def test_tile_ids_of_missing_and_outside_points():
+    x = np.array([np.nan, 1.0, 1e9, -1e9])
+    y = np.array([1.0, np.nan, -1e9, 1e9])
+
+    assert tile_ids(x, y, 1).tolist() == [-1, -1, 3, 0]
+
+
+def test_tiles_around_cover_the_circle():
+    rng = random.Random(1)
+    for radius_km in (0.3, 2.0, 10.0):
+        tiles = set(tiles_around(*MINSK, radius_km))
+        lat = np.array([MINSK[0] + rng.uniform(-0.1, 0.1) for _ in range(2000)])
+        lon = np.array([MINSK[1] + rng.uniform(-0.2, 0.2) for _ in range(2000)])
+        inside = haversine_km(lat, lon, *MINSK) <= radius_km
+        x, y = latlon_to_mercator(lat[inside], lon[inside])
+
+        assert inside.any()
+        assert set(tile_ids(x, y).tolist()) <= tiles
+
+
+def test_tickets_within_matches_a_full_scan(tmp_path):
+    records = make_records()
+    month_file = tmp_path / "2022_october.ndjson"
+    month_file.write_text("".join(json.dumps(record) + "\n" for record in records))
+    index = build_geo_index(records)
+    lat = index["lat"].to_numpy(zero_copy_only=False)
+    lon = index["lon"].to_numpy(zero_copy_only=False)
+
+    path = write_geo_index(month_file)
+
+    assert path == tmp_path / "2022_october.geo.parquet"
+    for radius_km in (0.5, 3.0, 12.0):
+        distance = haversine_km(lat, lon, *MINSK)
+        expected = sorted(
+            number
+            for number, inside in zip(
+                index["number"].to_pylist(), distance <= radius_km
+            )
+            if inside
+        )
+        found = tickets_within([path], *MINSK, radius_km)
+        assert sorted(found["number"].to_pylist()) == expected
+        assert max(found["distance_km"].to_pylist(), default=0.0) <= radius_km
+
+
+def test_transform_writes_the_geo_index_next_to_the_dataset(tmp_path):
+    raw, dataset = tmp_path / "raw", tmp_path / "dataset"
+    raw.mkdir()
+    records = make_records()
+    (raw / "2022_october.ndjson").write_text(
+        "".join(json.dumps(record) + "\n" for record in records)
+    )
+
+    transform(["2022_october"], "ndjson", raw_root=str(raw), dataset_root=str(dataset))
+
+    month = tmp_path / "dataset_geo" / "year=2022" / "month=10"
+    files = list(month.iterdir())
+    assert [path.name for path in files] == ["part-00000.parquet"]
+    table = pq.read_table(files[0])
+    assert table.to_pylist() == build_geo_index(records).to_pylist()
+    assert table["tile_id"].to_pylist() == sorted(table["tile_id"].to_pylist())
+    assert tickets_within(files, *MINSK, 5.0).num_rows > 0
+
+
+def test_spark_geo_index_matches_local(tmp_path):
+    pytest.importorskip("pyspark")
+    from pyspark.sql import SparkSession
+
+    from data_processing_spark import SESSION_CONF, geo_index_df, schema
+
+    records = make_records()
+    path = tmp_path / "2022_october.ndjson"
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+    builder = SparkSession.builder.master("local[1]")
+    for key, value in SESSION_CONF.items():
+        builder = builder.config(key, value)
+    spark = builder.getOrCreate()
+    df = spark.read.schema(schema).format("json").load(str(path))
+
+    rows = sorted(
+        (row.asDict() for row in geo_index_df(df).collect()),
+        key=lambda row: row["number"],
+    )
+    expected = sorted(
+        build_geo_index(records).to_pylist(), key=lambda row: row["number"]
+    )
+
+    assert [row["tile_id"] for row in rows] == [row["tile_id"] for row in expected]
+    for row, local in zip(rows, expected):
+        assert row["number"] == local["number"]
+        for column in ("lat", "lon"):
+            if local[column] is None:
+                assert row[column] is None
+            else:
+                assert row[column] == pytest.approx(local[column], abs=1e-9)
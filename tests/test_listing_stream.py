@@ -0,0 +1,104 @@
+"""
+ListingDecoder must yield the rows of a listing however its body is split,
+and read_ahead must download the rows independently of their consumer.
+"""
+import json
+import random
+import threading
+
+import pytest
+
+from listing_stream import ListingDecoder, read_ahead
+
+LISTING = {
+    "row": [
+        {"NUMBER": f"{i}.10.061022", "TEXT": "Заявка № «ё»\n<br>", "X": i * 1.5e3}
+        for i in range(40)
+    ],
+    "other": [1, {"a": None}],
+    "count": 40,
+}
+EXPIRED = {"error": "Your session has expired", "addInfo": "", "row": []}
+
+
+def split(body: bytes, seed: int) -> list:
+    rng = random.Random(seed)
+    cuts = sorted(rng.sample(range(1, len(body)), rng.randint(1, 60)))
+    return [body[a:b] for a, b in zip([0] + cuts, cuts + [len(body)])]
+
+
+def decode(chunks: list) -> tuple:
+    decoder = ListingDecoder()
+    rows = [row for chunk in chunks for row in decoder.feed(chunk)]
+    rows += decoder.close()
+    return rows, decoder.members
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_rows_survive_any_split(seed):
+    body = json.dumps(LISTING, ensure_ascii=False, indent=seed % 3).encode("utf8")
+
+    rows, members = decode(split(body, seed))
+
+    assert rows == LISTING["row"]
+    assert members == {"other": LISTING["other"], "count": 40}
+
+
+def test_expired_session_body():
+    body = json.dumps(EXPIRED).encode("utf8")
+
+    rows, members = decode(split(body, 0))
+
+    assert rows == []
+    assert members["error"] == "Your session has expired"
+
+
+def test_truncated_body_is_an_error():
+    body = json.dumps(LISTING).encode("utf8")
+    decoder = ListingDecoder()
+    list(decoder.feed(body[:-10]))
+
+    with pytest.raises(ValueError):
+        decoder.close()
+
+
+def test_read_ahead_does_not_wait_for_the_consumer():
+    drained = threading.Event()
+
+    def rows():
+        yield from range(100)
+        drained.set()
+
+    iterator = read_ahead(rows(), 1000)
+
+    assert next(iterator) == 0
+    assert drained.wait(5)
+    assert list(iterator) == list(range(1, 100))
+
+
+def test_read_ahead_raises_after_the_rows_read():
+    def rows():
+        yield 1
+        raise ConnectionError
+
+    iterator = read_ahead(rows(), 10)
+
+    assert next(iterator) == 1
+    with pytest.raises(ConnectionError):
+        next(iterator)
+
+
+def test_read_ahead_closes_rows_when_abandoned():
+    closed = threading.Event()
+
+    def rows():
+        try:
+            yield from range(100)
+        finally:
+            closed.set()
+
+    iterator = read_ahead(rows(), 2)
+    next(iterator)
+    iterator.close()
+
+    assert closed.wait(5)
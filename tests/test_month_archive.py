@@ -0,0 +1,19 @@
+"""
+A month archive must keep every record, even those the index cannot hold.
+"""
+from month_archive import MonthArchive, MonthArchiveWriter
+
+
+def test_unnumbered_records_are_archived_but_not_indexed(tmp_path):
+    path = tmp_path / "2022_october.ndjson.zst"
+    records = [{"number": f"{i}.10.061022"} for i in range(5)]
+    records.insert(2, {"number": None, "address": "Минск"})
+
+    with MonthArchiveWriter(str(path), frame_records=2) as writer:
+        for record in records:
+            writer.write(record)
+
+    with MonthArchive(str(path)) as archive:
+        assert list(archive) == records
+        assert len(archive) == 5
+        assert archive.get("3.10.061022") == {"number": "3.10.061022"}
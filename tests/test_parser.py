@@ -0,0 +1,56 @@
+"""
+The single-pass INFOTEXT extraction must give the results of the
+individual field patterns.
+"""
+import re
+from parser import INFOTEXT_PATTERNS, Parser
+
+import pytest
+
+from parser_config import HOST_URL
+
+INFOTEXTS = {
+    "complete": (
+        "<b>Заявка № 1843.10.061022<br><b>Адрес: </b>Первомайский район, "
+        "улица Кедышко, 19<br><b>Вид неисправности: </b>Не вывезен мусор<br>"
+        '<b> Исполнитель: </b>ЖЭС №5<br><a href="f?p=10901:35:::NO::P35_ID:1843">'
+    ),
+    "lines_between_fields": (
+        "<b>Заявка № 1843.10.061022<br>\n<b>Адрес: </b>Первомайский район, "
+        "19<br>\r\n<b>Вид неисправности: </b>Не вывезен мусор<br>\n"
+        '<b> Исполнитель: </b>ЖЭС №5<br>\n<a href="f?p=10901:35:::NO::P35_ID:1843">'
+    ),
+    "line_break_inside_a_field": (
+        "<b>Заявка № 2207.10.121022<br><b>Адрес: </b>Центральный район, "
+        "95<br><b>Вид неисправности: </b>Не работает лифт\nво втором подъезде<br>"
+        "<b>Вид неисправности: </b>Лифт<br>"
+        '<b> Исполнитель: </b>ЖЭС №1<br><a href="f?p=10901:35:::NO::P35_ID:2207">'
+    ),
+    "no_performer": (
+        "<b>Заявка № 3051.10.201022<br><b>Адрес: </b>Ленинский район, "
+        "7<br><b>Вид неисправности: </b>Яма<br>"
+        '<a href="f?p=10901:35:::NO::P35_ID:3051">'
+    ),
+}
+
+
+def extract_per_field(infotext: str) -> dict:
+    """
+    The extraction as it was before the combined regex.
+    """
+    found = {
+        field: re.search(pattern, infotext)
+        for field, pattern in INFOTEXT_PATTERNS.items()
+    }
+    values = {field: m.group(1) if m else None for field, m in found.items()}
+    values["performer"] = values["performer"] or ""
+    if values["request_link"] is not None:
+        values["request_link"] = HOST_URL + values["request_link"]
+    return values
+
+
+@pytest.mark.parametrize("infotext", INFOTEXTS.values(), ids=list(INFOTEXTS))
+def test_extract_ticket_info_matches_per_field_patterns(infotext: str):
+    parser = Parser(None, "", "", "", "", "")
+
+    assert parser.extract_ticket_info(infotext) == extract_per_field(infotext)
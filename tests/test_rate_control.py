@@ -0,0 +1,110 @@
+"""
+The adaptive limiter must judge every kind of request by its own latency
+and must not hold connections of failed requests while backing off; 429
+responses must be retried after their Retry-After delay.
+"""
+from email.utils import formatdate
+
+import pytest
+
+import rate_control
+from rate_control import AdaptiveLimiter, Backoff, RateController, retry_after
+
+
+def test_slow_listing_does_not_shrink_detail_limit():
+    limiter = AdaptiveLimiter(initial=4)
+    limiter.on_success(10.0, "listing")
+    for _ in range(50):
+        limiter.on_success(0.05, "detail")
+
+    assert limiter.limit > 4
+
+
+def test_fast_outlier_is_forgotten():
+    limiter = AdaptiveLimiter(initial=4, latency_tolerance=3.0)
+    limiter.on_success(0.001)
+    for _ in range(1000):
+        limiter.on_success(0.05)
+    # the baseline has risen towards the usual latency
+    assert limiter.min_latency["detail"] > 0.05 / 3.0
+
+    limit = limiter.limit
+    for _ in range(50):
+        limiter.on_success(0.05)
+
+    assert limiter.limit > limit
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, log: list, headers: dict = None) -> None:
+        self.status_code = status_code
+        self.log = log
+        self.headers = headers or {}
+
+    def close(self) -> None:
+        self.log.append(("close", self.status_code))
+
+
+class NoBackoff(Backoff):
+    def __init__(self, log: list) -> None:
+        super().__init__()
+        self.log = log
+
+    def delay(self, attempt: int) -> float:
+        self.log.append(("sleep", attempt))
+        return 0
+
+
+def test_server_error_is_closed_before_backoff():
+    log = []
+    responses = iter([FakeResponse(503, log), FakeResponse(200, log)])
+    controller = RateController(backoff=NoBackoff(log), retries=2)
+
+    response = controller.request(lambda: next(responses))
+
+    assert response.status_code == 200
+    assert log == [("close", 503), ("sleep", 0)]
+
+
+class CountingLimiter(AdaptiveLimiter):
+    def __init__(self) -> None:
+        super().__init__()
+        self.failures = 0
+
+    def on_failure(self) -> None:
+        self.failures += 1
+
+
+def test_too_many_requests_is_retried_after_retry_after(monkeypatch):
+    log = []
+    responses = iter(
+        [FakeResponse(429, log, {"Retry-After": "7"}), FakeResponse(200, log)]
+    )
+    limiter = CountingLimiter()
+    controller = RateController(limiter=limiter, backoff=NoBackoff(log), retries=2)
+    monkeypatch.setattr(rate_control.time, "sleep", lambda s: log.append(("wait", s)))
+
+    response = controller.request(lambda: next(responses))
+
+    assert response.status_code == 200
+    assert limiter.failures == 1
+    assert log == [("close", 429), ("sleep", 0), ("wait", 7.0)]
+
+
+@pytest.mark.parametrize(
+    "headers, expected",
+    [
+        ({}, None),
+        ({"Retry-After": "2.5"}, 2.5),
+        ({"Retry-After": "-1"}, 0.0),
+        ({"Retry-After": "soon"}, None),
+    ],
+)
+def test_retry_after(headers, expected):
+    assert retry_after(FakeResponse(429, [], headers)) == expected
+
+
+def test_retry_after_date():
+    delay = retry_after(FakeResponse(429, [], {"Retry-After": formatdate(10**10)}))
+
+    assert delay == pytest.approx(10**10 - rate_control.time.time(), abs=5)
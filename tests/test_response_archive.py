@@ -0,0 +1,60 @@
+"""
+The response archive must store what --offline can replay, and never abort
+or corrupt a scrape while doing so.
+"""
+import json
+from concurrent.futures import ThreadPoolExecutor
+from parser import Parser, SessionExpiredError
+
+import pytest
+
+from protocol_constants import set_ticket_payload
+from response_archive import LISTING, ResponseArchive
+
+PERIOD = "Суббота, 01 Октябрь, 2022"
+
+
+class FakeResponse:
+    def __init__(self, content: dict) -> None:
+        self.content = json.dumps(content).encode("utf8")
+
+    def json(self) -> dict:
+        return json.loads(self.content)
+
+
+def test_unnumbered_ticket_page_is_skipped(tmp_path):
+    archive = ResponseArchive(str(tmp_path))
+
+    assert archive.put_ticket_page(None, b"<html></html>") is None
+
+
+def test_same_body_from_several_threads(tmp_path):
+    archive = ResponseArchive(str(tmp_path))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        digests = set(
+            executor.map(
+                lambda i: archive.put_ticket_page(str(i), b"<html></html>"), range(64)
+            )
+        )
+
+    assert len(digests) == 1
+    assert archive.read(digests.pop()) == b"<html></html>"
+    assert not list(tmp_path.glob("objects/*/*.tmp"))
+
+
+@pytest.mark.parametrize("expired", [False, True])
+def test_only_valid_listings_are_archived(tmp_path, expired):
+    archive = ResponseArchive(str(tmp_path))
+    parser = Parser(None, "", "", "", "", "", archive=archive)
+    body = {"error": "Your session has expired"} if expired else {"values": []}
+    parser.request = lambda *args, **kwargs: FakeResponse(body)
+    payload = set_ticket_payload("", "", "", "", period=PERIOD, subject="1")
+
+    if expired:
+        with pytest.raises(SessionExpiredError):
+            parser.fetch_ticket_data(payload)
+        assert archive.latest(LISTING, f"{PERIOD}|1") is None
+    else:
+        parser.fetch_ticket_data(payload)
+        assert json.loads(archive.latest(LISTING, f"{PERIOD}|1")) == body
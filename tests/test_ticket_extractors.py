@@ -0,0 +1,27 @@
+"""
+Every ticket page extractor must produce the dicts of the reference
+SoupExtractor on the saved ticket pages in fixtures/ticket_pages.
+"""
+from pathlib import Path
+
+import pytest
+
+from ticket_extractors import SoupExtractor, get_extractors
+
+PAGES = sorted(
+    Path(__file__).parent.joinpath("fixtures", "ticket_pages").glob("*.html")
+)
+
+
+def test_fixture_pages_exist():
+    assert PAGES
+
+
+@pytest.mark.parametrize("page", PAGES, ids=lambda path: path.stem)
+@pytest.mark.parametrize("name", sorted(get_extractors()))
+def test_extractor_matches_reference(name: str, page: Path):
+    # read as bytes so that the \r\n line breaks of a page are kept
+    html_doc = page.read_bytes().decode("utf8")
+    extractor = get_extractors()[name]()
+
+    assert extractor.extract(html_doc) == SoupExtractor().extract(html_doc)
@@ -0,0 +1,57 @@
+"""
+The state index of incremental refreshes must only record tickets whose
+records and transitions were written.
+"""
+import json
+from parser import Parser
+
+import pytest
+
+from ticket_index import TicketStateIndex, refresh_period
+
+PERIOD = "Суббота, 01 Октябрь, 2022"
+SUBJECTS = {"1": "Водоснабжение", "2": "Отопление"}
+
+
+def make_parser(fail_subject: str = None) -> Parser:
+    parser = Parser(None, "", "", "", "", "")
+    parser.fetch_subject_tickets = lambda period, subject: [
+        {"number": f"{subject}-{i}"} for i in range(3)
+    ]
+
+    def amend(tickets, category):
+        for ticket in tickets:
+            if ticket["number"].startswith(f"{fail_subject}-"):
+                raise ConnectionError
+            yield {
+                **ticket,
+                **category,
+                "status": "Заявка закрыта",
+                "status_date": "Выполнено 07.10.2022",
+                "request_moddate": "07.10.2022 13:25",
+            }
+
+    parser.iter_amended_tickets = amend
+    return parser
+
+
+def test_interrupted_refresh_is_fetched_again(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    index = TicketStateIndex(str(tmp_path / "index.sqlite3"))
+    changelog = tmp_path / "changelog.ndjson"
+
+    with pytest.raises(ConnectionError):
+        refresh_period(make_parser("2"), PERIOD, SUBJECTS, index, str(changelog))
+
+    # the first subject was amended, but its delta file was never completed
+    assert not (tmp_path / "data" / "2022_october.delta.ndjson").exists()
+    assert index.needs_refresh("1-0")
+
+    refresh_period(make_parser(), PERIOD, SUBJECTS, index, str(changelog))
+
+    delta = (tmp_path / "data" / "2022_october.delta.ndjson").read_text("utf8")
+    assert len(delta.splitlines()) == 6
+    assert not any(index.needs_refresh(f"{s}-{i}") for s in SUBJECTS for i in range(3))
+    numbers = {json.loads(line)["number"] for line in changelog.open(encoding="utf8")}
+    assert numbers == {f"{s}-{i}" for s in SUBJECTS for i in range(3)}
@@ -0,0 +1,15 @@
+"""
+transform_record must fill the "adress" column the way transform_df does.
+"""
+from ticket_transform import transform_record
+
+
+def test_address_is_read_from_the_parser_key():
+    assert transform_record({"address": "ул. Ленина, 1"})["adress"] == "ул. Ленина, 1"
+
+
+def test_null_address_falls_back_to_the_old_key():
+    record = {"address": None, "adress": "ул. Ленина, 1"}
+
+    assert transform_record(record)["adress"] == "ул. Ленина, 1"
+    assert transform_record({})["adress"] is None
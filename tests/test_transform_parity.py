@@ -0,0 +1,162 @@
+"""
+The local transform engine must produce the rows of the Spark job and of
+transform_record, and write the partitions transform_months would.
+"""
+import json
+import os
+import time
+
+import pyarrow.parquet as pq
+import pytest
+
+import local_transform
+from local_transform import records_to_table, transform, transform_table
+from ticket_transform import transform_record
+
+STATUS_DATES = [
+    "Выполнено 07.10.2022",
+    "Просрочено 01.10.2022",
+    "до 12.10.2022",
+    "Исполнить до 12.10.2022",
+    "до 32.10.2022",
+    "до",
+    "",
+    None,
+]
+RATINGS = ["5", " 4 ", "3.0", "x", "", None, "99999999999", 5]
+DATES = ["06.10.2022 07:07", "6.10.2022 7:07", "31.02.2022 10:00", "", None]
+ADDRESSES = [
+    {"address": "Минск, улица Кедышко, 1"},
+    {"address": None, "adress": "Минск, улица Кедышко, 2"},
+    {"adress": "Минск, улица Кедышко, 3"},
+    {"address": "", "adress": "Минск, улица Кедышко, 4"},
+    {},
+]
+CATEGORIES = ["Водоснабжение", "Отопление/Газ", None]
+
+
+def make_records(count: int = 120) -> list:
+    return [
+        {
+            "number": f"{i}.10.061022",
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "malfunction_type": "Не вывезен мусор",
+            "performer": f"ЖЭС №{i % 40}",
+            "district": "Первомайский район",
+            "status": "Заявка закрыта",
+            "status_date": STATUS_DATES[i % len(STATUS_DATES)],
+            "rating": RATINGS[i % len(RATINGS)],
+            "request_regdate": DATES[i % len(DATES)],
+            "request_moddate": DATES[(i + 1) % len(DATES)],
+            "user_comment": "Комментарий",
+            "organization_comment": None,
+            **ADDRESSES[i % len(ADDRESSES)],
+        }
+        for i in range(count)
+    ]
+
+
+def write_month(path, records: list) -> None:
+    path.write_text(
+        "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records),
+        encoding="utf8",
+    )
+
+
+def test_local_matches_transform_record():
+    records = make_records()
+
+    rows = transform_table(records_to_table(records)).to_pylist()
+
+    assert rows == [transform_record(record) for record in records]
+
+
+@pytest.fixture
+def utc_clock():
+    # collect() converts timestamps to the local time of Python, the job
+    # and the local engine both work in UTC
+    tz = os.environ.get("TZ")
+    os.environ["TZ"] = "UTC"
+    time.tzset()
+    yield
+    if tz is None:
+        del os.environ["TZ"]
+    else:
+        os.environ["TZ"] = tz
+    time.tzset()
+
+
+def test_local_matches_spark(tmp_path, utc_clock):
+    pytest.importorskip("pyspark")
+    from pyspark.sql import SparkSession
+
+    from data_processing_spark import SESSION_CONF, schema, transform_df
+
+    records = make_records()
+    write_month(tmp_path / "2022_october.ndjson", records)
+    builder = SparkSession.builder.master("local[1]")
+    for key, value in SESSION_CONF.items():
+        builder = builder.config(key, value)
+    spark = builder.getOrCreate()
+    # read like transform_spark, from the file the parser would write
+    df = (
+        spark.read.schema(schema)
+        .format("json")
+        .load(str(tmp_path / "2022_october.ndjson"))
+    )
+    rows = [row.asDict() for row in transform_df(df).collect()]
+
+    assert rows == transform_table(records_to_table(records)).to_pylist()
+
+
+def test_months_replace_only_their_partitions(tmp_path):
+    raw, dataset = tmp_path / "raw", tmp_path / "dataset"
+    raw.mkdir()
+    october, november = make_records(), make_records(7)
+    write_month(raw / "2022_october.ndjson", october)
+    write_month(raw / "2022_november.ndjson", november)
+
+    for files in (["2022_october"], ["2022_november"], ["2022_november"]):
+        transform(files, "ndjson", raw_root=str(raw), dataset_root=str(dataset))
+
+    year = dataset / "year=2022"
+    assert sorted(path.name for path in year.iterdir()) == ["month=10", "month=11"]
+    assert len(list((year / "month=11").iterdir())) == 1
+    table = pq.read_table(year / "month=11")
+    assert table.to_pylist() == [transform_record(record) for record in november]
+    assert (dataset / "_SUCCESS").exists()
+
+
+def test_categories_are_escaped_partitions(tmp_path):
+    raw, dataset = tmp_path / "raw", tmp_path / "dataset"
+    raw.mkdir()
+    write_month(raw / "2022_october.ndjson", make_records())
+
+    transform(
+        ["2022_october"],
+        "ndjson",
+        by_category=True,
+        raw_root=str(raw),
+        dataset_root=str(dataset),
+    )
+
+    month = dataset / "year=2022" / "month=10"
+    assert sorted(path.name for path in month.iterdir()) == [
+        "category=__HIVE_DEFAULT_PARTITION__",
+        "category=Водоснабжение",
+        "category=Отопление%2FГаз",
+    ]
+    table = pq.read_table(month / "category=Отопление%2FГаз")
+    assert "category" not in table.column_names
+    assert table.num_rows == 40
+
+
+def test_large_months_are_sent_to_spark(tmp_path, monkeypatch):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    write_month(raw / "2022_october.ndjson", make_records())
+    monkeypatch.setattr(local_transform, "LOCAL_TRANSFORM_MAX_BYTES", 10)
+
+    assert local_transform.choose_engine("2022_october", "ndjson", str(raw)) == "spark"
+    with pytest.raises(FileNotFoundError):
+        local_transform.choose_engine("2022_november", "ndjson", str(raw))
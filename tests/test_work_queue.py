@@ -0,0 +1,172 @@
+"""
+An item of the work queue must be re-delivered once its lease expires, the
+work of an expired lease must never be written, and items must fail after
+their attempts. The queue must only be served to clients with the shared
+token, and answer every failed call with an error status; workers must wait
+until the coordinator has queued its listings.
+"""
+import threading
+import time
+
+import pytest
+import requests
+
+from work_queue import (
+    HttpWorkQueue,
+    SqliteWorkQueue,
+    details_items,
+    listing_items,
+    run_worker,
+    serve_queue,
+)
+
+PERIOD = "Суббота, 01 Октябрь, 2022"
+SUBJECTS = {"1": "Водоснабжение"}
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = SqliteWorkQueue(str(tmp_path / "work_queue.sqlite3"))
+    yield queue
+    queue.close()
+
+
+# leases that expire before the next call of a test
+SHORT_LEASE = 0.01
+
+
+def expire() -> None:
+    time.sleep(SHORT_LEASE * 5)
+
+
+@pytest.fixture
+def served(queue):
+    server = serve_queue(queue, 0, host="127.0.0.1", token="secret")
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+
+
+def test_expired_lease_is_delivered_again(queue):
+    queue.put(listing_items(PERIOD, SUBJECTS))
+    first = queue.lease("w1", SHORT_LEASE)
+
+    assert queue.lease("w2", 60) is None
+    expire()
+    second = queue.lease("w2", 60)
+
+    assert second["id"] == first["id"]
+    assert second["token"] != first["token"]
+    assert not queue.extend(first, 60)
+    assert queue.extend(second, 60)
+
+
+def test_stale_complete_is_rejected(queue):
+    queue.put(listing_items(PERIOD, SUBJECTS))
+    first = queue.lease("w1", SHORT_LEASE)
+    expire()
+    second = queue.lease("w2", 60)
+    tickets = [{"number": "1-0"}]
+
+    # the first worker finishes late: neither its result nor its children
+    # are written, even before the second worker completes
+    assert not queue.complete(
+        first, [{"worker": "w1"}], details_items(first, tickets, 1)
+    )
+    assert queue.counts() == {"leased": 1}
+    assert queue.complete(second, [{"worker": "w2"}])
+    assert not queue.complete(first, [{"worker": "w1"}])
+    assert not queue.complete(second, [{"worker": "w2"}])
+
+    assert list(queue.results(PERIOD, "1")) == [[{"worker": "w2"}]]
+    assert queue.counts() == {"done": 1}
+
+
+def test_released_item_is_delivered_at_once(queue):
+    queue.put(listing_items(PERIOD, SUBJECTS))
+    first = queue.lease("w1", 60)
+
+    queue.release(first)
+    second = queue.lease("w2", 60)
+
+    assert second["id"] == first["id"]
+    assert not queue.complete(first, [])
+    assert queue.complete(second, [])
+
+
+def test_item_fails_after_max_attempts_until_retried(tmp_path):
+    queue = SqliteWorkQueue(str(tmp_path / "work_queue.sqlite3"), max_attempts=2)
+    queue.put(listing_items(PERIOD, SUBJECTS))
+    for _ in range(2):
+        assert queue.lease("w", SHORT_LEASE) is not None
+        expire()
+
+    assert queue.lease("w", 60) is None
+    assert queue.counts() == {"failed": 1}
+
+    assert queue.retry_failed() == 1
+    assert queue.counts() == {"pending": 1}
+    lease = queue.lease("w", 60)
+    assert queue.complete(lease, [{"number": "1-0"}])
+    assert queue.retry_failed() == 0
+    assert list(queue.results(PERIOD, "1")) == [[{"number": "1-0"}]]
+    queue.close()
+
+
+def test_calls_require_the_token(served):
+    assert HttpWorkQueue(served, token="secret").put(
+        listing_items(PERIOD, SUBJECTS)
+    ) == len(SUBJECTS)
+
+    with pytest.raises(requests.HTTPError) as error:
+        HttpWorkQueue(served, retries=0, token="wrong").counts()
+    assert error.value.response.status_code == 401
+
+
+@pytest.mark.parametrize(
+    "method, body, status",
+    [
+        ("counts", b"{not json", 400),
+        ("counts", b'{"args": []}', 400),
+        ("lease", b'{"args": {"name": "w"}}', 400),
+        ("complete", b'{"args": {"lease": {}}}', 500),
+    ],
+)
+def test_failed_calls_get_an_error_status(served, method, body, status):
+    r = requests.post(
+        served + method, data=body, headers={"Authorization": "Bearer secret"}
+    )
+
+    assert r.status_code == status
+
+
+def test_remote_interface_requires_a_token(queue):
+    with pytest.raises(ValueError):
+        serve_queue(queue, 0, host="0.0.0.0", token=None)
+
+
+class FakeParser:
+    def fetch_subject_tickets(self, period: str, subject: str) -> list:
+        return [{"number": f"{subject}-{i}"} for i in range(3)]
+
+    def iter_amended_tickets(self, tickets: list, category: dict):
+        return ({**ticket, **category} for ticket in tickets)
+
+
+def test_early_worker_waits_for_the_seal(queue, served):
+    completed = []
+    client = HttpWorkQueue(served, token="secret")
+    worker = threading.Thread(
+        target=lambda: completed.append(
+            run_worker(client, FakeParser(), "w", lease_seconds=60, poll_interval=0.01)
+        )
+    )
+    worker.start()
+    time.sleep(0.2)
+    assert worker.is_alive()
+
+    queue.put(listing_items(PERIOD, SUBJECTS))
+    queue.seal()
+    worker.join(10)
+
+    assert completed == [2]
+    assert [len(records) for records in queue.results(PERIOD, "1")] == [3]
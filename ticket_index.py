@@ -0,0 +1,189 @@
+import json
+import os
+import sqlite3
+from datetime import datetime
+from parser import Parser
+from typing import Dict, Optional
+
+from tqdm import tqdm
+
+from logs.set_logger import logger
+from output_writers import NdjsonWriter
+from parser_config import CLOSED_STATUS
+from parser_session import ParserSession
+
+
+class TicketStateIndex:
+    def __init__(self, path: str) -> None:
+        """
+        Initializes a persistent index of the last seen state of each ticket.
+
+        Args:
+            path (str): Path of the SQLite database.
+        """
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        # rows staged by stage() until commit(), by ticket number
+        self._staged: Dict[str, tuple] = {}
+        with self._connection:
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tickets (
+                    number TEXT PRIMARY KEY,
+                    period TEXT NOT NULL,
+                    status TEXT,
+                    status_date TEXT,
+                    request_moddate TEXT,
+                    last_seen TEXT NOT NULL
+                )
+                """
+            )
+
+    def get(self, number: str) -> Optional[dict]:
+        row = self._connection.execute(
+            "SELECT status, status_date, request_moddate FROM tickets "
+            "WHERE number = ?",
+            (number,),
+        ).fetchone()
+        if row is None:
+            return None
+        return {"status": row[0], "status_date": row[1], "request_moddate": row[2]}
+
+    def needs_refresh(self, number: str) -> bool:
+        """
+        Tells whether a listed ticket has to be fetched again.
+
+        Args:
+            number (str): The ticket number.
+
+        Returns:
+            bool: True for tickets not seen before and tickets not yet closed.
+        """
+        state = self.get(number)
+        return state is None or state["status"] != CLOSED_STATUS
+
+    def stage(self, record: dict, period: str, seen_at: str) -> Optional[dict]:
+        """
+        Stages the state of an amended ticket and reports a status transition.
+
+        The state is only stored by commit(), so that it can wait until the
+        records and transitions of the refresh are on disk.
+
+        Args:
+            record (dict): The amended ticket.
+            period (str): The period the ticket was listed in.
+            seen_at (str): ISO timestamp of the refresh.
+
+        Returns:
+            Optional[dict]: A change log entry if the ticket is new or its
+            status, status date or modification date changed, otherwise None.
+        """
+        number = record["number"]
+        staged = self._staged.get(number)
+        if staged is not None:
+            previous = {
+                "status": staged[2],
+                "status_date": staged[3],
+                "request_moddate": staged[4],
+            }
+        else:
+            previous = self.get(number) or {}
+        self._staged[number] = (
+            number,
+            period,
+            record["status"],
+            record["status_date"],
+            record["request_moddate"],
+            seen_at,
+        )
+
+        fields = ("status", "status_date", "request_moddate")
+        if previous and all(previous[f] == record[f] for f in fields):
+            return None
+        change = {"number": number, "period": period, "seen_at": seen_at}
+        for field in fields:
+            change[f"old_{field}"] = previous.get(field)
+            change[f"new_{field}"] = record[field]
+        return change
+
+    def commit(self) -> None:
+        """
+        Stores the staged states in one transaction.
+        """
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO tickets "
+                "(number, period, status, status_date, request_moddate, last_seen) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                self._staged.values(),
+            )
+        self._staged.clear()
+
+    def discard(self) -> None:
+        self._staged.clear()
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+def refresh_period(
+    parser: Parser,
+    period: str,
+    subjects: dict,
+    index: TicketStateIndex,
+    changelog_path: str,
+) -> None:
+    """
+    Re-fetch the tickets of a period that are new or not yet closed.
+
+    Refreshed records are written to "<YYYY_month>.delta.ndjson" and every
+    status transition is appended to the change log. The new states are
+    stored in the index in one transaction once both files are durable, so
+    an interrupted refresh fetches the same tickets again; its transitions
+    may then be logged twice, but never lost.
+
+    Args:
+        parser (Parser): The parser used for the network requests.
+        period (str): str representing the period to refresh.
+        subjects (dict): dict containing the subjects to refresh.
+        index (TicketStateIndex): The ticket state index.
+        changelog_path (str): Path of the NDJSON change log.
+    """
+    seen_at = datetime.now().isoformat(timespec="seconds")
+    filename = ParserSession.generate_filename(period=period, extension="delta.ndjson")
+    try:
+        with NdjsonWriter(f"./data/{filename}") as writer, open(
+            changelog_path, "a", encoding="utf8"
+        ) as changelog:
+            for subject in subjects:
+                tickets = parser.fetch_subject_tickets(period, subject)
+                stale = [t for t in tickets if index.needs_refresh(t["number"])]
+                logger.info(
+                    f"Subject {subject}: refreshing {len(stale)} of "
+                    f"{len(tickets)} tickets"
+                )
+                category = {"category": subjects[subject]}
+                for record in parser.iter_amended_tickets(stale, category):
+                    writer.write(record)
+                    change = index.stage(record, period, seen_at)
+                    if change is not None:
+                        changelog.write(json.dumps(change, ensure_ascii=False) + "\n")
+            changelog.flush()
+            os.fsync(changelog.fileno())
+    except BaseException:
+        index.discard()
+        raise
+    # the delta file is complete under its final name and the transitions
+    # are on disk: only now may the tickets be skipped by the next refresh
+    index.commit()
+
+
+def refresh(
+    parser: Parser,
+    periods: list,
+    subjects: dict,
+    index: TicketStateIndex,
+    changelog_path: str,
+) -> None:
+    for period in tqdm(periods):
+        refresh_period(parser, period, subjects, index, changelog_path)
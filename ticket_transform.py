@@ -0,0 +1,138 @@
+import re
+from datetime import date, datetime
+from typing import Optional
+
+# columns of the processed_parquet layout, in the order of transform_spark
+PROCESSED_COLUMNS = (
+    "number",
+    "category",
+    "malfunction_type",
+    "performer",
+    "adress",
+    "district",
+    "stage",
+    "status",
+    "current_deadline",
+    "rating",
+    "request_regdate",
+    "request_moddate",
+    "user_comment",
+    "organization_comment",
+)
+
+TIMESTAMP_PATTERN = re.compile(r"\d{2}\.\d{2}\.\d{4} \d{2}:\d{2}")
+DATE_PATTERN = re.compile(r"\d{2}\.\d{2}\.\d{4}")
+INT_PATTERN = re.compile(r"([+-]?\d+)(\.\d*)?")
+INT32_MIN, INT32_MAX = -(2**31), 2**31 - 1
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """
+    Parses a "dd.MM.yyyy HH:mm" string like Spark's to_timestamp.
+
+    Returns:
+        Optional[datetime]: The timestamp, None if the value does not match.
+    """
+    if value is None or not TIMESTAMP_PATTERN.fullmatch(value):
+        return None
+    try:
+        return datetime.strptime(value, "%d.%m.%Y %H:%M")
+    except ValueError:
+        return None
+
+
+def parse_date(value: Optional[str]) -> Optional[date]:
+    """
+    Parses a "dd.MM.yyyy" string like Spark's to_date.
+
+    Returns:
+        Optional[date]: The date, None if the value does not match.
+    """
+    if value is None or not DATE_PATTERN.fullmatch(value):
+        return None
+    try:
+        return datetime.strptime(value, "%d.%m.%Y").date()
+    except ValueError:
+        return None
+
+
+def cast_int(value) -> Optional[int]:
+    """
+    Casts a string to a 32-bit integer like Spark's cast("int").
+
+    Surrounding whitespace is ignored and a fractional part is truncated;
+    anything else, or a value out of range, gives None.
+    """
+    if value is None:
+        return None
+    match = INT_PATTERN.fullmatch(str(value).strip())
+    if match is None:
+        return None
+    number = int(match.group(1))
+    return number if INT32_MIN <= number <= INT32_MAX else None
+
+
+def derive_status(status_date: Optional[str]) -> Optional[str]:
+    if status_date is None:
+        return None
+    if "Выполнено" in status_date:
+        return "Выполнено"
+    if "Просрочено" in status_date:
+        return "Просрочено"
+    if "до " in status_date:
+        return "В процессе выполнения"
+    return None
+
+
+def derive_deadline(status_date: Optional[str]) -> Optional[date]:
+    if status_date is None or "до " not in status_date:
+        return None
+    parts = status_date.split(" ")
+    return parse_date(parts[1]) if len(parts) > 1 else None
+
+
+def as_string(value) -> Optional[str]:
+    # the Spark job reads every field as a string
+    if value is None or isinstance(value, str):
+        return value
+    return str(value)
+
+
+def coalesce(*values):
+    # the first value that is not None, like Spark's coalesce
+    return next((value for value in values if value is not None), None)
+
+
+def transform_record(record: dict) -> dict:
+    """
+    Applies the transformations of transform_spark to one amended ticket.
+
+    The request dates become timestamps, the rating an integer, the ticket
+    status is renamed to "stage" and "status"/"current_deadline" are derived
+    from "status_date". The address is read from "address", the key written
+    by the parser, and stored under the "adress" column of the processed
+    layout.
+
+    Args:
+        record (dict): An amended ticket, as written to the month files.
+
+    Returns:
+        dict: The processed row, with the keys of PROCESSED_COLUMNS.
+    """
+    status_date = as_string(record.get("status_date"))
+    return {
+        "number": as_string(record.get("number")),
+        "category": as_string(record.get("category")),
+        "malfunction_type": as_string(record.get("malfunction_type")),
+        "performer": as_string(record.get("performer")),
+        "adress": as_string(coalesce(record.get("address"), record.get("adress"))),
+        "district": as_string(record.get("district")),
+        "stage": as_string(record.get("status")),
+        "status": derive_status(status_date),
+        "current_deadline": derive_deadline(status_date),
+        "rating": cast_int(record.get("rating")),
+        "request_regdate": parse_timestamp(as_string(record.get("request_regdate"))),
+        "request_moddate": parse_timestamp(as_string(record.get("request_moddate"))),
+        "user_comment": as_string(record.get("user_comment")),
+        "organization_comment": as_string(record.get("organization_comment")),
+    }
@@ -0,0 +1,724 @@
+"""
+Shared queue of scrape work, for spreading a backfill over several machines.
+
+A coordinator puts one "listing" item per (period, subject) in the queue.
+Workers lease items: a listing item is turned into "details" items of
+WORK_BATCH_SIZE tickets each, and a details item into the amended tickets
+of its batch, stored as its result. When every item of a period is done,
+the coordinator writes the month file from the results, in listing order.
+Once the listings are queued the coordinator seals the queue: a worker
+started earlier waits for work instead of leaving an empty queue at once.
+
+A lease expires after WORK_LEASE_SECONDS unless the worker extends it, so
+the items of a worker that died are delivered again. Completing an item
+requires the token of its current lease and stores its result or its
+follow-up items in the same transaction: an item is completed once, even
+if it was processed twice, and a result is never written twice.
+
+The queue is a SQLite database, shared directly by the processes of one
+host, or served over HTTP by the coordinator to workers on other hosts,
+which must send the shared token of the WORK_QUEUE_TOKEN variable:
+
+    export WORK_QUEUE_TOKEN=...
+    python main.py --start 2019-01 --end 2022-10 --coordinator \\
+        --queue-host 0.0.0.0 --queue-port 8116
+    python main.py --worker data/work_queue.sqlite3
+    python main.py --worker http://coordinator:8116/
+"""
+import hmac
+import ipaddress
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import requests
+
+from logs.set_logger import logger
+from output_writers import write_month
+from parser_config import (
+    REQUEST_RETRIES,
+    REQUEST_TIMEOUT,
+    WORK_BATCH_SIZE,
+    WORK_LEASE_SECONDS,
+    WORK_MAX_ATTEMPTS,
+    WORK_POLL_INTERVAL,
+    WORK_QUEUE_HOST,
+    WORK_QUEUE_PATH,
+    WORK_QUEUE_TOKEN,
+)
+from rate_control import Backoff
+
+LISTING = "listing"
+DETAILS = "details"
+
+# methods of a queue that workers call, and that the HTTP backend serves
+WORKER_METHODS = (
+    "put",
+    "lease",
+    "extend",
+    "complete",
+    "release",
+    "counts",
+    "is_sealed",
+)
+
+
+class SqliteWorkQueue:
+    def __init__(
+        self, path: str = WORK_QUEUE_PATH, max_attempts: int = WORK_MAX_ATTEMPTS
+    ) -> None:
+        """
+        Initializes a work queue stored in a SQLite database.
+
+        Several processes can share the database file; leases are taken in
+        immediate transactions, so an item is never leased twice at a time.
+
+        Args:
+            path (str): Path of the SQLite database.
+            max_attempts (int): Deliveries of an item before it is marked
+                failed.
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, timeout=60, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS items (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT NOT NULL UNIQUE,
+                kind TEXT NOT NULL,
+                period TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                token TEXT,
+                worker TEXT,
+                expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS items_state ON items (state, seq);
+            CREATE TABLE IF NOT EXISTS results (
+                id TEXT PRIMARY KEY,
+                period TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                records TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            """
+        )
+
+    def _transaction(self, work):
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(self._connection)
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+            return result
+
+    def _read(self, query: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._connection.execute(query, params).fetchall()
+
+    @staticmethod
+    def _insert(connection: sqlite3.Connection, items: Iterable[dict]) -> int:
+        # items already queued, e.g. by an earlier delivery, are kept as is
+        return connection.executemany(
+            "INSERT OR IGNORE INTO items (id, kind, period, subject, payload) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (
+                (
+                    item["id"],
+                    item["kind"],
+                    item["period"],
+                    item["subject"],
+                    json.dumps(item["payload"], ensure_ascii=False),
+                )
+                for item in items
+            ),
+        ).rowcount
+
+    def put(self, items: List[dict]) -> int:
+        """
+        Adds items to the queue; items whose id is queued already are ignored.
+
+        Args:
+            items (List[dict]): Items with "id", "kind", "period", "subject"
+                and a JSON-serializable "payload".
+
+        Returns:
+            int: Number of items added.
+        """
+        return self._transaction(lambda connection: self._insert(connection, items))
+
+    def lease(self, worker: str, seconds: float = WORK_LEASE_SECONDS) -> Optional[dict]:
+        """
+        Leases the oldest item that is pending or whose lease expired.
+
+        Args:
+            worker (str): Name of the worker, for diagnostics.
+            seconds (float): Duration of the lease.
+
+        Returns:
+            Optional[dict]: The item with the "token" of the lease, None if
+            there is no item to lease.
+        """
+
+        def work(connection: sqlite3.Connection) -> Optional[dict]:
+            now = time.time()
+            while True:
+                row = connection.execute(
+                    "SELECT id, kind, period, subject, payload, attempts "
+                    "FROM items WHERE state = 'pending' "
+                    "OR (state = 'leased' AND expires < ?) ORDER BY seq LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    return None
+                item_id, kind, period, subject, payload, attempts = row
+                if attempts >= self.max_attempts:
+                    connection.execute(
+                        "UPDATE items SET state = 'failed' WHERE id = ?", (item_id,)
+                    )
+                    logger.error(f"Work item {item_id} failed {attempts} times")
+                    continue
+                token = uuid.uuid4().hex
+                connection.execute(
+                    "UPDATE items SET state = 'leased', token = ?, worker = ?, "
+                    "expires = ?, attempts = attempts + 1 WHERE id = ?",
+                    (token, worker, now + seconds, item_id),
+                )
+                return {
+                    "id": item_id,
+                    "kind": kind,
+                    "period": period,
+                    "subject": subject,
+                    "payload": json.loads(payload),
+                    "token": token,
+                }
+
+        return self._transaction(work)
+
+    def extend(self, lease: dict, seconds: float = WORK_LEASE_SECONDS) -> bool:
+        """
+        Extends a lease that is still held.
+
+        Returns:
+            bool: False if the lease expired and the item was leased again.
+        """
+        return bool(
+            self._transaction(
+                lambda connection: connection.execute(
+                    "UPDATE items SET expires = ? "
+                    "WHERE id = ? AND token = ? AND state = 'leased'",
+                    (time.time() + seconds, lease["id"], lease["token"]),
+                ).rowcount
+            )
+        )
+
+    def complete(
+        self,
+        lease: dict,
+        records: Optional[List[dict]] = None,
+        children: List[dict] = (),
+    ) -> bool:
+        """
+        Marks a leased item done, with its result and follow-up items.
+
+        Nothing is written unless the lease is still held, so the work of a
+        worker whose lease expired is dropped rather than written twice.
+
+        Args:
+            lease (dict): The leased item.
+            records (Optional[List[dict]]): The result of the item.
+            children (List[dict]): Items to add, as in put.
+
+        Returns:
+            bool: False if the lease was no longer held.
+        """
+
+        def work(connection: sqlite3.Connection) -> bool:
+            done = connection.execute(
+                "UPDATE items SET state = 'done', expires = NULL "
+                "WHERE id = ? AND token = ? AND state = 'leased'",
+                (lease["id"], lease["token"]),
+            ).rowcount
+            if not done:
+                return False
+            if records is not None:
+                connection.execute(
+                    "INSERT OR REPLACE INTO results (id, period, subject, records) "
+                    "VALUES (?, ?, ?, ?)",
+                    (
+                        lease["id"],
+                        lease["period"],
+                        lease["subject"],
+                        json.dumps(records, ensure_ascii=False),
+                    ),
+                )
+            self._insert(connection, children)
+            return True
+
+        return self._transaction(work)
+
+    def release(self, lease: dict) -> None:
+        """
+        Gives a leased item back for immediate re-delivery, e.g. after an error.
+        """
+        self._transaction(
+            lambda connection: connection.execute(
+                "UPDATE items SET state = 'pending', token = NULL, expires = NULL "
+                "WHERE id = ? AND token = ? AND state = 'leased'",
+                (lease["id"], lease["token"]),
+            )
+        )
+
+    def counts(self, periods: Optional[List[str]] = None) -> Dict[str, int]:
+        """
+        Returns the number of items in each state, optionally of some periods.
+        """
+        query = "SELECT state, COUNT(*) FROM items"
+        params: tuple = ()
+        if periods is not None:
+            query += f" WHERE period IN ({', '.join('?' * len(periods))})"
+            params = tuple(periods)
+        return dict(self._read(query + " GROUP BY state", params))
+
+    def seal(self, sealed: bool = True) -> None:
+        """
+        Marks that every listing is queued, or that more are coming.
+
+        Args:
+            sealed (bool): False while the coordinator is queueing listings.
+        """
+        self._transaction(
+            lambda connection: connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('sealed', ?)",
+                (str(int(sealed)),),
+            )
+        )
+
+    def is_sealed(self) -> bool:
+        """
+        Returns True once the coordinator has queued every listing.
+        """
+        rows = self._read("SELECT value FROM meta WHERE key = 'sealed'")
+        return bool(rows) and rows[0][0] == "1"
+
+    def retry_failed(self) -> int:
+        """
+        Makes the failed items pending again, with a new attempt budget.
+        """
+        return self._transaction(
+            lambda connection: connection.execute(
+                "UPDATE items SET state = 'pending', token = NULL, expires = NULL, "
+                "attempts = 0 WHERE state = 'failed'"
+            ).rowcount
+        )
+
+    def results(self, period: str, subject: str) -> Iterator[List[dict]]:
+        """
+        Reads the results of the details items of a subject, in listing order.
+        """
+        ids = self._read(
+            "SELECT id FROM results WHERE period = ? AND subject = ? ORDER BY id",
+            (period, subject),
+        )
+        # one result at a time, so that a month is never loaded at once
+        for (item_id,) in ids:
+            ((records,),) = self._read(
+                "SELECT records FROM results WHERE id = ?", (item_id,)
+            )
+            yield json.loads(records)
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class HttpWorkQueue:
+    def __init__(
+        self,
+        url: str,
+        retries: int = REQUEST_RETRIES,
+        token: Optional[str] = WORK_QUEUE_TOKEN,
+    ) -> None:
+        """
+        Initializes a client of a queue served by serve_queue.
+
+        Any server answering the same requests can stand in for the
+        coordinator: every call is a POST of {"args": ...} to url + method,
+        with the token as a bearer token, answered with {"result": ...}.
+
+        Args:
+            url (str): Base URL of the queue, e.g. "http://coordinator:8116/".
+            retries (int): Retries of a call after a connection error or a
+                5xx response, with jittered exponential backoff.
+            token (Optional[str]): The shared token of the coordinator.
+        """
+        self.url = url.rstrip("/") + "/"
+        self.retries = retries
+        self.backoff = Backoff()
+        self.session = requests.Session()
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+
+    def call(self, method: str, **args):
+        for attempt in range(self.retries + 1):
+            try:
+                r = self.session.post(
+                    self.url + method, json={"args": args}, timeout=REQUEST_TIMEOUT
+                )
+                if r.status_code < 500:
+                    r.raise_for_status()
+                    return r.json()["result"]
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+            else:
+                if attempt == self.retries:
+                    r.raise_for_status()
+            time.sleep(self.backoff.delay(attempt))
+
+    def put(self, items: List[dict]) -> int:
+        return self.call("put", items=items)
+
+    def lease(self, worker: str, seconds: float = WORK_LEASE_SECONDS) -> Optional[dict]:
+        return self.call("lease", worker=worker, seconds=seconds)
+
+    def extend(self, lease: dict, seconds: float = WORK_LEASE_SECONDS) -> bool:
+        return self.call("extend", lease=lease, seconds=seconds)
+
+    def complete(
+        self,
+        lease: dict,
+        records: Optional[List[dict]] = None,
+        children: List[dict] = (),
+    ) -> bool:
+        return self.call(
+            "complete", lease=lease, records=records, children=list(children)
+        )
+
+    def release(self, lease: dict) -> None:
+        self.call("release", lease=lease)
+
+    def counts(self, periods: Optional[List[str]] = None) -> Dict[str, int]:
+        return self.call("counts", periods=periods)
+
+    def is_sealed(self) -> bool:
+        return self.call("is_sealed")
+
+    def close(self) -> None:
+        self.session.close()
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def serve_queue(
+    queue: SqliteWorkQueue,
+    port: int,
+    host: str = WORK_QUEUE_HOST,
+    token: Optional[str] = WORK_QUEUE_TOKEN,
+) -> ThreadingHTTPServer:
+    """
+    Serves the worker methods of a queue over HTTP from a daemon thread.
+
+    Requests without the token are refused with 401, malformed ones with
+    400; an error of the queue itself is logged and answered with 500, so
+    that the client retries the call.
+
+    Args:
+        queue (SqliteWorkQueue): The queue.
+        port (int): The port to listen on.
+        host (str): The interface to listen on.
+        token (Optional[str]): The bearer token clients must send.
+
+    Returns:
+        ThreadingHTTPServer: The running server.
+
+    Raises:
+        ValueError: If the queue would be served beyond this host without a
+            token.
+    """
+    if not token and not is_loopback(host):
+        raise ValueError(
+            f"Serving the work queue on {host} requires a token, "
+            "see WORK_QUEUE_TOKEN"
+        )
+    authorization = f"Bearer {token}".encode("utf8") if token else None
+
+    class QueueHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args) -> None:
+            pass
+
+        def send_json(self, status: int, content: dict) -> None:
+            body = json.dumps(content, ensure_ascii=False).encode("utf8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self) -> None:
+            method = self.path.strip("/")
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+            except ValueError:
+                self.send_error(400, "Invalid Content-Length")
+                self.close_connection = True
+                return
+            data = self.rfile.read(length)
+            if authorization is not None and not hmac.compare_digest(
+                self.headers.get("Authorization", "").encode("utf8"), authorization
+            ):
+                self.send_error(401)
+                return
+            if method not in WORKER_METHODS:
+                self.send_error(404)
+                return
+            try:
+                args = json.loads(data or b"{}").get("args", {})
+                if not isinstance(args, dict):
+                    raise TypeError("args must be an object")
+            except (ValueError, AttributeError, TypeError) as exc:
+                self.send_error(400, f"Malformed request: {exc}")
+                return
+            try:
+                result = getattr(queue, method)(**args)
+            except TypeError as exc:
+                self.send_error(400, str(exc))
+                return
+            except Exception as exc:
+                logger.exception(f"Work queue call {method} failed")
+                self.send_json(500, {"error": repr(exc)})
+                return
+            self.send_json(200, {"result": result})
+
+    server = ThreadingHTTPServer((host, port), QueueHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Serving the work queue on http://{host}:{server.server_port}/")
+    return server
+
+
+def open_queue(location: str):
+    """
+    Opens the queue at a SQLite path or at the URL of a coordinator.
+    """
+    if location.startswith(("http://", "https://")):
+        return HttpWorkQueue(location)
+    return SqliteWorkQueue(location)
+
+
+class LeaseKeeper:
+    def __init__(self, queue, lease: dict, seconds: float) -> None:
+        """
+        Extends a lease from a background thread while its item is processed.
+        """
+        self.queue = queue
+        self.lease = lease
+        self.seconds = seconds
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self) -> None:
+        while not self._stop.wait(self.seconds / 3):
+            try:
+                if not self.queue.extend(self.lease, self.seconds):
+                    logger.warning(f"Lost the lease of {self.lease['id']}")
+                    return
+            except Exception as exc:
+                logger.warning(f"Could not extend {self.lease['id']}: {exc!r}")
+
+    def __enter__(self) -> "LeaseKeeper":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def listing_items(period: str, subjects: dict) -> List[dict]:
+    return [
+        {
+            "id": f"{LISTING}|{period}|{subject}",
+            "kind": LISTING,
+            "period": period,
+            "subject": subject,
+            "payload": {"category": subjects[subject]},
+        }
+        for subject in subjects
+    ]
+
+
+def details_items(lease: dict, tickets: List[dict], batch_size: int) -> List[dict]:
+    period, subject = lease["period"], lease["subject"]
+    return [
+        {
+            # zero-padded, so that the results sort in listing order
+            "id": f"{DETAILS}|{period}|{subject}|{start:08d}",
+            "kind": DETAILS,
+            "period": period,
+            "subject": subject,
+            "payload": {
+                "category": lease["payload"]["category"],
+                "tickets": tickets[start : start + batch_size],
+            },
+        }
+        for start in range(0, len(tickets), batch_size)
+    ]
+
+
+def process(parser, lease: dict, batch_size: int = WORK_BATCH_SIZE) -> dict:
+    """
+    Does the work of one leased item.
+
+    Args:
+        parser (Parser): The parser fetching the listing or ticket pages.
+        lease (dict): The item.
+        batch_size (int): Tickets per details item.
+
+    Returns:
+        dict: The arguments of complete: the follow-up "children" of a
+        listing item or the "records" of a details item.
+    """
+    if lease["kind"] == LISTING:
+        tickets = parser.fetch_subject_tickets(lease["period"], lease["subject"])
+        logger.info(f"{lease['id']}: {len(tickets)} tickets listed")
+        return {"children": details_items(lease, tickets, batch_size)}
+    category = {"category": lease["payload"]["category"]}
+    tickets = lease["payload"]["tickets"]
+    return {"records": list(parser.iter_amended_tickets(tickets, category))}
+
+
+def run_worker(
+    queue,
+    parser,
+    worker: Optional[str] = None,
+    lease_seconds: float = WORK_LEASE_SECONDS,
+    poll_interval: float = WORK_POLL_INTERVAL,
+) -> int:
+    """
+    Processes items of the queue until it is sealed and none is pending or
+    leased; a worker started before the coordinator waits for its listings.
+
+    An item that raises is released for re-delivery, to this or another
+    worker, until it reaches the attempt limit of the queue.
+
+    Args:
+        queue: A SqliteWorkQueue or HttpWorkQueue.
+        parser (Parser): The parser doing the work.
+        worker (Optional[str]): Name of the worker, "<host>:<pid>" by default.
+        lease_seconds (float): Duration of a lease, extended while working.
+        poll_interval (float): Wait between leases when no item is pending.
+
+    Returns:
+        int: Number of items completed by this worker.
+    """
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    completed = 0
+    while True:
+        lease = queue.lease(worker, lease_seconds)
+        if lease is None:
+            # sealed is read first: the listings were queued before the seal
+            sealed = queue.is_sealed()
+            counts = queue.counts()
+            if sealed and not counts.get("pending") and not counts.get("leased"):
+                logger.info(f"Worker {worker}: no work left, {completed} items done")
+                return completed
+            time.sleep(poll_interval)
+            continue
+        try:
+            with LeaseKeeper(queue, lease, lease_seconds):
+                outcome = process(parser, lease)
+        except Exception as exc:
+            logger.warning(f"Worker {worker}: {lease['id']} failed: {exc!r}")
+            queue.release(lease)
+            continue
+        if queue.complete(lease, **outcome):
+            completed += 1
+        else:
+            logger.warning(f"Worker {worker}: {lease['id']} was leased again")
+
+
+def run_coordinator(
+    queue: SqliteWorkQueue,
+    periods: List[str],
+    subjects: dict,
+    output_format: str = "json",
+    poll_interval: float = WORK_POLL_INTERVAL,
+) -> None:
+    """
+    Queues the listings of the periods and writes every month file once all
+    of its items are done.
+
+    Items that failed in an earlier run are retried; if items of a period
+    fail again, its month file is not written.
+
+    Args:
+        queue (SqliteWorkQueue): The queue, served to remote workers if needed.
+        periods (List[str]): The periods to scrape.
+        subjects (dict): The subjects to scrape.
+        output_format (str): "json" or a streaming format, as in Parser.parse.
+        poll_interval (float): Wait between progress checks, in seconds.
+
+    Raises:
+        RuntimeError: If items failed on every delivery.
+    """
+    queue.seal(False)
+    retried = queue.retry_failed()
+    if retried:
+        logger.info(f"Retrying {retried} failed work items")
+    added = queue.put(
+        [item for period in periods for item in listing_items(period, subjects)]
+    )
+    queue.seal()
+    logger.info(f"Queued {added} listings of {len(periods)} periods")
+
+    remaining = list(periods)
+    failed = []
+    while remaining:
+        for period in list(remaining):
+            counts = queue.counts([period])
+            if counts.get("pending") or counts.get("leased"):
+                continue
+            remaining.remove(period)
+            if counts.get("failed"):
+                logger.error(f"{period}: {counts['failed']} work items failed")
+                failed.append(period)
+                continue
+            data = [
+                chain.from_iterable(queue.results(period, subject))
+                for subject in subjects
+            ]
+            write_month(data, period, output_format)
+            logger.info(f"{period}: month file written")
+        if remaining:
+            time.sleep(poll_interval)
+    if failed:
+        raise RuntimeError(f"Work items of {len(failed)} periods failed: {failed}")